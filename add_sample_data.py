@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 """Script to add sample medical facility data to the IntelliMed database"""
-from app import app
+from app import create_app, init_db
 from extensions import db
 from models import MedicalFacility
+from facility_import import import_records
 import json
 
 def add_sample_facilities():
@@ -131,10 +132,9 @@ def add_sample_facilities():
         }
     ]
     
+    app = create_app()
+    init_db(app)
     with app.app_context():
-        # Create all tables
-        db.create_all()
-        
         # Check if facilities already exist
         existing_count = MedicalFacility.query.count()
         if existing_count > 0:
@@ -142,16 +142,9 @@ def add_sample_facilities():
             return
         
         # Add sample facilities
-        for facility_data in sample_facilities:
-            facility = MedicalFacility()
-            for key, value in facility_data.items():
-                setattr(facility, key, value)
-            db.session.add(facility)
-        
-        # Commit changes
         try:
-            db.session.commit()
-            print(f"Successfully added {len(sample_facilities)} medical facilities to the database.")
+            stats = import_records(enumerate(sample_facilities, start=1))
+            print(f"Successfully added {stats['inserted']} medical facilities to the database.")
         except Exception as e:
             db.session.rollback()
             print(f"Error adding facilities: {e}")
@@ -0,0 +1,177 @@
+"""Admission control for Gemini calls.
+
+Two layers of token buckets keep a traffic spike from hitting the API all at
+once:
+
+* Per model (flash and pro): every call reserves a token before it is sent.
+  When the bucket is empty the call waits in a bounded queue until its
+  token is due. If the queue is full, or the token is due later than
+  ADMISSION_MAX_WAIT seconds, the call is rejected at once instead of
+  waiting and then failing on a quota error.
+* Per session: routes check a small bucket per client before doing any AI
+  work, so one client can't use up the shared model budget.
+
+Rejections raise AdmissionRejected carrying a retry_after hint; routes.py
+turns it into a 429 with a Retry-After header. A rate of 0 disables a bucket.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+MODEL_LIMITS = {
+    # model prefix: (requests per second, burst)
+    'gemini-2.5-flash': (_env_float("GEMINI_FLASH_RPS", 20), _env_float("GEMINI_FLASH_BURST", 40)),
+    'gemini-2.5-pro': (_env_float("GEMINI_PRO_RPS", 5), _env_float("GEMINI_PRO_BURST", 10)),
+}
+SESSION_RPS = _env_float("SESSION_LLM_RPS", 0.5)
+SESSION_BURST = _env_float("SESSION_LLM_BURST", 5)
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", 200))
+ADMISSION_MAX_WAIT = _env_float("ADMISSION_MAX_WAIT", 10)
+MAX_TRACKED_SESSIONS = 10000
+
+
+class AdmissionRejected(Exception):
+    """A model call was refused; retry after ``retry_after`` seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Admission rejected ({reason}); retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """Token bucket that hands out future tokens as reservations"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def unlimited(self):
+        return self.rate <= 0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for_next(self):
+        """Seconds until a token reserved now would be available"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+    def reserve(self, max_wait):
+        """Reserve one token; returns the wait in seconds, or None if it would exceed max_wait"""
+        if self.unlimited:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+    def refund(self):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+
+class AdmissionController:
+    """Per-model and per-session token buckets with a bounded wait queue"""
+
+    def __init__(self, model_limits, session_rate, session_burst, queue_size, max_wait):
+        self.model_buckets = {prefix: TokenBucket(rate, burst) for prefix, (rate, burst) in model_limits.items()}
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.waiting = {prefix: 0 for prefix in self.model_buckets}
+        self.admitted = {prefix: 0 for prefix in self.model_buckets}
+        self.queued = {prefix: 0 for prefix in self.model_buckets}
+        self.rejected = {'queue_full': 0, 'deadline': 0, 'session': 0}
+
+    def _bucket_for(self, model):
+        for prefix, bucket in self.model_buckets.items():
+            if model.startswith(prefix):
+                return prefix, bucket
+        return None, None
+
+    def _reject(self, reason, retry_after):
+        with self._lock:
+            self.rejected[reason] += 1
+        raise AdmissionRejected(reason, retry_after)
+
+    async def admit(self, model):
+        """Wait for a model token; raises AdmissionRejected if it can't be had in time"""
+        prefix, bucket = self._bucket_for(model)
+        if bucket is None or bucket.unlimited:
+            return
+        if self.waiting[prefix] >= self.queue_size:
+            self._reject('queue_full', bucket.delay_for_next())
+        wait = bucket.reserve(self.max_wait)
+        if wait is None:
+            self._reject('deadline', bucket.delay_for_next())
+
+        with self._lock:
+            self.admitted[prefix] += 1
+        if wait <= 0:
+            return
+        with self._lock:
+            self.waiting[prefix] += 1
+            self.queued[prefix] += 1
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            bucket.refund()
+            raise
+        finally:
+            with self._lock:
+                self.waiting[prefix] -= 1
+
+    def admit_session(self, session_key):
+        """Take a token from a client's bucket or raise AdmissionRejected; never waits"""
+        if self.session_rate <= 0 or not session_key:
+            return
+        with self._lock:
+            bucket = self._sessions.get(session_key)
+            if bucket is None:
+                bucket = self._sessions[session_key] = TokenBucket(self.session_rate, self.session_burst)
+                if len(self._sessions) > MAX_TRACKED_SESSIONS:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_key)
+        if bucket.reserve(0) is None:
+            self._reject('session', bucket.delay_for_next())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': dict(self.waiting),
+                'queue_size': self.queue_size,
+                'max_wait_seconds': self.max_wait,
+                'admitted': dict(self.admitted),
+                'queued': dict(self.queued),
+                'rejected': dict(self.rejected),
+                'tracked_sessions': len(self._sessions),
+            }
+
+
+admission = AdmissionController(MODEL_LIMITS, SESSION_RPS, SESSION_BURST, ADMISSION_QUEUE_SIZE, ADMISSION_MAX_WAIT)
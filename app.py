@@ -1,5 +1,6 @@
 import os
 import logging
+import weakref
 from flask import Flask
 from werkzeug.middleware.proxy_fix import ProxyFix
 from extensions import db   # import db here
@@ -7,26 +8,131 @@ from extensions import db   # import db here
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 
-# Create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///intellimed.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+def configure(app):
+    """Load configuration from the environment"""
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
 
-db.init_app(app)
+    # Configure the database
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///intellimed.db")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+        # Request threads release their connection while awaiting Gemini, so a
+        # modest pool serves many concurrent LLM-bound requests (gunicorn.conf.py)
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 20)),
+    }
 
-with app.app_context():
-    # Import models AFTER db is initialized
-    import models
-    db.create_all()
-    import routes
+    # Batch chat message inserts on a background thread (chat_writer.py); leave off
+    # where a message must be readable as soon as /api/chat returns
+    app.config["CHAT_WRITE_BEHIND"] = os.environ.get("CHAT_WRITE_BEHIND", "0") == "1"
+    app.config["CHAT_WRITE_BATCH_SIZE"] = int(os.environ.get("CHAT_WRITE_BATCH_SIZE", 200))
+    app.config["CHAT_WRITE_FLUSH_INTERVAL"] = float(os.environ.get("CHAT_WRITE_FLUSH_INTERVAL", 0.5))
+    app.config["CHAT_WRITE_QUEUE_SIZE"] = int(os.environ.get("CHAT_WRITE_QUEUE_SIZE", 10000))
+    app.config["CHAT_WRITE_RETRY_SECONDS"] = float(os.environ.get("CHAT_WRITE_RETRY_SECONDS", 30))
+
+    # Chat history sent with each prompt (chat_memory.py); 0 disables memory
+    app.config["CHAT_MEMORY_TOKEN_BUDGET"] = int(os.environ.get("CHAT_MEMORY_TOKEN_BUDGET", 1500))
+    app.config["CHAT_MEMORY_SUMMARY_TOKENS"] = int(os.environ.get("CHAT_MEMORY_SUMMARY_TOKENS", 300))
+
+    # Queue /api/predict-disease and /api/generate-health-goals as jobs for
+    # job_worker.py instead of answering inline (jobs.py)
+    app.config["AI_JOBS"] = os.environ.get("AI_JOBS", "0") == "1"
+    app.config["JOB_MAX_WAIT"] = float(os.environ.get("JOB_MAX_WAIT", 30))
+    app.config["JOB_POLL_INTERVAL"] = float(os.environ.get("JOB_POLL_INTERVAL", 0.25))
+
+    # Share /metrics across gunicorn workers through snapshot files (metrics.py)
+    app.config["METRICS_DIR"] = os.environ.get("METRICS_DIR")
+    app.config["METRICS_FLUSH_INTERVAL"] = float(os.environ.get("METRICS_FLUSH_INTERVAL", 10))
+
+    # Slow-query log, N+1 detector and slow-request cProfile dumps (profiling.py);
+    # development and load testing only
+    app.config["PROFILING"] = os.environ.get("PROFILING", "0") == "1"
+    app.config["PROFILE_SLOW_QUERY_MS"] = float(os.environ.get("PROFILE_SLOW_QUERY_MS", 100))
+    app.config["PROFILE_N_PLUS_ONE"] = int(os.environ.get("PROFILE_N_PLUS_ONE", 5))
+    app.config["PROFILE_LATENCY_BUDGET_MS"] = float(os.environ.get("PROFILE_LATENCY_BUDGET_MS", 500))
+    app.config["PROFILE_DIR"] = os.environ.get("PROFILE_DIR")
+
+    # Serve nearby-facility searches from an in-memory NumPy snapshot (facility_snapshot.py)
+    app.config["FACILITY_SNAPSHOT"] = os.environ.get("FACILITY_SNAPSHOT", "0") == "1"
+
+    # Tile-quantized nearby-search result cache (facility_cache.py) and the
+    # browser cache lifetime of search responses
+    app.config["FACILITY_CACHE"] = os.environ.get("FACILITY_CACHE", "1") == "1"
+    app.config["FACILITY_CACHE_MAX_AGE"] = int(os.environ.get("FACILITY_CACHE_MAX_AGE", 300))
+
+    # Most individual facilities /api/facility-clusters returns at high zoom
+    # before it falls back to clusters (facility_clusters.py)
+    app.config["FACILITY_CLUSTER_MAX_POINTS"] = int(os.environ.get("FACILITY_CLUSTER_MAX_POINTS", 500))
+
+
+# Apps built in this process; one fork handler serves them all
+_apps = weakref.WeakSet()
+
+
+def _dispose_engines_after_fork():
+    # Connections pooled before a fork (e.g. gunicorn --preload) must not be
+    # shared with the child; it opens its own on first use
+    for app in list(_apps):
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_dispose_engines_after_fork)
+
+
+def create_app(config=None):
+    """Build the Flask application.
+
+    Touches neither the database nor Gemini: the schema is created by
+    init_db() and the Gemini client on the first model call in each process.
+    """
+    app = Flask(__name__)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+    configure(app)
+    if config:
+        app.config.update(config)
+
+    db.init_app(app)
+    _apps.add(app)
+
+    with app.app_context():
+        # Import models AFTER db is initialized
+        import models
+        from chat_writer import chat_writer
+        chat_writer.init_app(app)
+        from chat_memory import conversation_memory
+        conversation_memory.init_app(app)
+        import metrics
+        metrics.init_app(app, db)
+        import profiling
+        profiling.init_app(app, db)
+
+    from routes import bp
+    app.register_blueprint(bp)
+
+    @app.cli.command("init-db")
+    def init_db_command():
+        """Create missing tables and apply pending migrations."""
+        init_db(app)
+        print("Database is up to date")
+
+    return app
+
+
+def init_db(app):
+    """Create missing tables and apply pending migrations (migrations.py)"""
+    from migrations import apply_migrations
+    with app.app_context():
+        db.create_all()
+        apply_migrations(db.engine)
+        # Don't hand pooled connections to processes forked after this
+        db.engine.dispose()
 
 
 if __name__ == "__main__":
+    app = create_app()
+    init_db(app)
     app.run(host="0.0.0.0", port=5000, debug=True)
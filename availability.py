@@ -0,0 +1,128 @@
+"""Appointment slot availability and conflict-free booking.
+
+Each facility has opening hours per weekday, a slot length and a capacity
+(FacilitySchedule rows, or DEFAULT_HOURS when it has none). Telemedicine
+appointments without a facility share one pool, TELEMEDICINE_POOL, that
+uses the same hours and has TELEMEDICINE_CAPACITY.
+
+Booked counts live in AppointmentSlot, one row per (facility, slot start).
+Availability is one primary-key range read of those rows, never a scan of
+Appointment. A booking reserves its slot with a single conditional upsert
+that only increments ``booked`` while it is below capacity, then writes
+the Appointment in the same transaction. Two requests racing for the last
+place cannot both succeed: the database serializes the upsert on the slot
+row, and the loser sees zero rows changed. No read-then-write window exists.
+"""
+import os
+from datetime import datetime, time, timedelta
+from sqlalchemy import bindparam, text
+from extensions import db
+from models import Appointment, AppointmentSlot, FacilitySchedule, MedicalFacility
+
+SLOT_MINUTES = int(os.environ.get("APPOINTMENT_SLOT_MINUTES", 30))
+DEFAULT_CAPACITY = int(os.environ.get("APPOINTMENT_SLOT_CAPACITY", 1))
+TELEMEDICINE_CAPACITY = int(os.environ.get("TELEMEDICINE_SLOT_CAPACITY", 5))
+TELEMEDICINE_POOL = 0
+MAX_DAYS = 14
+
+# weekday (0 = Monday): (opens, closes) in minutes after midnight
+DEFAULT_HOURS = {weekday: (9 * 60, 17 * 60) for weekday in range(5)}
+DEFAULT_HOURS[5] = (9 * 60, 13 * 60)
+
+_RESERVE = text(
+    "INSERT INTO appointment_slot (facility_id, slot_start, booked) VALUES (:facility_id, :slot_start, 1) "
+    "ON CONFLICT (facility_id, slot_start) DO UPDATE SET booked = appointment_slot.booked + 1 "
+    "WHERE appointment_slot.booked < :capacity"
+).bindparams(bindparam('slot_start', type_=db.DateTime))  # stored in the same format as ORM writes
+
+
+class InvalidSlot(ValueError):
+    """The requested time is not a bookable slot"""
+
+
+class SlotFull(Exception):
+    """Every place in the slot is taken"""
+
+
+def pool_for(facility_id):
+    return facility_id or TELEMEDICINE_POOL
+
+
+def schedule_for(facility_id):
+    """Return {weekday: (opens_minute, closes_minute, slot_minutes, capacity)} for a facility or the pool"""
+    pool = pool_for(facility_id)
+    if pool != TELEMEDICINE_POOL:
+        rows = FacilitySchedule.query.filter_by(facility_id=pool).all()
+        if rows:
+            return {row.weekday: (row.opens_minute, row.closes_minute, row.slot_minutes, row.capacity)
+                    for row in rows}
+    capacity = TELEMEDICINE_CAPACITY if pool == TELEMEDICINE_POOL else DEFAULT_CAPACITY
+    return {weekday: (opens, closes, SLOT_MINUTES, capacity) for weekday, (opens, closes) in DEFAULT_HOURS.items()}
+
+
+def _slots_on(schedule, day):
+    """[(slot_start, capacity)] for one day"""
+    hours = schedule.get(day.weekday())
+    if not hours:
+        return []
+    opens, closes, slot_minutes, capacity = hours
+    midnight = datetime.combine(day, time())
+    return [(midnight + timedelta(minutes=minute), capacity)
+            for minute in range(opens, closes - slot_minutes + 1, slot_minutes)]
+
+
+def availability(facility_id, start_day, days=1, now=None):
+    """Free places per slot from start_day for up to MAX_DAYS days; past slots are left out"""
+    now = now or datetime.now()
+    days = max(1, min(days, MAX_DAYS))
+    pool = pool_for(facility_id)
+    schedule = schedule_for(facility_id)
+    start = datetime.combine(start_day, time())
+    end = start + timedelta(days=days)
+    booked = dict(db.session.query(AppointmentSlot.slot_start, AppointmentSlot.booked).filter(
+        AppointmentSlot.facility_id == pool,
+        AppointmentSlot.slot_start >= start,
+        AppointmentSlot.slot_start < end,
+    ).all())
+
+    result = []
+    for offset in range(days):
+        day = start_day + timedelta(days=offset)
+        slots = [{
+            'time': slot_start.strftime('%H:%M'),
+            'capacity': capacity,
+            'available': max(capacity - booked.get(slot_start, 0), 0),
+        } for slot_start, capacity in _slots_on(schedule, day) if slot_start > now]
+        result.append({'date': day.isoformat(), 'slots': slots})
+    return result
+
+
+def book_appointment(user_id, facility_id, appointment_type, when, notes='', now=None):
+    """Reserve a place in the slot starting at ``when`` and create the Appointment
+
+    Raises InvalidSlot when ``when`` is not a future slot of the schedule and
+    SlotFull when the slot has no place left.
+    """
+    now = now or datetime.now()
+    if facility_id and db.session.get(MedicalFacility, facility_id) is None:
+        raise InvalidSlot(f"Unknown facility {facility_id}")
+    capacity = dict(_slots_on(schedule_for(facility_id), when.date())).get(when)
+    if capacity is None or when <= now:
+        raise InvalidSlot(f"{when:%Y-%m-%d %H:%M} is not an open appointment slot")
+
+    try:
+        reserved = db.session.execute(_RESERVE, {
+            'facility_id': pool_for(facility_id), 'slot_start': when, 'capacity': capacity
+        }).rowcount
+        if not reserved:
+            raise SlotFull(f"{when:%Y-%m-%d %H:%M} is fully booked")
+        appointment = Appointment(
+            user_id=user_id, facility_id=facility_id or None, appointment_type=appointment_type,
+            appointment_date=when, notes=notes,
+        )
+        db.session.add(appointment)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return appointment
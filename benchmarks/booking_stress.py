@@ -0,0 +1,159 @@
+"""Concurrent booking stress test: no slot may ever be booked past capacity.
+
+Worker processes hammer POST /api/book-appointment for a handful of slots
+at one facility and the telemedicine pool, all against one database:
+
+    python -m benchmarks.booking_stress --processes 8 --attempts 200 --slots 4 --capacity 3
+
+When they finish, every slot is checked: its Appointment count must not
+exceed capacity and must equal the reserved count in appointment_slot. Each
+booking attempt must also end as a 200 (booked) or a 409 (full). The exit
+status is 1 if any check fails. Runs on a throwaway SQLite database unless
+--database-url points elsewhere (e.g. a scratch PostgreSQL database).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+
+def _next_weekday_slots(count):
+    """The first ``count`` 30-minute slots of next Monday's default hours"""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    monday = today + timedelta(days=7 - today.weekday())
+    return [monday + timedelta(hours=9, minutes=30 * index) for index in range(count)]
+
+
+def _create_app():
+    from app import create_app
+    app = create_app()
+    import logging
+    logging.getLogger().setLevel('WARNING')
+    return app
+
+
+def worker(index, facility_id, slots, attempts, start_at, results):
+    app = _create_app()
+    client = app.test_client()
+    rng = random.Random(index)
+    statuses = Counter()
+    # Start together so the attempts really overlap
+    time.sleep(max(0.0, start_at - time.time()))
+    for _ in range(attempts):
+        body = {
+            'facility_id': rng.choice([facility_id, None]),
+            'appointment_type': 'telemedicine',
+            'appointment_date': rng.choice(slots),
+        }
+        statuses[client.post('/api/book-appointment', json=body).status_code] += 1
+    results.put(dict(statuses))
+
+
+def check(app, facility_id, slots, capacities):
+    """Return a list of (pool, slot, appointments, reserved, capacity, ok) rows"""
+    from sqlalchemy import func
+    from extensions import db
+    from models import Appointment, AppointmentSlot
+
+    rows = []
+    with app.app_context():
+        for pool, capacity in capacities.items():
+            for slot in slots:
+                when = datetime.strptime(slot, '%Y-%m-%d %H:%M')
+                query = db.session.query(func.count(Appointment.id)).filter(Appointment.appointment_date == when)
+                if pool:
+                    query = query.filter(Appointment.facility_id == pool)
+                else:
+                    query = query.filter(Appointment.facility_id.is_(None))
+                appointments = query.scalar()
+                reserved = db.session.query(AppointmentSlot.booked).filter_by(
+                    facility_id=pool, slot_start=when).scalar() or 0
+                ok = appointments == reserved and appointments <= capacity
+                rows.append((pool, slot, appointments, reserved, capacity, ok))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--attempts', type=int, default=200, help='booking attempts per process')
+    parser.add_argument('--slots', type=int, default=4, help='distinct slots competed for')
+    parser.add_argument('--capacity', type=int, default=3, help='places per facility slot')
+    parser.add_argument('--telemedicine-capacity', type=int, default=5)
+    parser.add_argument('--database-url', help='database to use instead of a scratch SQLite file')
+    parser.add_argument('--output', help='write machine-readable results to this JSON file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='intellimed-booking-')
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(workdir, 'booking.db')}"
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+    os.environ['APPOINTMENT_SLOT_CAPACITY'] = str(args.capacity)
+    os.environ['TELEMEDICINE_SLOT_CAPACITY'] = str(args.telemedicine_capacity)
+
+    try:
+        from app import init_db
+        from extensions import db
+        from models import MedicalFacility
+        app = _create_app()
+        init_db(app)
+        with app.app_context():
+            facility = MedicalFacility(name='Stress Test Clinic', facility_type='clinic',
+                                       address=f"{os.getpid()} Stress Ave", latitude=40.7, longitude=-74.0)
+            db.session.add(facility)
+            db.session.commit()
+            facility_id = facility.id
+
+        slots = [slot.strftime('%Y-%m-%d %H:%M') for slot in _next_weekday_slots(args.slots)]
+        results = multiprocessing.Queue()
+        start_at = time.time() + 2.0
+        processes = [multiprocessing.Process(target=worker,
+                                             args=(index, facility_id, slots, args.attempts, start_at, results))
+                     for index in range(args.processes)]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        statuses = Counter()
+        for _ in processes:
+            statuses.update(results.get())
+        for process in processes:
+            process.join()
+        wall = time.perf_counter() - started - 2.0
+
+        rows = check(app, facility_id, slots, {facility_id: args.capacity, 0: args.telemedicine_capacity})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    attempts = args.processes * args.attempts
+    print(f"{attempts} booking attempts from {args.processes} processes in {wall:.1f} s "
+          f"({attempts / max(wall, 1e-9):.0f}/s); responses: {dict(sorted(statuses.items()))}")
+    print(f"{'pool':>6}  {'slot':<17}{'appointments':>13}{'reserved':>10}{'capacity':>10}")
+    for pool, slot, appointments, reserved, capacity, ok in rows:
+        print(f"{pool:>6}  {slot:<17}{appointments:>13}{reserved:>10}{capacity:>10}{'' if ok else '  OVERBOOKED'}")
+
+    unexpected = {status: count for status, count in statuses.items() if status not in (200, 409)}
+    booked = sum(row[2] for row in rows)
+    passed = all(row[5] for row in rows) and not unexpected and booked == statuses.get(200, 0)
+    print('PASS: no slot booked past capacity' if passed else
+          f"FAIL: overbooked or inconsistent slots; unexpected responses {unexpected}, "
+          f"{statuses.get(200, 0)} accepted vs {booked} stored")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'attempts': attempts, 'processes': args.processes, 'seconds': round(wall, 2),
+                'statuses': statuses, 'passed': passed,
+                'slots': [dict(zip(('pool', 'slot', 'appointments', 'reserved', 'capacity', 'ok'), row))
+                          for row in rows],
+            }, f, indent=2)
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
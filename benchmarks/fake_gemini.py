@@ -0,0 +1,187 @@
+"""Local stand-in for the Gemini Developer API, for load tests that must not spend quota.
+
+Implements ``models/{model}:generateContent`` and
+``models/{model}:streamGenerateContent?alt=sse`` closely enough for the
+google-genai SDK. Point gemini.py at it with GEMINI_BASE_URL:
+
+    python -m benchmarks.fake_gemini --port 8765 --latency-ms 1500 --jitter-ms 400
+    GEMINI_BASE_URL=http://127.0.0.1:8765 GEMINI_API_KEY=fake python app.py
+
+Replies are shaped after the prompt: symptom analyses and goal lists come
+back as the JSON gemini.py expects, everything else as prose.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PATH_PATTERN = re.compile(r"/models/(?P<model>[^/:]+):(?P<method>generateContent|streamGenerateContent)")
+
+PROSE = (
+    "Thanks for sharing that. Staying hydrated, getting enough rest and keeping "
+    "track of how your symptoms change are good first steps. If things get worse "
+    "or you are worried, please contact a healthcare professional for advice."
+)
+
+
+def _symptom_analysis():
+    return {
+        'prediction': "Symptoms are consistent with a common viral infection.",
+        'confidence': round(random.uniform(0.5, 0.9), 2),
+        'recommendations': ["Rest and drink plenty of fluids", "Consult a doctor if symptoms persist"],
+        'urgency_level': random.choice(['low', 'medium']),
+    }
+
+
+def _health_goals():
+    return [
+        {'goal_type': 'fitness', 'title': 'Walk daily', 'description': 'Walk 30 minutes a day',
+         'target_value': 30, 'unit': 'minutes', 'timeline_days': 30},
+        {'goal_type': 'nutrition', 'title': 'Eat more vegetables', 'description': 'Five portions a day',
+         'target_value': 5, 'unit': 'portions', 'timeline_days': 21},
+        {'goal_type': 'wellness', 'title': 'Sleep better', 'description': 'Sleep eight hours a night',
+         'target_value': 8, 'unit': 'hours', 'timeline_days': 14},
+    ]
+
+
+def reply_text(body):
+    """Pick a plausible reply for a generateContent request body"""
+    config = body.get('generationConfig') or {}
+    if config.get('responseMimeType') == 'application/json':
+        system = json.dumps(body.get('systemInstruction') or {})
+        if 'health coaching' in system:
+            return json.dumps(_health_goals())
+        return json.dumps(_symptom_analysis())
+    return PROSE
+
+
+def _candidate(text, finished=True):
+    candidate = {'content': {'role': 'model', 'parts': [{'text': text}]}, 'index': 0}
+    if finished:
+        candidate['finishReason'] = 'STOP'
+    return candidate
+
+
+class FakeGeminiServer:
+    """Threaded fake Gemini HTTP server with configurable latency, jitter and errors"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=800.0, jitter_ms=200.0,
+                 error_rate=0.0, stream_chunks=8, chunk_delay_ms=40.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.stream_chunks = max(1, stream_chunks)
+        self.chunk_delay_ms = chunk_delay_ms
+        self.random = random.Random(seed)
+        self.counts = {}
+        self._counts_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, key):
+        with self._counts_lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _delay(self):
+        jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(self.latency_ms + jitter, 0) / 1000)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                match = PATH_PATTERN.search(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if not match:
+                    self._send_json(404, {'error': {'code': 404, 'message': 'Not found', 'status': 'NOT_FOUND'}})
+                    return
+
+                model, method = match.group('model'), match.group('method')
+                server._count(f"{model}:{method}")
+                server._delay()
+                if server.random.random() < server.error_rate:
+                    server._count('errors')
+                    self._send_json(503, {'error': {'code': 503, 'message': 'The model is overloaded.',
+                                                    'status': 'UNAVAILABLE'}})
+                    return
+
+                text = reply_text(body)
+                if method == 'generateContent':
+                    self._send_json(200, {'candidates': [_candidate(text)], 'modelVersion': model})
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                size = max(1, -(-len(text) // server.stream_chunks))
+                pieces = [text[i:i + size] for i in range(0, len(text), size)]
+                for i, piece in enumerate(pieces):
+                    if i:
+                        time.sleep(server.chunk_delay_ms / 1000)
+                    chunk = {'candidates': [_candidate(piece, finished=i == len(pieces) - 1)],
+                             'modelVersion': model}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode('utf-8'))
+                    self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-gemini', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=800.0)
+    parser.add_argument('--jitter-ms', type=float, default=200.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--stream-chunks', type=int, default=8)
+    parser.add_argument('--chunk-delay-ms', type=float, default=40.0)
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(args.host, args.port, args.latency_ms, args.jitter_ms,
+                              args.error_rate, args.stream_chunks, args.chunk_delay_ms)
+    print(f"Fake Gemini listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
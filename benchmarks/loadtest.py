@@ -0,0 +1,526 @@
+"""Load test for the IntelliMed /api/* routes against a fake Gemini backend.
+
+By default the app runs in-process on a throwaway SQLite database, with
+gemini.py pointed at benchmarks/fake_gemini.py, so no real quota is spent:
+
+    python -m benchmarks.loadtest --duration 30 --concurrency 32 --mix default \\
+        --latency-ms 1200 --jitter-ms 300 --output bench_results.json
+
+    python -m benchmarks.loadtest --compare bench_results.json --output new.json
+
+Reports p50/p95/p99 latency, requests/s, error counts and SQL queries per
+request for every endpoint, and writes the same numbers as JSON so runs can
+be compared between releases with --compare. Use --target to drive an
+already running deployment instead (DB query counts are then unavailable).
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from benchmarks.fake_gemini import FakeGeminiServer
+
+NYC = (40.7306, -73.9352)
+
+SYMPTOMS = ['fever', 'cough', 'headache', 'fatigue', 'sore throat', 'nausea',
+            'shortness of breath', 'muscle aches', 'dizziness', 'chills', 'runny nose']
+
+SERVICES = ['Emergency Care', 'Cardiology', 'Pharmacy', 'X-rays', 'Primary Care', 'Vaccinations']
+
+CHAT_MESSAGES = [
+    "I've had a headache since this morning, what can I do?",
+    "How much water should I drink each day?",
+    "Is it normal to feel tired after a flu shot?",
+    "What are good exercises for lower back pain?",
+    "How can I sleep better?",
+]
+
+# Relative weights of each scenario in a traffic mix
+MIXES = {
+    'default': {
+        'nearby_radius': 30, 'nearby_knn': 8, 'facility_clusters': 5, 'chat': 15, 'chat_stream': 5,
+        'chat_history': 3, 'chat_export': 1,
+        'predict_disease': 10, 'health_goals_list': 10, 'health_goals_create': 3,
+        'goal_progress': 3, 'generate_goals': 5, 'book_appointment': 4,
+        'predict_disease_job': 2, 'job_status': 2, 'job_stats': 1,
+        'symptom_analytics': 2, 'init_sample_data': 1,
+        'symptom_cache_stats': 1, 'single_flight_stats': 1, 'admission_stats': 1, 'circuit_breaker_stats': 1,
+        'metrics': 1, 'facility_cache_stats': 1,
+    },
+    'facilities': {'nearby_radius': 50, 'nearby_knn': 20, 'nearby_service': 15, 'facility_clusters': 15},
+    'ai': {'chat': 35, 'chat_stream': 15, 'predict_disease': 35, 'generate_goals': 15},
+    'jobs': {'predict_disease_job': 35, 'job_status': 55, 'job_stats': 10},
+    'stats': {'symptom_cache_stats': 1, 'single_flight_stats': 1, 'admission_stats': 1, 'circuit_breaker_stats': 1,
+              'metrics': 1, 'facility_cache_stats': 1},
+    'chat': {'chat': 40, 'chat_stream': 10, 'chat_history': 40, 'chat_export': 10},
+    'db': {'health_goals_list': 35, 'health_goals_create': 15, 'goal_progress': 15, 'book_appointment': 20,
+           'availability': 15, 'symptom_analytics': 10},
+}
+
+
+class VirtualUser:
+    """One simulated browser: its own cookie jar, goal and job ids and chat session"""
+
+    def __init__(self, base_url, rng):
+        self.base_url = base_url
+        self.rng = rng
+        self.goal_ids = []
+        self.job_ids = []
+        self.chatted = False
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, method, path, body=None, stream=False):
+        """Return (status, payload, headers, ttfb_ms)"""
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        started = time.perf_counter()
+        ttfb = None
+        try:
+            with self.opener.open(req, timeout=120) as resp:
+                status, headers = resp.status, resp.headers
+                if stream:
+                    chunks = []
+                    for line in resp:
+                        if ttfb is None and line.startswith(b'event: token'):
+                            ttfb = (time.perf_counter() - started) * 1000
+                        chunks.append(line)
+                    raw = b''.join(chunks)
+                else:
+                    raw = resp.read()
+        except urllib.error.HTTPError as e:
+            status, headers, raw = e.code, e.headers, e.read()
+        payload = None
+        if not stream:
+            try:
+                payload = json.loads(raw or b'null')
+            except ValueError:
+                payload = None
+        return status, payload, headers, ttfb
+
+    # Scenarios: each returns (endpoint name, request result)
+
+    def nearby_radius(self):
+        lat = NYC[0] + self.rng.uniform(-0.15, 0.15)
+        lng = NYC[1] + self.rng.uniform(-0.15, 0.15)
+        radius = self.rng.choice([2, 5, 10, 25])
+        kind = self.rng.choice(['all', 'all', 'hospital', 'clinic', 'pharmacy', 'urgent_care'])
+        path = f"/api/nearby-facilities?lat={lat:.5f}&lng={lng:.5f}&radius={radius}&type={kind}"
+        return 'GET /api/nearby-facilities', self.request('GET', path)
+
+    def nearby_service(self):
+        lat = NYC[0] + self.rng.uniform(-0.15, 0.15)
+        lng = NYC[1] + self.rng.uniform(-0.15, 0.15)
+        service = self.rng.choice(SERVICES).replace(' ', '+')
+        path = f"/api/nearby-facilities?lat={lat:.5f}&lng={lng:.5f}&radius=10&service={service}"
+        return 'GET /api/nearby-facilities?service', self.request('GET', path)
+
+    def nearby_knn(self):
+        lat = NYC[0] + self.rng.uniform(-0.3, 0.3)
+        lng = NYC[1] + self.rng.uniform(-0.3, 0.3)
+        path = f"/api/nearby-facilities?lat={lat:.5f}&lng={lng:.5f}&k={self.rng.choice([5, 10, 20])}"
+        return 'GET /api/nearby-facilities?k', self.request('GET', path)
+
+    def facility_clusters(self):
+        # A map viewport around the city at a random zoom, from whole-region to street level
+        lat = NYC[0] + self.rng.uniform(-0.2, 0.2)
+        lng = NYC[1] + self.rng.uniform(-0.2, 0.2)
+        zoom = self.rng.randint(8, 17)
+        half = 180 / 2 ** zoom
+        bbox = f"{lng - 2 * half:.5f},{lat - half:.5f},{lng + 2 * half:.5f},{lat + half:.5f}"
+        return 'GET /api/facility-clusters', self.request('GET', f"/api/facility-clusters?bbox={bbox}&zoom={zoom}")
+
+    def chat(self):
+        body = {'message': self.rng.choice(CHAT_MESSAGES),
+                'persona': self.rng.choice(['general', 'senior', 'empathetic'])}
+        result = self.request('POST', '/api/chat', body)
+        self.chatted = self.chatted or result[0] == 200
+        return 'POST /api/chat', result
+
+    def chat_stream(self):
+        body = {'message': self.rng.choice(CHAT_MESSAGES), 'persona': 'general'}
+        return 'POST /api/chat/stream', self.request('POST', '/api/chat/stream', body, stream=True)
+
+    def chat_history(self):
+        if not self.chatted:
+            return self.chat()
+        return 'GET /api/chat/history', self.request('GET', f"/api/chat/history?limit={self.rng.choice([20, 50])}")
+
+    def chat_export(self):
+        if not self.chatted:
+            return self.chat()
+        return 'GET /api/chat/history/export', self.request('GET', '/api/chat/history/export', stream=True)
+
+    def predict_disease(self):
+        symptoms = self.rng.sample(SYMPTOMS, self.rng.randint(1, 4))
+        body = {'symptoms': symptoms, 'age': self.rng.randint(5, 85)}
+        return 'POST /api/predict-disease', self.request('POST', '/api/predict-disease', body)
+
+    def symptom_analytics(self):
+        window = self.rng.choice(['hours=1', 'hours=24', 'hours=72', 'days=7', 'days=30'])
+        return 'GET /api/analytics/symptoms', self.request('GET', f"/api/analytics/symptoms?{window}")
+
+    def predict_disease_job(self):
+        symptoms = self.rng.sample(SYMPTOMS, self.rng.randint(1, 4))
+        body = {'symptoms': symptoms, 'age': self.rng.randint(5, 85), 'async': True}
+        result = self.request('POST', '/api/predict-disease', body)
+        if result[1] and result[1].get('job_id'):
+            self.job_ids.append(result[1]['job_id'])
+        return 'POST /api/predict-disease?async', result
+
+    def job_status(self):
+        if not self.job_ids:
+            return self.predict_disease_job()
+        # Long-poll the oldest job until it finishes, as the browser does
+        job_id = self.job_ids.pop(0)
+        return 'GET /api/jobs/<id>', self.request('GET', f"/api/jobs/{job_id}?wait=25")
+
+    def job_stats(self):
+        return 'GET /api/jobs/stats', self.request('GET', '/api/jobs/stats')
+
+    def health_goals_list(self):
+        return 'GET /api/health-goals', self.request('GET', '/api/health-goals')
+
+    def health_goals_create(self):
+        body = {'goal_type': 'fitness', 'title': 'Walk more', 'target_value': self.rng.randint(5, 50),
+                'unit': 'km', 'target_date': (datetime.utcnow() + timedelta(days=30)).strftime('%Y-%m-%d')}
+        result = self.request('POST', '/api/health-goals', body)
+        if result[1] and result[1].get('goal_id'):
+            self.goal_ids.append(result[1]['goal_id'])
+        return 'POST /api/health-goals', result
+
+    def goal_progress(self):
+        if not self.goal_ids:
+            return self.health_goals_create()
+        goal_id = self.rng.choice(self.goal_ids)
+        body = {'current_value': self.rng.randint(0, 50)}
+        return 'POST /api/health-goals/<id>/progress', self.request(
+            'POST', f"/api/health-goals/{goal_id}/progress", body)
+
+    def generate_goals(self):
+        body = {'age': self.rng.randint(18, 80), 'fitness_level': self.rng.choice(['low', 'moderate', 'high'])}
+        return 'POST /api/generate-health-goals', self.request('POST', '/api/generate-health-goals', body)
+
+    def book_appointment(self):
+        # A weekday slot within the default opening hours (availability.py)
+        day = datetime.now() + timedelta(days=self.rng.randint(1, 30))
+        while day.weekday() >= 5:
+            day += timedelta(days=1)
+        when = day.replace(hour=self.rng.randint(9, 16), minute=self.rng.choice([0, 30]))
+        body = {'facility_id': self.rng.randint(1, 50), 'appointment_type': 'telemedicine',
+                'appointment_date': when.strftime('%Y-%m-%d %H:%M')}
+        return 'POST /api/book-appointment', self.request('POST', '/api/book-appointment', body)
+
+    def availability(self):
+        day = datetime.now() + timedelta(days=self.rng.randint(0, 30))
+        path = f"/api/availability?facility_id={self.rng.randint(1, 50)}&date={day:%Y-%m-%d}&days=7"
+        return 'GET /api/availability', self.request('GET', path)
+
+    def symptom_cache_stats(self):
+        return 'GET /api/symptom-cache/stats', self.request('GET', '/api/symptom-cache/stats')
+
+    def single_flight_stats(self):
+        return 'GET /api/single-flight/stats', self.request('GET', '/api/single-flight/stats')
+
+    def admission_stats(self):
+        return 'GET /api/admission/stats', self.request('GET', '/api/admission/stats')
+
+    def circuit_breaker_stats(self):
+        return 'GET /api/circuit-breakers/stats', self.request('GET', '/api/circuit-breakers/stats')
+
+    def metrics(self):
+        return 'GET /metrics', self.request('GET', '/metrics')
+
+    def facility_cache_stats(self):
+        return 'GET /api/facility-cache/stats', self.request('GET', '/api/facility-cache/stats')
+
+    def init_sample_data(self):
+        return 'POST /api/init-sample-data', self.request('POST', '/api/init-sample-data')
+
+
+# In-process app harness
+
+def _install_query_counter(app):
+    """Report each request's SQL statement count and time (from metrics.py) in response headers"""
+    import metrics
+
+    @app.after_request
+    def report_counts(response):
+        stats = metrics.request_db_stats()
+        if stats is not None:
+            response.headers['X-Bench-DB-Queries'] = str(stats[0])
+            response.headers['X-Bench-DB-Ms'] = f"{stats[1] * 1000:.3f}"
+        return response
+
+
+def _seed_facilities(app, count, rng):
+    from facility_import import import_records
+
+    kinds = ['hospital', 'clinic', 'pharmacy', 'urgent_care']
+    records = ({
+        'name': f"Bench Facility {i}", 'facility_type': rng.choice(kinds),
+        'address': f"{i} Benchmark Ave, New York, NY",
+        'latitude': NYC[0] + rng.uniform(-0.5, 0.5), 'longitude': NYC[1] + rng.uniform(-0.5, 0.5),
+        'services': rng.sample(SERVICES, 2),
+        'emergency_services': rng.random() < 0.3, 'accepts_insurance': rng.random() < 0.9,
+    } for i in range(count))
+    with app.app_context():
+        app.test_client().post('/api/init-sample-data')
+        import_records(enumerate(records, start=1))
+
+
+def start_local_app(args, workdir):
+    """Import the app against a scratch database and serve it on a local port"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault('GEMINI_API_KEY', 'fake-benchmark-key')
+    os.environ['SYMPTOM_CACHE_PATH'] = os.path.join(workdir, 'symptom_cache.db')
+    os.environ['SINGLE_FLIGHT_PATH'] = os.path.join(workdir, 'single_flight.db')
+    # The fake backend has no quota; admission limits stay off unless set explicitly
+    for name in ('SESSION_LLM_RPS', 'GEMINI_FLASH_RPS', 'GEMINI_PRO_RPS'):
+        os.environ.setdefault(name, '0')
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+    from werkzeug.serving import make_server
+    from app import create_app, init_db
+    app = create_app()
+    init_db(app)
+
+    logging_level = 'WARNING' if not args.verbose else 'DEBUG'
+    import logging
+    logging.getLogger().setLevel(logging_level)
+    logging.getLogger('werkzeug').setLevel('ERROR')
+
+    _install_query_counter(app)
+    _seed_facilities(app, args.facilities, random.Random(args.seed))
+    if args.job_threads:
+        # Runs async predictions the way job_worker.py does; daemon threads end with the run
+        from job_worker import start_threads
+        start_threads(app, args.job_threads, 0.1, threading.Event(), daemon=True)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-app', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+# Measurement and reporting
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _load_mix(name):
+    if name in MIXES:
+        return MIXES[name]
+    with open(name) as f:
+        return json.load(f)
+
+
+def run_load(base_url, mix, duration, max_requests, concurrency, seed, warmup):
+    """Drive the mix from `concurrency` virtual users, returns raw samples"""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = []
+    samples_lock = threading.Lock()
+    issued = [0]
+    deadline = time.monotonic() + warmup + duration
+    measure_from = time.monotonic() + warmup
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        user = VirtualUser(base_url, rng)
+        while time.monotonic() < deadline:
+            with samples_lock:
+                if max_requests and issued[0] >= max_requests:
+                    return
+                issued[0] += 1
+            scenario = getattr(user, rng.choices(names, weights)[0])
+            started = time.perf_counter()
+            try:
+                endpoint, (status, payload, headers, ttfb) = scenario()
+            except Exception as e:
+                endpoint, status, payload, headers, ttfb = scenario.__name__, 0, None, {}, None
+                if index == 0:
+                    print(f"  request error: {e}", file=sys.stderr)
+            elapsed = (time.perf_counter() - started) * 1000
+            if time.monotonic() < measure_from:
+                continue
+            ok = 200 <= status < 300 and not (isinstance(payload, dict) and payload.get('success') is False)
+            sample = {
+                'endpoint': endpoint, 'status': status, 'ok': ok, 'ms': elapsed, 'ttfb_ms': ttfb,
+                'db_queries': int(headers.get('X-Bench-DB-Queries')) if headers.get('X-Bench-DB-Queries') else None,
+                'db_ms': float(headers.get('X-Bench-DB-Ms')) if headers.get('X-Bench-DB-Ms') else None,
+            }
+            with samples_lock:
+                samples.append(sample)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall = max(time.monotonic() - started - warmup, 1e-9)
+    return samples, wall
+
+
+def summarize(samples, wall):
+    by_endpoint = {}
+    for sample in samples:
+        by_endpoint.setdefault(sample['endpoint'], []).append(sample)
+
+    def describe(group):
+        latencies = [s['ms'] for s in group]
+        queries = [s['db_queries'] for s in group if s['db_queries'] is not None]
+        db_ms = [s['db_ms'] for s in group if s['db_ms'] is not None]
+        ttfb = [s['ttfb_ms'] for s in group if s['ttfb_ms'] is not None]
+        summary = {
+            'requests': len(group),
+            'errors': sum(1 for s in group if not s['ok']),
+            'rps': round(len(group) / wall, 2),
+            'mean_ms': round(statistics.fmean(latencies), 2),
+            'p50_ms': round(_percentile(latencies, 50), 2),
+            'p95_ms': round(_percentile(latencies, 95), 2),
+            'p99_ms': round(_percentile(latencies, 99), 2),
+            'max_ms': round(max(latencies), 2),
+            'db_queries_mean': round(statistics.fmean(queries), 2) if queries else None,
+            'db_queries_max': max(queries) if queries else None,
+            'db_ms_mean': round(statistics.fmean(db_ms), 3) if db_ms else None,
+        }
+        if ttfb:
+            summary['ttfb_p50_ms'] = round(_percentile(ttfb, 50), 2)
+            summary['ttfb_p95_ms'] = round(_percentile(ttfb, 95), 2)
+        return summary
+
+    endpoints = {name: describe(group) for name, group in sorted(by_endpoint.items())}
+    total = describe(samples) if samples else {}
+    return endpoints, total
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(endpoints, total):
+    header = f"{'endpoint':42} {'reqs':>6} {'err':>5} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8}"
+    print(header)
+    print('-' * len(header))
+    for name, row in list(endpoints.items()) + [('TOTAL', total)]:
+        if not row:
+            continue
+        queries = '' if row['db_queries_mean'] is None else f"{row['db_queries_mean']:.1f}"
+        print(f"{name:42} {row['requests']:>6} {row['errors']:>5} {row['rps']:>8.1f} "
+              f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {queries:>8}")
+
+
+def print_comparison(baseline, endpoints):
+    print(f"\nChange vs baseline {baseline['meta'].get('git_revision')} ({baseline['meta'].get('timestamp')}):")
+    for name, row in endpoints.items():
+        old = baseline['endpoints'].get(name)
+        if not old:
+            continue
+        deltas = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rps'):
+            if old.get(key):
+                deltas.append(f"{key} {100 * (row[key] - old[key]) / old[key]:+.1f}%")
+        print(f"  {name:42} " + '  '.join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', help='base URL of a running deployment; default runs the app in-process')
+    parser.add_argument('--mix', default='default', help=f"one of {', '.join(MIXES)} or a JSON weights file")
+    parser.add_argument('--duration', type=float, default=20.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=2.0, help='seconds of unmeasured traffic first')
+    parser.add_argument('--requests', type=int, default=0, help='stop after this many requests')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--facilities', type=int, default=5000, help='facilities to seed in-process')
+    parser.add_argument('--job-threads', type=int, default=4, help='in-process job worker threads')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency-ms', type=float, default=800.0, help='fake Gemini latency')
+    parser.add_argument('--jitter-ms', type=float, default=200.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--stream-chunks', type=int, default=8)
+    parser.add_argument('--chunk-delay-ms', type=float, default=40.0)
+    parser.add_argument('--output', help='write machine-readable results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON results to diff against')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    fake = server = None
+    workdir = tempfile.mkdtemp(prefix='intellimed-bench-')
+    if args.target:
+        base_url = args.target.rstrip('/')
+    else:
+        fake = FakeGeminiServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                error_rate=args.error_rate, stream_chunks=args.stream_chunks,
+                                chunk_delay_ms=args.chunk_delay_ms, seed=args.seed).start()
+        os.environ['GEMINI_BASE_URL'] = fake.base_url
+        server, base_url = start_local_app(args, workdir)
+
+    mix = _load_mix(args.mix)
+    print(f"Driving {base_url} with mix '{args.mix}' at concurrency {args.concurrency} "
+          f"for {args.duration:.0f}s (+{args.warmup:.0f}s warmup)")
+    try:
+        samples, wall = run_load(base_url, mix, args.duration, args.requests,
+                                 args.concurrency, args.seed, args.warmup)
+    finally:
+        if server:
+            server.shutdown()
+        if fake:
+            fake.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    endpoints, total = summarize(samples, wall)
+    print_report(endpoints, total)
+
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'target': args.target or 'in-process',
+            'mix': mix, 'mix_name': args.mix,
+            'concurrency': args.concurrency, 'duration_s': round(wall, 2),
+            'facilities': None if args.target else args.facilities,
+            'fake_gemini': None if args.target else {
+                'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms, 'error_rate': args.error_rate,
+                'stream_chunks': args.stream_chunks, 'chunk_delay_ms': args.chunk_delay_ms,
+                'calls': fake.counts,
+            },
+        },
+        'endpoints': endpoints,
+        'total': total,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), endpoints)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Cold-start benchmark: import, app factory, schema setup and first requests.
+
+Each run is a fresh interpreter, so nothing is cached between runs:
+
+    python -m benchmarks.startup --runs 7 --output startup.json
+
+Reports the median and worst time of each phase:
+
+* import    - ``import main`` (modules, SDK imports, module-level state)
+* create_app - app factory: config, extensions, blueprint
+* init_db   - create_all + pending migrations on an empty SQLite database
+* first_page - first GET / through the test client
+* first_api - first GET /api/health-goals (first ORM query)
+* warm_up   - gemini.warm_up(), as gunicorn's post_worker_init runs it
+              (only with --warm-up)
+* first_ai  - first POST /api/chat against benchmarks/fake_gemini.py
+              (Gemini SDK import and client creation unless warmed up)
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+PHASES = ['import', 'create_app', 'init_db', 'first_page', 'first_api', 'warm_up', 'first_ai']
+
+
+def measure_once():
+    """Run inside the child interpreter; prints one JSON line of phase timings in ms"""
+    timings = {}
+
+    def timed(name, fn):
+        started = time.perf_counter()
+        result = fn()
+        timings[name] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    timed('import', lambda: __import__('main'))
+    from app import create_app, init_db
+    # main already built one app; time a second build separately from the import
+    app = timed('create_app', create_app)
+    timed('init_db', lambda: init_db(app))
+    client = app.test_client()
+    timed('first_page', lambda: client.get('/'))
+    timed('first_api', lambda: client.get('/api/health-goals'))
+    if os.environ.get('STARTUP_WARM_UP') == '1':
+        import gemini
+        timed('warm_up', gemini.warm_up)
+    if os.environ.get('GEMINI_BASE_URL'):
+        timed('first_ai', lambda: client.post('/api/chat', json={'message': 'How can I sleep better?'}))
+    print(json.dumps(timings))
+
+
+def run_child(workdir, index, env):
+    env = dict(env)
+    env['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, f'startup_{index}.db')}"
+    env['SYMPTOM_CACHE_PATH'] = os.path.join(workdir, f'symptom_cache_{index}.db')
+    env['SINGLE_FLIGHT_PATH'] = os.path.join(workdir, f'single_flight_{index}.db')
+    proc = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--child'],
+                          capture_output=True, text=True, env=env, check=False)
+    if proc.returncode != 0:
+        raise RuntimeError(f"startup run {index} failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--no-ai', action='store_true', help='skip the first AI request')
+    parser.add_argument('--warm-up', action='store_true', help='warm up the Gemini client before the first AI request')
+    parser.add_argument('--output', help='write machine-readable results to this JSON file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure_once()
+        return
+
+    env = dict(os.environ)
+    env.setdefault('SESSION_SECRET', 'benchmark')
+    env.setdefault('GEMINI_API_KEY', 'fake-benchmark-key')
+    env['STARTUP_WARM_UP'] = '1' if args.warm_up else '0'
+    for name in ('SESSION_LLM_RPS', 'GEMINI_FLASH_RPS', 'GEMINI_PRO_RPS'):
+        env.setdefault(name, '0')
+
+    fake = None
+    if not args.no_ai:
+        from benchmarks.fake_gemini import FakeGeminiServer
+        fake = FakeGeminiServer(latency_ms=0, jitter_ms=0).start()
+        env['GEMINI_BASE_URL'] = fake.base_url
+
+    workdir = tempfile.mkdtemp(prefix='intellimed-startup-')
+    runs = []
+    try:
+        for index in range(args.runs):
+            runs.append(run_child(workdir, index, env))
+    finally:
+        if fake:
+            fake.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {}
+    print(f"{'phase':<12}{'median ms':>12}{'max ms':>12}")
+    for phase in PHASES:
+        values = [run[phase] for run in runs if phase in run]
+        if not values:
+            continue
+        summary[phase] = {'median_ms': round(statistics.median(values), 2), 'max_ms': max(values)}
+        print(f"{phase:<12}{summary[phase]['median_ms']:>12.1f}{summary[phase]['max_ms']:>12.1f}")
+
+    if args.output:
+        results = {
+            'meta': {
+                'timestamp': datetime.utcnow().isoformat() + 'Z',
+                'git_revision': _git_revision(),
+                'python': platform.python_version(),
+                'runs': args.runs,
+                'warm_up': args.warm_up,
+            },
+            'phases': summary,
+            'runs': runs,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
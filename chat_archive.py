@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""Archival of inactive chat sessions out of the hot chat_message table.
+
+A session whose newest message is older than CHAT_ARCHIVE_AFTER_DAYS has its
+messages moved into one compressed blob in chat_archive (gzip, or zstd with
+the optional ``zstandard`` package). The chat_message rows are then deleted,
+so the table and its indexes only hold recent conversations and new pages
+are reused instead of the file growing. If an archived session is resumed,
+its new messages stay live until it goes quiet again. They are then merged
+into the existing blob. The rolling summary on ChatSession is kept, and
+chat_memory.py reads the recent window of a resumed chat from the tail of
+its blob, so the conversation continues with its earlier context.
+
+The job runs in small batches of sessions, each in its own short transaction
+and with an optional pause in between, so it can run alongside live traffic:
+
+    python chat_archive.py run --older-than-days 90 --batch 50 --pause 0.2
+    python chat_archive.py run --loop 3600     # keep running, once an hour
+    python chat_archive.py show <session_id>   # archived + live messages
+    python chat_archive.py stats
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, or_, select
+from extensions import db
+from models import ChatArchive, ChatMessage, ChatSession
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+ARCHIVE_AFTER_DAYS = float(os.environ.get("CHAT_ARCHIVE_AFTER_DAYS", 90))
+ARCHIVE_BATCH = int(os.environ.get("CHAT_ARCHIVE_BATCH", 50))
+ARCHIVE_CODEC = os.environ.get("CHAT_ARCHIVE_CODEC", "gzip")
+
+
+def compress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("CHAT_ARCHIVE_CODEC=zstd needs the zstandard package")
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=9)
+
+
+def decompress(payload, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Reading zstd chat archives needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return gzip.decompress(payload)
+
+
+def message_dict(message_id, is_user, message, timestamp):
+    return {'id': message_id, 'is_user': is_user, 'message': message,
+            'timestamp': timestamp.isoformat() if timestamp else None}
+
+
+def archived_messages(archive):
+    """Message dicts stored in a ChatArchive, oldest first"""
+    rows = json.loads(decompress(archive.payload, archive.codec))
+    return [dict(zip(('id', 'is_user', 'message', 'timestamp'), row)) for row in rows]
+
+
+def _archivable(cutoff):
+    return or_(ChatMessage.timestamp < cutoff, ChatMessage.timestamp.is_(None))
+
+
+def inactive_sessions(cutoff, after_id=0, limit=ARCHIVE_BATCH):
+    """Ids of sessions above after_id with live messages, none of them newer than cutoff"""
+    live = select(ChatMessage.id).where(ChatMessage.session_id == ChatSession.id)
+    recent = live.where(ChatMessage.timestamp >= cutoff)
+    return [row.id for row in db.session.query(ChatSession.id).filter(
+        ChatSession.id > after_id, live.exists(), ~recent.exists()
+    ).order_by(ChatSession.id).limit(limit)]
+
+
+def archive_sessions(session_ids, cutoff, codec=ARCHIVE_CODEC):
+    """Move the live messages of these sessions into their archives in one transaction
+
+    Returns (messages archived, compressed bytes written).
+    """
+    # SQLite hands out max(id) + 1 as the next id, so deleting the newest row
+    # would let a new message reuse an archived id. It stays live until a
+    # later run; message ids then keep increasing across archive and table.
+    newest_id = db.session.query(func.max(ChatMessage.id)).scalar()
+    archivable = [ChatMessage.session_id.in_(session_ids), _archivable(cutoff), ChatMessage.id < newest_id]
+    rows = db.session.query(
+        ChatMessage.session_id, ChatMessage.id, ChatMessage.is_user, ChatMessage.message, ChatMessage.timestamp
+    ).filter(*archivable).order_by(
+        ChatMessage.session_id, ChatMessage.timestamp, ChatMessage.id
+    ).all()
+    by_session = {}
+    for row in rows:
+        by_session.setdefault(row.session_id, []).append(row)
+    archives = {archive.session_id: archive for archive in
+                ChatArchive.query.filter(ChatArchive.session_id.in_(list(by_session)))}
+
+    written = 0
+    for session_id, messages in by_session.items():
+        archive = archives.get(session_id)
+        previous = archived_messages(archive) if archive else []
+        encoded = json.dumps(
+            [[m['id'], m['is_user'], m['message'], m['timestamp']] for m in previous]
+            + [[row.id, row.is_user, row.message, row.timestamp.isoformat() if row.timestamp else None]
+               for row in messages],
+            separators=(',', ':'), ensure_ascii=False,
+        ).encode('utf-8')
+        if archive is None:
+            archive = ChatArchive(session_id=session_id)
+            db.session.add(archive)
+        archive.codec = codec
+        archive.payload = compress(encoded, codec)
+        archive.raw_bytes = len(encoded)
+        archive.message_count = len(previous) + len(messages)
+        timestamps = [row.timestamp for row in messages if row.timestamp]
+        if timestamps:
+            archive.first_message_at = archive.first_message_at or timestamps[0]
+            archive.last_message_at = timestamps[-1]
+        written += len(archive.payload)
+
+    # Same condition as the read above; messages written since are newer than cutoff and stay
+    db.session.execute(delete(ChatMessage).where(*archivable))
+    db.session.commit()
+    return len(rows), written
+
+
+def archive_inactive(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH, max_sessions=None,
+                     pause=0.0, codec=ARCHIVE_CODEC):
+    """Archive every inactive session in batches; returns counters for the run"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    stats = {'sessions': 0, 'messages': 0, 'compressed_bytes': 0, 'batches': 0}
+    after_id = 0
+    started = time.perf_counter()
+    while max_sessions is None or stats['sessions'] < max_sessions:
+        limit = batch_size if max_sessions is None else min(batch_size, max_sessions - stats['sessions'])
+        session_ids = inactive_sessions(cutoff, after_id, limit)
+        if not session_ids:
+            db.session.rollback()
+            break
+        try:
+            messages, written = archive_sessions(session_ids, cutoff, codec)
+        except Exception:
+            db.session.rollback()
+            raise
+        after_id = session_ids[-1]
+        stats['sessions'] += len(session_ids)
+        stats['messages'] += messages
+        stats['compressed_bytes'] += written
+        stats['batches'] += 1
+        if pause:
+            # Let live writers in between batches
+            time.sleep(pause)
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+def session_messages(chat_session_pk):
+    """All messages of a session, archived and live, oldest first"""
+    archive = db.session.get(ChatArchive, chat_session_pk)
+    messages = archived_messages(archive) if archive else []
+    live = db.session.query(ChatMessage.id, ChatMessage.is_user, ChatMessage.message, ChatMessage.timestamp).filter(
+        ChatMessage.session_id == chat_session_pk
+    ).order_by(ChatMessage.timestamp, ChatMessage.id)
+    messages.extend(message_dict(*row) for row in live)
+    return messages
+
+
+def archive_stats():
+    sessions, messages, raw, stored = db.session.query(
+        func.count(ChatArchive.session_id), func.coalesce(func.sum(ChatArchive.message_count), 0),
+        func.coalesce(func.sum(ChatArchive.raw_bytes), 0), func.coalesce(func.sum(func.length(ChatArchive.payload)), 0),
+    ).one()
+    return {
+        'archived_sessions': sessions,
+        'archived_messages': messages,
+        'raw_bytes': raw,
+        'compressed_bytes': stored,
+        'compression_ratio': round(raw / stored, 2) if stored else None,
+        'live_messages': db.session.query(func.count(ChatMessage.id)).scalar(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='archive inactive sessions')
+    run.add_argument('--older-than-days', type=float, default=ARCHIVE_AFTER_DAYS)
+    run.add_argument('--batch', type=int, default=ARCHIVE_BATCH, help='sessions per transaction')
+    run.add_argument('--max-sessions', type=int, help='stop after archiving this many sessions')
+    run.add_argument('--pause', type=float, default=0.0, help='seconds to sleep between batches')
+    run.add_argument('--codec', choices=['gzip', 'zstd'], default=ARCHIVE_CODEC)
+    run.add_argument('--loop', type=float, metavar='SECONDS', help='repeat every SECONDS until interrupted')
+    show = commands.add_parser('show', help='print the messages of a session')
+    show.add_argument('session_id', help='ChatSession.session_id or primary key')
+    commands.add_parser('stats', help='archive size and compression ratio')
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    logging.getLogger().setLevel(logging.INFO)
+
+    with app.app_context():
+        if args.command == 'stats':
+            print(json.dumps(archive_stats(), indent=2))
+        elif args.command == 'show':
+            chat_session = ChatSession.query.filter_by(session_id=args.session_id).first()
+            if chat_session is None and args.session_id.isdigit():
+                chat_session = db.session.get(ChatSession, int(args.session_id))
+            if chat_session is None:
+                print(f"No chat session {args.session_id}", file=sys.stderr)
+                return 1
+            for message in session_messages(chat_session.id):
+                print(f"[{message['timestamp']}] {'User' if message['is_user'] else 'Assistant'}: {message['message']}")
+        else:
+            while True:
+                stats = archive_inactive(args.older_than_days, args.batch, args.max_sessions, args.pause, args.codec)
+                logging.info(f"Archived {stats['sessions']} chat sessions ({stats['messages']} messages, "
+                             f"{stats['compressed_bytes']} bytes) in {stats['seconds']}s")
+                db.session.remove()
+                if not args.loop:
+                    break
+                time.sleep(args.loop)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Reading chat history back: keyset pages and streaming NDJSON export.
+
+Messages are ordered by (session, id). A page is one index range read on
+ix_chat_message_session_id_id, bounded by the cursor id, whatever the page
+depth; nothing counts or skips rows with OFFSET. Sessions moved to
+chat_archive (see chat_archive.py) are read from their blob first, since
+their archived messages all precede the live ones.
+
+Exports stream live rows from a server-side cursor in STREAM_BATCH chunks,
+so memory stays flat however long the conversation is. An archived blob is
+decoded one session at a time.
+"""
+import json
+from sqlalchemy import select
+from extensions import db
+from chat_archive import archived_messages, message_dict
+from models import ChatArchive, ChatMessage, ChatSession
+
+MAX_PAGE_SIZE = 200
+STREAM_BATCH = 500
+
+_COLUMNS = (ChatMessage.id, ChatMessage.is_user, ChatMessage.message, ChatMessage.timestamp)
+
+
+def history_page(chat_session_pk, before=None, after=None, limit=50):
+    """Return (messages oldest first, has_more) for one page of a session
+
+    With ``after``, the page holds the messages following that id; otherwise
+    it holds the newest messages, or the ones preceding ``before``.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = select(*_COLUMNS).where(ChatMessage.session_id == chat_session_pk)
+    if after is not None:
+        query = query.where(ChatMessage.id > after).order_by(ChatMessage.id)
+    else:
+        if before is not None:
+            query = query.where(ChatMessage.id < before)
+        query = query.order_by(ChatMessage.id.desc())
+    messages = [message_dict(*row) for row in db.session.execute(query.limit(limit + 1))]
+
+    # Archived messages precede live ones; only read the blob when the page reaches into them
+    archive = None
+    if after is not None or len(messages) <= limit:
+        archive = db.session.get(ChatArchive, chat_session_pk)
+    if archive is not None:
+        archived = archived_messages(archive)
+        if after is not None:
+            messages = [m for m in archived if m['id'] > after][:limit + 1] + messages
+        else:
+            oldest_live = messages[-1]['id'] if messages else None
+            older = [m for m in archived
+                     if (before is None or m['id'] < before) and (oldest_live is None or m['id'] < oldest_live)]
+            messages = messages + older[::-1]
+
+    has_more = len(messages) > limit
+    page = messages[:limit]
+    if after is None:
+        page.reverse()
+    return page, has_more
+
+
+def _stream_session(chat_session_pk, session_key):
+    archive = db.session.get(ChatArchive, chat_session_pk)
+    if archive is not None:
+        for message in archived_messages(archive):
+            yield dict(message, session_id=session_key)
+    rows = db.session.execute(
+        select(*_COLUMNS).where(ChatMessage.session_id == chat_session_pk).order_by(ChatMessage.id)
+        .execution_options(stream_results=True, yield_per=STREAM_BATCH)
+    )
+    for row in rows:
+        yield dict(message_dict(*row), session_id=session_key)
+
+
+def export_ndjson(chat_session_pks):
+    """Yield NDJSON, one line per message of the given sessions in (session, id) order, in chunks"""
+    sessions = db.session.execute(
+        select(ChatSession.id, ChatSession.session_id, ChatSession.persona_type)
+        .where(ChatSession.id.in_(chat_session_pks)).order_by(ChatSession.id)
+    ).all()
+    lines = []
+    for chat_session_pk, session_key, persona in sessions:
+        for message in _stream_session(chat_session_pk, session_key):
+            message['persona'] = persona
+            lines.append(json.dumps(message) + "\n")
+            # One write per batch of lines rather than per message
+            if len(lines) >= STREAM_BATCH:
+                yield ''.join(lines)
+                lines = []
+    if lines:
+        yield ''.join(lines)
@@ -0,0 +1,194 @@
+"""Token-budgeted conversation memory for multi-turn chat.
+
+Each chat prompt carries at most CHAT_MEMORY_TOKEN_BUDGET tokens of history:
+a rolling summary of older turns (stored on ChatSession) followed by as many
+of the most recent messages as fit in what is left. Prompt size therefore
+stays flat however long a session runs.
+
+The summary is updated incrementally off the request path. After a turn is
+saved, once at least CHAT_MEMORY_SUMMARY_BATCH messages have fallen out of
+the recent window without being summarized, a background task on the Gemini
+loop folds them into the summary with gemini-2.5-flash.
+
+Sessions moved out of chat_message by chat_archive.py keep their memory:
+when a session has fewer live messages than the window holds, the window is
+filled from the tail of its archive blob, and archived messages that later
+fall out of the window are summarized like live ones.
+
+Token counts are estimated at four characters per token, which is close
+enough for budgeting English text.
+"""
+import asyncio
+import logging
+import os
+from collections import namedtuple
+from datetime import datetime
+from extensions import db
+from chat_archive import archived_messages
+from models import ChatArchive, ChatMessage, ChatSession
+import llm_runtime
+from gemini import summarize_conversation_async
+
+CHARS_PER_TOKEN = 4
+
+# Same fields as the ChatMessage rows read below
+_Message = namedtuple('_Message', 'id is_user message')
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _truncate_to_tokens(text, tokens):
+    """Keep the start of text, within tokens"""
+    limit = tokens * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:max(limit - 3, 0)] + '...'
+
+
+def _truncate_start_to_tokens(text, tokens):
+    """Keep the end of text, within tokens"""
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return '...' + text[len(text) - max(limit - 3, 0):]
+
+
+def format_message(is_user, message):
+    return f"{'User' if is_user else 'Assistant'}: {message}"
+
+
+class ConversationMemory:
+    """Builds bounded chat history and maintains per-session rolling summaries"""
+
+    def __init__(self):
+        self.app = None
+        self.token_budget = 1500
+        self.summary_tokens = 300
+        self.max_messages = 30
+        self.summary_batch = 6
+        self._refreshing = set()
+        self.summaries_written = 0
+        self._bound_pid = None
+
+    def init_app(self, app):
+        # Bound to the first app built in each process, like chat_writer
+        if self.app is not None and self._bound_pid == os.getpid():
+            return
+        self.app = app
+        self._bound_pid = os.getpid()
+        app.extensions['conversation_memory'] = self
+        self.token_budget = app.config.get("CHAT_MEMORY_TOKEN_BUDGET", 1500)
+        self.summary_tokens = app.config.get("CHAT_MEMORY_SUMMARY_TOKENS", 300)
+        self.max_messages = app.config.get("CHAT_MEMORY_MAX_MESSAGES", 30)
+        self.summary_batch = app.config.get("CHAT_MEMORY_SUMMARY_BATCH", 6)
+
+    @property
+    def enabled(self):
+        return self.token_budget > 0
+
+    def _window(self, chat_session_pk):
+        """Return (summary, summary_through_id, recent messages oldest first, oldest recent id)"""
+        summary, through_id = db.session.query(
+            ChatSession.summary, ChatSession.summary_through_id
+        ).filter(ChatSession.id == chat_session_pk).first() or (None, None)
+        through_id = through_id or 0
+
+        budget = self.token_budget - (estimate_tokens(summary) if summary else 0)
+        rows = db.session.query(ChatMessage.id, ChatMessage.is_user, ChatMessage.message).filter(
+            ChatMessage.session_id == chat_session_pk,
+            ChatMessage.id > through_id
+        ).order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(self.max_messages).all()
+        if len(rows) < self.max_messages:
+            # A resumed archived session continues from the tail of its archive
+            older = self._archived_after(chat_session_pk, through_id)
+            rows.extend(older[::-1][:self.max_messages - len(rows)])
+
+        recent = []
+        for row in rows:
+            line = format_message(row.is_user, row.message)
+            cost = estimate_tokens(line)
+            if cost > budget:
+                room = budget - estimate_tokens(format_message(row.is_user, ''))
+                if not recent and room > 0:
+                    # Keep the tail of an oversized latest message rather than nothing
+                    tail = _truncate_start_to_tokens(row.message, room)
+                    recent.append((row.id, format_message(row.is_user, tail)))
+                break
+            recent.append((row.id, line))
+            budget -= cost
+        recent.reverse()
+        oldest_recent_id = recent[0][0] if recent else None
+        return summary, through_id, [line for _, line in recent], oldest_recent_id
+
+    def _archived_after(self, chat_session_pk, through_id, before_id=None):
+        """Messages from the session's chat_archive blob after through_id, oldest first"""
+        archive = db.session.get(ChatArchive, chat_session_pk)
+        if archive is None:
+            return []
+        return [_Message(m['id'], m['is_user'], m['message']) for m in archived_messages(archive)
+                if m['id'] > through_id and (before_id is None or m['id'] < before_id)]
+
+    def context_for(self, chat_session_pk):
+        """Conversation history text for the next prompt, or None for a new session"""
+        if not self.enabled:
+            return None
+        summary, _, recent, _ = self._window(chat_session_pk)
+        parts = []
+        if summary:
+            parts.append(f"(Summary of earlier conversation) {summary}")
+        parts.extend(recent)
+        return "\n".join(parts) or None
+
+    def _pending_for_summary(self, chat_session_pk):
+        """Messages that left the recent window but are not yet in the summary"""
+        with self.app.app_context():
+            summary, through_id, _, oldest_recent_id = self._window(chat_session_pk)
+            query = db.session.query(ChatMessage.id, ChatMessage.is_user, ChatMessage.message).filter(
+                ChatMessage.session_id == chat_session_pk,
+                ChatMessage.id > through_id
+            )
+            if oldest_recent_id is not None:
+                query = query.filter(ChatMessage.id < oldest_recent_id)
+            # Archived ids all precede live ones, so archived messages come first
+            limit = self.max_messages * 4
+            rows = self._archived_after(chat_session_pk, through_id, oldest_recent_id)[:limit]
+            if len(rows) < limit:
+                rows += query.order_by(ChatMessage.id).limit(limit - len(rows)).all()
+            db.session.remove()
+        return summary, rows
+
+    def _store_summary(self, chat_session_pk, summary, through_id):
+        with self.app.app_context():
+            db.session.query(ChatSession).filter(ChatSession.id == chat_session_pk).update({
+                'summary': summary,
+                'summary_through_id': through_id,
+                'summary_updated_at': datetime.utcnow(),
+            })
+            db.session.commit()
+            db.session.remove()
+
+    async def _refresh(self, chat_session_pk):
+        try:
+            summary, rows = await asyncio.to_thread(self._pending_for_summary, chat_session_pk)
+            if len(rows) < self.summary_batch:
+                return
+            transcript = "\n".join(format_message(row.is_user, row.message) for row in rows)
+            max_words = max(int(self.summary_tokens * 0.75), 20)
+            new_summary = await summarize_conversation_async(summary, transcript, max_words)
+            new_summary = _truncate_to_tokens(new_summary, self.summary_tokens)
+            await asyncio.to_thread(self._store_summary, chat_session_pk, new_summary, rows[-1].id)
+            self.summaries_written += 1
+        except Exception as e:
+            logging.warning(f"Conversation summary refresh failed for session {chat_session_pk}: {e}")
+        finally:
+            self._refreshing.discard(chat_session_pk)
+
+    def schedule_refresh(self, chat_session_pk):
+        """Fold messages that left the recent window into the summary, in the background"""
+        if not self.enabled or chat_session_pk in self._refreshing:
+            return
+        self._refreshing.add(chat_session_pk)
+        llm_runtime.submit(self._refresh(chat_session_pk))
+
+
+conversation_memory = ConversationMemory()
@@ -0,0 +1,199 @@
+"""Write-behind persistence for chat messages.
+
+With CHAT_WRITE_BEHIND=1 each chat turn is queued in process and a
+background thread inserts queued messages in batches (every
+CHAT_WRITE_BATCH_SIZE rows or CHAT_WRITE_FLUSH_INTERVAL seconds, whichever
+comes first). On SQLite this turns one write-lock acquisition per chat turn
+into one per batch. The queue is bounded; when it is full the turn is written
+synchronously instead, so a stalled writer slows requests down rather than
+losing messages. Pending messages are flushed when the process exits.
+
+A failed batch is retried with backoff for up to CHAT_WRITE_RETRY_SECONDS,
+which rides out a short database outage. Rows the database rejects outright
+are not retried. Either way the batch is then written turn by turn, so only
+the turns that still fail are dropped, counted in ``failed`` and logged.
+
+Leave CHAT_WRITE_BEHIND unset for read-after-write: messages are then
+committed before the response is returned, as before.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from extensions import db
+from models import ChatMessage
+
+_STOP = object()
+
+# Longest pause between retries of a failed batch
+MAX_RETRY_DELAY = 5.0
+
+
+class ChatMessageWriter:
+    """Queues ChatMessage rows and inserts them in batches from a background thread"""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.batch_size = 200
+        self.flush_interval = 0.5
+        self.retry_seconds = 30.0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._bound_pid = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.sync_writes = 0
+        self.failed = 0
+
+    def init_app(self, app):
+        # One writer per process, bound to the first app built in it. A later
+        # create_app() in the same process (gunicorn's on_starting, a CLI
+        # helper) must not swap the queue or point the writer at another engine.
+        if self.app is not None and self._bound_pid == os.getpid():
+            return
+        first_binding = self._bound_pid is None
+        self.app = app
+        self._bound_pid = os.getpid()
+        app.extensions['chat_writer'] = self
+        self.enabled = app.config.get("CHAT_WRITE_BEHIND", False)
+        self.batch_size = app.config.get("CHAT_WRITE_BATCH_SIZE", 200)
+        self.flush_interval = app.config.get("CHAT_WRITE_FLUSH_INTERVAL", 0.5)
+        self.retry_seconds = app.config.get("CHAT_WRITE_RETRY_SECONDS", 30.0)
+        self._queue = queue.Queue(maxsize=app.config.get("CHAT_WRITE_QUEUE_SIZE", 10000))
+        if self.enabled and first_binding:
+            # Inherited across fork; shutdown() only acts in the process running the thread
+            atexit.register(self.shutdown)
+
+    def _ensure_thread(self):
+        # Started lazily and again after a fork, since threads don't survive fork
+        if self._thread is None or self._pid != os.getpid():
+            with self._lock:
+                if self._thread is None or self._pid != os.getpid():
+                    if self._pid != os.getpid():
+                        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+                    self._thread.start()
+
+    def save(self, rows):
+        """Persist a list of ChatMessage column dicts (one chat turn)"""
+        if not rows:
+            return
+        now = datetime.utcnow()
+        for row in rows:
+            row.setdefault('timestamp', now)
+
+        if self.enabled:
+            self._ensure_thread()
+            try:
+                self._queue.put_nowait(rows)
+                return
+            except queue.Full:
+                logging.warning("Chat write-behind queue full; writing synchronously")
+
+        db.session.execute(insert(ChatMessage), rows)
+        db.session.commit()
+        self.sync_writes += 1
+
+    def _run(self):
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(pending)
+                self._queue.task_done()
+                return
+            if item is not None:
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            row_count = sum(len(rows) for rows in pending)
+            if pending and (row_count >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(pending)
+                pending, deadline = [], None
+
+    def _flush(self, pending):
+        if not pending:
+            return
+        rows = [row for rows in pending for row in rows]
+        if self._insert(rows, self.retry_seconds):
+            self.written += len(rows)
+            self.batches += 1
+        else:
+            # Write turn by turn so only the turns that still fail are lost
+            dropped = []
+            for turn in pending:
+                if self._insert(turn, 0):
+                    self.written += len(turn)
+                else:
+                    dropped.append(turn)
+            if dropped:
+                self.failed += sum(len(turn) for turn in dropped)
+                sessions = sorted({row['session_id'] for turn in dropped for row in turn})
+                logging.error(f"Dropped {sum(len(turn) for turn in dropped)} chat messages from "
+                              f"{len(dropped)} of {len(pending)} turns (chat sessions {sessions})")
+        for _ in pending:
+            self._queue.task_done()
+
+    def _insert(self, rows, retry_seconds):
+        """Insert rows in one transaction, retrying with backoff; returns whether they were written"""
+        deadline = time.monotonic() + retry_seconds
+        attempt = 0
+        while True:
+            try:
+                with self.app.app_context():
+                    db.session.execute(insert(ChatMessage), rows)
+                    db.session.commit()
+                return True
+            except (IntegrityError, DataError) as e:
+                # The rows themselves are rejected; retrying won't help
+                logging.error(f"Chat write-behind insert of {len(rows)} rows rejected: {e}")
+                return False
+            except Exception as e:
+                attempt += 1
+                delay = min(0.1 * 2 ** attempt, MAX_RETRY_DELAY)
+                if time.monotonic() + delay > deadline:
+                    logging.error(f"Chat write-behind insert of {len(rows)} rows failed: {e}")
+                    return False
+                logging.warning(f"Chat write-behind insert failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+
+    def flush(self):
+        """Block until every queued message has been written"""
+        if self.enabled and self._thread is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def shutdown(self, timeout=10):
+        """Flush pending messages and stop the writer thread"""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            'write_behind': self.enabled,
+            'queued_turns': self._queue.qsize() if self._queue else 0,
+            'written': self.written,
+            'batches': self.batches,
+            'sync_writes': self.sync_writes,
+            'failed': self.failed,
+        }
+
+
+chat_writer = ChatMessageWriter()
@@ -0,0 +1,118 @@
+"""Per-model circuit breakers for Gemini calls.
+
+A breaker opens after GEMINI_BREAKER_FAILURES consecutive failed calls
+(timeouts, 5xx, 429 and connection errors). While it is open, calls to that
+model raise CircuitOpenError at once, so gemini.py returns its fallback
+response in milliseconds instead of waiting for another timeout. After
+GEMINI_BREAKER_RESET seconds the breaker goes half-open and lets a single
+probe call through. If the probe succeeds the breaker closes; if it fails
+the breaker opens for another reset period. Outcomes of calls admitted
+before the breaker opened are ignored while it is open or half-open, so a
+slow straggler can neither close it early nor keep it open.
+
+Breakers are per process and thread-safe. The async model calls and the
+sync streaming path share them.
+"""
+import os
+import threading
+import time
+
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("GEMINI_BREAKER_FAILURES", 5))
+BREAKER_RESET_SECONDS = float(os.environ.get("GEMINI_BREAKER_RESET", 30))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """The model's circuit breaker is open; the call was not attempted"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.short_circuited = 0
+        self.times_opened = 0
+
+    def acquire(self):
+        """Allow a call or raise CircuitOpenError; returns True if this call is the half-open probe"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.short_circuited += 1
+        raise CircuitOpenError(f"Circuit for {self.name} is {self.state}")
+
+    def record_success(self, probe=False):
+        with self._lock:
+            if probe:
+                self._probe_in_flight = False
+                self.state = CLOSED
+            elif self.state != CLOSED:
+                # A straggler admitted before the breaker opened; only the probe decides
+                return
+            self.failures = 0
+
+    def record_failure(self, probe=False):
+        with self._lock:
+            if probe:
+                self._probe_in_flight = False
+            elif self.state != CLOSED:
+                # Stragglers neither extend the open period nor count towards the next one
+                return
+            self.failures += 1
+            if probe or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Give up a probe that ended without a verdict (e.g. cancelled)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.times_opened,
+                'short_circuited': self.short_circuited,
+                'open_for_seconds': round(time.monotonic() - self.opened_at, 1) if self.state != CLOSED else 0,
+            }
+
+
+class BreakerRegistry:
+    """One CircuitBreaker per model name, created on first use"""
+
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def for_model(self, model):
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(model, CircuitBreaker(model))
+        return breaker
+
+    def stats(self):
+        return {model: breaker.stats() for model, breaker in list(self._breakers.items())}
+
+
+breakers = BreakerRegistry()
@@ -0,0 +1,175 @@
+"""Tile-quantized cache of nearby-facility search results.
+
+Searches from nearby points share work. The request point is snapped to a
+tile of FACILITY_CACHE_TILE_DEG degrees and the radius is rounded up to a
+bucket. The second time a (tile, bucket, filters) key misses, one search runs
+from the tile centre. It is wide enough to cover any point in the tile
+(bucket radius plus the centre-to-corner distance), and its candidate records
+are stored. A key seen only once is searched directly, so one-off searches
+cost no more than uncached ones. Cached requests are answered by measuring
+distances from their own point, so results match an uncached search.
+
+Entries are evicted least recently used, bounded both by entry count
+(FACILITY_CACHE_ENTRIES) and by the total records held
+(FACILITY_CACHE_MAX_RECORDS). The cache is tied to the facility data
+version and is cleared when it changes: immediately in the process that
+bumps it, within VERSION_CHECK_INTERVAL seconds everywhere else.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from facility_snapshot import VERSION_CHECK_INTERVAL, current_facility_version
+from spatial import calculate_distance
+
+RADIUS_BUCKETS_KM = (1, 2, 5, 10, 25, 50)
+TILE_DEG = float(os.environ.get("FACILITY_CACHE_TILE_DEG", 0.01))
+MAX_ENTRIES = int(os.environ.get("FACILITY_CACHE_ENTRIES", 1024))
+MAX_RECORDS = int(os.environ.get("FACILITY_CACHE_MAX_RECORDS", 250000))
+# A single entry may use at most this share of MAX_RECORDS
+MAX_ENTRY_SHARE = 0.1
+# Keys remembered by the doorkeeper, as a multiple of MAX_ENTRIES
+SEEN_FACTOR = 4
+
+
+class FacilityResultCache:
+    """LRU of candidate facility records per (tile, radius bucket, filters)"""
+
+    def __init__(self, tile_deg=TILE_DEG, max_entries=MAX_ENTRIES, max_records=MAX_RECORDS,
+                 check_interval=VERSION_CHECK_INTERVAL):
+        self.tile_deg = tile_deg
+        self.max_entries = max_entries
+        self.max_records = max_records
+        self.check_interval = check_interval
+        self._entries = OrderedDict()  # key -> list of records, or None if too large to keep
+        self._records = 0
+        self._seen = OrderedDict()  # keys missed once, not yet cached
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def version(self):
+        """Facility data version, re-read at most every check_interval; clears the cache on change"""
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return self._version
+        version = current_facility_version()
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._seen.clear()
+                self._records = 0
+                self._version = version
+            self._checked_at = now
+        return version
+
+    def invalidate(self):
+        """Drop every entry and re-read the version on the next search"""
+        with self._lock:
+            self._entries.clear()
+            self._records = 0
+            self._checked_at = 0.0
+
+    def _radius_bucket(self, radius_km):
+        return next((bucket for bucket in RADIUS_BUCKETS_KM if radius_km <= bucket), None)
+
+    def _tile_center(self, lat, lng):
+        row = int((lat + 90) // self.tile_deg)
+        col = int((lng + 180) // self.tile_deg)
+        return row, col, (row + 0.5) * self.tile_deg - 90, (col + 0.5) * self.tile_deg - 180
+
+    def _margin_km(self, center_lat, center_lng):
+        """Distance from the tile centre to its farthest corner"""
+        half = self.tile_deg / 2
+        return max(calculate_distance(center_lat, center_lng, center_lat + dlat, center_lng + half)
+                   for dlat in (-half, half)) + 0.001
+
+    def search(self, lat, lng, radius_km, facility_type, k, filters, search):
+        """Return nearby results for an exact point, using the cache when the radius allows
+
+        ``search(lat, lng, radius_km, k)`` runs the real search; it is called
+        directly for radii above the largest bucket.
+        """
+        bucket = self._radius_bucket(radius_km)
+        if bucket is None or self.max_entries <= 0:
+            with self._lock:
+                self.bypassed += 1
+            return search(lat, lng, radius_km, k)
+
+        version = self.version()
+        row, col, center_lat, center_lng = self._tile_center(lat, lng)
+        key = (version, row, col, bucket, facility_type,
+               filters.get('emergency_only', False), filters.get('insurance_only', False),
+               tuple(sorted(filters.get('services', ()))))
+        with self._lock:
+            found = key in self._entries
+            records = self._entries.get(key)
+            if found:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if found and records is None:
+            # Known to be too large to cache
+            return search(lat, lng, radius_km, k)
+        if not found:
+            if not self._seen_before(key):
+                return search(lat, lng, radius_km, k)
+            records = search(center_lat, center_lng, bucket + self._margin_km(center_lat, center_lng), None)
+            self._store(key, records)
+
+        matches = []
+        for record in records:
+            distance = calculate_distance(lat, lng, record['lat'], record['lng'])
+            if distance <= radius_km:
+                matches.append((distance, record))
+        matches.sort(key=lambda match: match[0])
+        if k:
+            matches = matches[:k]
+        return [dict(record, distance=round(distance, 2)) for distance, record in matches]
+
+    def _seen_before(self, key):
+        """Doorkeeper: True on the second miss for a key, so one-off searches don't pay for a fill"""
+        with self._lock:
+            if self._seen.pop(key, None) is not None:
+                return True
+            self._seen[key] = True
+            if len(self._seen) > self.max_entries * SEEN_FACTOR:
+                self._seen.popitem(last=False)
+            return False
+
+    def _store(self, key, records):
+        with self._lock:
+            if key[0] != self._version:
+                return
+            if len(records) > self.max_records * MAX_ENTRY_SHARE:
+                records = None
+            self._entries[key] = records
+            self._records += len(records or ())
+            while self._entries and (len(self._entries) > self.max_entries or self._records > self.max_records):
+                _, evicted = self._entries.popitem(last=False)
+                self._records -= len(evicted or ())
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'records': self._records,
+                'max_entries': self.max_entries,
+                'max_records': self.max_records,
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'facility_version': self._version,
+            }
+
+
+result_cache = FacilityResultCache()
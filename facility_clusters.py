@@ -0,0 +1,211 @@
+"""Precomputed hierarchical facility clusters for map rendering.
+
+Facilities are bucketed into square Web Mercator cells of CLUSTER_CELL_PX
+screen pixels at every zoom level from CLUSTER_MAX_ZOOM down to 0. The finest
+level is built from the facilities themselves. Each coarser level merges the
+2x2 cells below it, so the whole pyramid costs a few vectorized passes. Every
+cell keeps, per facility type, its count, emergency count and coordinate sums,
+so a viewport at any zoom, with or without a type filter, returns clusters
+with exact counts and centroids.
+
+The index lives in each worker process, requires NumPy, and is rebuilt
+when the facility data version changes (see facility_snapshot.py).
+"""
+import logging
+import math
+import os
+import threading
+import time
+from sqlalchemy import select
+from extensions import db
+from facility_snapshot import VERSION_CHECK_INTERVAL, current_facility_version
+from models import MedicalFacility
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+# Above this zoom /api/facility-clusters returns individual facilities
+CLUSTER_MAX_ZOOM = int(os.environ.get("FACILITY_CLUSTER_MAX_ZOOM", 14))
+CLUSTER_CELL_PX = 64
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def _cells_per_axis(zoom):
+    """Number of cells across the world at a zoom level (256 px tiles)"""
+    return (256 << zoom) // CLUSTER_CELL_PX
+
+
+def _mercator(lat, lng):
+    """Project degrees to Web Mercator x, y in [0, 1); y grows southward"""
+    lat = np.clip(lat, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)
+    x = (np.asarray(lng) + 180.0) / 360.0
+    sin_lat = np.sin(np.radians(lat))
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return np.clip(x, 0, 1 - 1e-12), np.clip(y, 0, 1 - 1e-12)
+
+
+class ClusterLevel:
+    """Cells of one zoom level, sorted by key (row * cells_per_axis + col)"""
+
+    def __init__(self, zoom, keys, counts, emergency, sum_lat, sum_lng):
+        self.zoom = zoom
+        self.size = _cells_per_axis(zoom)
+        self.keys = keys            # (cells,)
+        self.counts = counts        # (cells, types)
+        self.emergency = emergency  # (cells, types)
+        self.sum_lat = sum_lat      # (cells, types)
+        self.sum_lng = sum_lng      # (cells, types)
+
+    def parent(self):
+        """Merge 2x2 blocks of cells into the next zoom level out"""
+        rows, cols = np.divmod(self.keys, self.size)
+        parent_keys = (rows // 2) * (self.size // 2) + cols // 2
+        keys, inverse = np.unique(parent_keys, return_inverse=True)
+        arrays = []
+        for values in (self.counts, self.emergency, self.sum_lat, self.sum_lng):
+            merged = np.zeros((len(keys), values.shape[1]), dtype=values.dtype)
+            np.add.at(merged, inverse, values)
+            arrays.append(merged)
+        return ClusterLevel(self.zoom - 1, keys, *arrays)
+
+    def cells_in(self, south, west, north, east):
+        """Indexes of the cells overlapping a lat/lng box; west > east crosses the antimeridian"""
+        (x_west, x_east), (y_north, y_south) = (
+            _mercator(np.array([north, south]), np.array([west, east]))
+        )
+        col_lo, col_hi = int(x_west * self.size), int(x_east * self.size)
+        row_lo, row_hi = int(y_north * self.size), int(y_south * self.size)
+        col_spans = [(col_lo, col_hi)] if west <= east else [(col_lo, self.size - 1), (0, col_hi)]
+        rows = np.arange(row_lo, row_hi + 1, dtype=np.int64) * self.size
+        found = []
+        for lo, hi in col_spans:
+            starts = np.searchsorted(self.keys, rows + lo, side='left')
+            ends = np.searchsorted(self.keys, rows + hi, side='right')
+            lengths = ends - starts
+            # Concatenated ranges start..end of every row, without a Python loop
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+            found.append(offsets + np.arange(lengths.sum()))
+        return np.concatenate(found)
+
+
+class ClusterIndex:
+    """Cluster pyramid for every zoom level up to CLUSTER_MAX_ZOOM"""
+
+    def __init__(self, version, lat, lng, types, emergency, max_zoom=CLUSTER_MAX_ZOOM):
+        self.version = version
+        self.total = len(lat)
+        self.type_names = sorted(set(types))
+        codes = {name: code for code, name in enumerate(self.type_names)}
+        type_code = np.array([codes[name] for name in types], dtype=np.int64)
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        ntypes = max(len(self.type_names), 1)
+
+        size = _cells_per_axis(max_zoom)
+        x, y = _mercator(lat, lng)
+        point_keys = (y * size).astype(np.int64) * size + (x * size).astype(np.int64)
+        keys, inverse = np.unique(point_keys, return_inverse=True)
+        slot = inverse * ntypes + type_code
+        shape = (len(keys), ntypes)
+        cells = len(keys) * ntypes
+
+        def per_cell(weights=None):
+            return np.bincount(slot, weights=weights, minlength=cells).reshape(shape)
+
+        finest = ClusterLevel(
+            max_zoom, keys,
+            per_cell().astype(np.int64),
+            per_cell(np.asarray(emergency, dtype=np.float64)).astype(np.int64),
+            per_cell(lat), per_cell(lng),
+        )
+        self.levels = [finest]
+        while self.levels[-1].zoom > 0:
+            self.levels.append(self.levels[-1].parent())
+        self.levels.reverse()
+
+    @classmethod
+    def load(cls, version):
+        """Read the clustered columns of every facility into a new index"""
+        rows = db.session.execute(select(
+            MedicalFacility.latitude, MedicalFacility.longitude,
+            MedicalFacility.facility_type, MedicalFacility.emergency_services,
+        )).all()
+        lat, lng, types, emergency = zip(*rows) if rows else ((), (), (), ())
+        return cls(version, lat, lng, types, [bool(value) for value in emergency])
+
+    @property
+    def cells(self):
+        return sum(len(level.keys) for level in self.levels)
+
+    def clusters(self, south, west, north, east, zoom, facility_type='all'):
+        """Return cluster dicts for a viewport at a zoom level (clamped to CLUSTER_MAX_ZOOM)"""
+        level = self.levels[max(0, min(zoom, len(self.levels) - 1))]
+        idx = level.cells_in(south, west, north, east)
+        if not len(idx):
+            return []
+        if facility_type and facility_type != 'all':
+            if facility_type not in self.type_names:
+                return []
+            columns = [self.type_names.index(facility_type)]
+        else:
+            columns = list(range(len(self.type_names)))
+
+        counts = level.counts[idx][:, columns]
+        totals = counts.sum(axis=1)
+        keep = totals > 0
+        idx, counts, totals = idx[keep], counts[keep], totals[keep]
+        lat = level.sum_lat[idx][:, columns].sum(axis=1) / totals
+        lng = level.sum_lng[idx][:, columns].sum(axis=1) / totals
+        emergency = level.emergency[idx][:, columns].sum(axis=1)
+        names = [self.type_names[column] for column in columns]
+
+        return [{
+            'lat': round(cluster_lat, 6),
+            'lng': round(cluster_lng, 6),
+            'count': count,
+            'emergency': cluster_emergency,
+            'types': {name: type_count for name, type_count in zip(names, type_counts) if type_count},
+        } for cluster_lat, cluster_lng, count, cluster_emergency, type_counts in zip(
+            lat.tolist(), lng.tolist(), totals.tolist(), emergency.tolist(), counts.tolist())]
+
+
+class ClusterEngine:
+    """Holds this process's ClusterIndex and rebuilds it on version change"""
+
+    def __init__(self, check_interval=VERSION_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._index = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return np is not None
+
+    def invalidate(self):
+        self._checked_at = 0.0
+
+    def get(self):
+        index = self._index
+        if index is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return index
+        with self._lock:
+            index = self._index
+            if index is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return index
+            version = current_facility_version()
+            if index is None or index.version != version:
+                started = time.perf_counter()
+                index = ClusterIndex.load(version)
+                logging.info(
+                    f"Built facility clusters v{version}: {index.total} facilities, {index.cells} cells "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+                )
+                self._index = index
+            self._checked_at = time.monotonic()
+            return index
+
+
+cluster_engine = ClusterEngine()
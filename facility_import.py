@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""Streaming bulk import of medical facilities from public registry files.
+
+    python facility_import.py registry.csv
+    python facility_import.py hospitals.geojson pharmacies.ndjson.gz --chunk-size 2000
+    python facility_import.py registry.csv --dry-run      # validate and count only
+
+CSV, GeoJSON FeatureCollections and NDJSON (one object or GeoJSON Feature
+per line) are read as streams, optionally gzipped. Column names are matched
+case-insensitively with common aliases (lat/lon, type, id, ...).
+
+Every row is validated, keyed by ``MedicalFacility.external_id`` (the
+registry's own id when the file has one, otherwise a hash of name and
+address), and upserted in chunks: a lookup of existing keys, one
+executemany INSERT, one executemany UPDATE and a rewrite of the chunk's
+service links, committed per chunk so memory and transaction size stay
+bounded. Rows repeated within a chunk are
+deduplicated (last one wins); a repeat in a later chunk updates the row
+again. Run one import at a time.
+
+grid_cell is computed per row, so the spatial index is current as chunks
+commit. When the import finishes, the facility data version is bumped once so
+every worker reloads its facility snapshot, and table statistics are
+refreshed so the planner sees the new row counts.
+"""
+import argparse
+import csv
+import functools
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+import time
+from sqlalchemy import bindparam, insert, text
+from extensions import db
+from models import MedicalFacility, facility_natural_key, link_facility_services
+from spatial import grid_cell_for
+
+FACILITY_TYPES = ('hospital', 'clinic', 'pharmacy', 'urgent_care')
+TYPE_ALIASES = {
+    'urgentcare': 'urgent_care', 'urgent': 'urgent_care', 'walk_in_clinic': 'clinic',
+    'health_center': 'clinic', 'drugstore': 'pharmacy', 'chemist': 'pharmacy',
+}
+
+# model field -> accepted source column names, lower-case
+FIELD_ALIASES = {
+    'external_id': ('external_id', 'id', 'facility_id', 'registry_id'),
+    'name': ('name', 'facility_name'),
+    'facility_type': ('facility_type', 'type', 'category'),
+    'address': ('address', 'full_address', 'street_address'),
+    'latitude': ('latitude', 'lat', 'y'),
+    'longitude': ('longitude', 'lng', 'lon', 'long', 'x'),
+    'phone': ('phone', 'telephone', 'phone_number'),
+    'website': ('website', 'url'),
+    'services': ('services',),
+    'emergency_services': ('emergency_services', 'emergency'),
+    'accepts_insurance': ('accepts_insurance', 'insurance'),
+}
+MAX_LENGTHS = {'external_id': 120, 'name': 200, 'address': 300, 'phone': 20, 'website': 200}
+
+FORMATS = {'.csv': 'csv', '.geojson': 'geojson', '.json': 'geojson',
+           '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.geojsonl': 'ndjson'}
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 20
+# A single GeoJSON feature larger than this is treated as a malformed file
+MAX_FEATURE_BYTES = 16 * 1024 * 1024
+READ_SIZE = 64 * 1024
+
+_FEATURES_START = re.compile(r'"features"\s*:\s*\[')
+_TRUE = {'1', 'true', 't', 'yes', 'y'}
+_FALSE = {'0', 'false', 'f', 'no', 'n', ''}
+
+
+class InvalidRow(ValueError):
+    """A source row that can't be imported"""
+
+
+# Readers: each yields (position, record dict or InvalidRow)
+
+def read_csv(f):
+    for line, row in enumerate(csv.DictReader(f), start=2):
+        yield line, row
+
+
+def _feature_record(feature):
+    """Flatten a GeoJSON Point feature into a plain record"""
+    if not isinstance(feature, dict):
+        return InvalidRow("feature is not an object")
+    record = dict(feature.get('properties') or {})
+    if feature.get('id') is not None:
+        record.setdefault('external_id', feature['id'])
+    geometry = feature.get('geometry') or {}
+    if geometry.get('type') != 'Point':
+        return InvalidRow(f"geometry must be a Point, got {geometry.get('type')}")
+    coordinates = geometry.get('coordinates') or []
+    if len(coordinates) < 2:
+        return InvalidRow("Point has no coordinates")
+    record['longitude'], record['latitude'] = coordinates[0], coordinates[1]
+    return record
+
+
+def read_ndjson(f):
+    for line, raw in enumerate(f, start=1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            yield line, InvalidRow(f"invalid JSON: {e}")
+            continue
+        if isinstance(record, dict) and record.get('type') == 'Feature':
+            record = _feature_record(record)
+        elif not isinstance(record, dict):
+            record = InvalidRow("line is not a JSON object")
+        yield line, record
+
+
+def read_geojson(f):
+    """Yield features of a FeatureCollection one at a time without loading the whole file"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    while True:
+        chunk = f.read(READ_SIZE)
+        buffer += chunk
+        match = _FEATURES_START.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        if not chunk:
+            raise ValueError('No "features" array found')
+        # Keep a tail in case the key is split across reads
+        buffer = buffer[-64:]
+
+    number = 0
+    eof = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if buffer.startswith(']'):
+            return
+        if buffer:
+            try:
+                feature, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # Usually a feature cut off at the end of the buffer
+                if eof or len(buffer) > MAX_FEATURE_BYTES:
+                    raise ValueError(f"Malformed GeoJSON after feature {number}")
+            else:
+                number += 1
+                yield number, _feature_record(feature)
+                buffer = buffer[end:]
+                continue
+        if eof:
+            raise ValueError("GeoJSON features array is not terminated")
+        chunk = f.read(READ_SIZE)
+        eof = not chunk
+        buffer += chunk
+
+
+READERS = {'csv': read_csv, 'geojson': read_geojson, 'ndjson': read_ndjson}
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return FORMATS.get(os.path.splitext(name)[1].lower())
+
+
+def open_source(path):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, encoding='utf-8-sig', newline='')
+
+
+# Validation
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _coordinate(value, name, limit):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise InvalidRow(f"{name} is missing or not a number: {value!r}")
+    if not -limit <= number <= limit:
+        raise InvalidRow(f"{name} out of range: {number}")
+    return number
+
+
+def _flag(value, default):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return default if value == '' else False
+    raise InvalidRow(f"expected a yes/no value, got {value!r}")
+
+
+def _services(value):
+    """Services as a JSON list string; accepts a list, a JSON list or a ; | , separated string"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith('['):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise InvalidRow(f"services is not a valid JSON list: {value[:50]!r}")
+        else:
+            separator = next((sep for sep in ';|' if sep in value), ',')
+            value = value.split(separator)
+    if not isinstance(value, list):
+        raise InvalidRow("services must be a list")
+    services = [str(service).strip() for service in value if str(service).strip()]
+    return json.dumps(services) if services else None
+
+
+def _facility_type(value):
+    value = re.sub(r"[\s-]+", '_', (_text(value) or '').lower())
+    value = TYPE_ALIASES.get(value, value)
+    if value not in FACILITY_TYPES:
+        raise InvalidRow(f"unknown facility type {value!r}")
+    return value
+
+
+@functools.lru_cache(maxsize=256)
+def _field_sources(keys):
+    """Map each model field to the source column that supplies it, for one set of column names"""
+    lowered = {}
+    for key in keys:
+        if key is not None:
+            lowered.setdefault(str(key).strip().lower(), key)
+    sources = {}
+    for name, aliases in FIELD_ALIASES.items():
+        sources[name] = next((lowered[alias] for alias in aliases if alias in lowered), None)
+    return sources
+
+
+def normalize_record(record):
+    """Turn a source record into a medical_facility row dict or raise InvalidRow"""
+    if isinstance(record, InvalidRow):
+        raise record
+    # CSV rows share one header, so the alias lookup is done once per file
+    sources = _field_sources(tuple(record))
+
+    def field(name):
+        source = sources[name]
+        return record.get(source) if source is not None else None
+
+    row = {
+        'name': _text(field('name')),
+        'address': _text(field('address')),
+        'facility_type': _facility_type(field('facility_type')),
+        'latitude': _coordinate(field('latitude'), 'latitude', 90),
+        'longitude': _coordinate(field('longitude'), 'longitude', 180),
+        'phone': _text(field('phone')),
+        'website': _text(field('website')),
+        'services': _services(field('services')),
+        'emergency_services': _flag(field('emergency_services'), False),
+        'accepts_insurance': _flag(field('accepts_insurance'), True),
+    }
+    if not row['name']:
+        raise InvalidRow("name is required")
+    if not row['address']:
+        raise InvalidRow("address is required")
+    row['external_id'] = _text(field('external_id')) or facility_natural_key(row['name'], row['address'])
+    for name, limit in MAX_LENGTHS.items():
+        if row[name] and len(row[name]) > limit:
+            raise InvalidRow(f"{name} is longer than {limit} characters")
+    # Core inserts skip the ORM events that normally set this
+    row['grid_cell'] = grid_cell_for(row['latitude'], row['longitude'])
+    return row
+
+
+# Writing
+
+_facility_table = MedicalFacility.__table__
+_UPDATE_BY_ID = _facility_table.update().where(_facility_table.c.id == bindparam('_id'))
+
+
+def _write_chunk(rows, stats, dry_run):
+    """Upsert one chunk of rows keyed by external_id and commit it"""
+    keys = [row['external_id'] for row in rows]
+    existing = dict(
+        db.session.query(MedicalFacility.external_id, MedicalFacility.id)
+        .filter(MedicalFacility.external_id.in_(keys))
+    )
+    inserts = [row for row in rows if row['external_id'] not in existing]
+    updates = [dict(row, _id=existing[row['external_id']]) for row in rows if row['external_id'] in existing]
+    stats['inserted'] += len(inserts)
+    stats['updated'] += len(updates)
+    if dry_run:
+        db.session.rollback()
+        return
+    if inserts:
+        db.session.execute(insert(_facility_table), inserts)
+        existing.update(
+            db.session.query(MedicalFacility.external_id, MedicalFacility.id)
+            .filter(MedicalFacility.external_id.in_([row['external_id'] for row in inserts]))
+        )
+    if updates:
+        db.session.execute(_UPDATE_BY_ID, updates)
+    # Core writes skip the ORM events that keep the service links in step
+    link_facility_services(db.session.connection(),
+                           {existing[row['external_id']]: row['services'] for row in rows})
+    db.session.commit()
+
+
+def _finish_import():
+    """Bump the facility version so snapshots reload, and refresh planner statistics"""
+    from facility_snapshot import bump_facility_version
+    bump_facility_version()
+    db.session.commit()
+    if db.engine.dialect.name in ('sqlite', 'postgresql'):
+        try:
+            db.session.execute(text("ANALYZE medical_facility"))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.warning(f"Could not analyze medical_facility: {e}")
+
+
+def import_records(records, chunk_size=CHUNK_SIZE, dry_run=False, progress=None):
+    """Validate, dedupe and upsert (position, record) pairs; returns import stats
+
+    Must run inside an app context. ``progress(stats)`` is called after each chunk.
+    """
+    stats = {'read': 0, 'inserted': 0, 'updated': 0, 'duplicates': 0, 'invalid': 0}
+    errors = []
+    chunk = {}
+    started = time.perf_counter()
+
+    for position, record in records:
+        stats['read'] += 1
+        try:
+            row = normalize_record(record)
+        except InvalidRow as e:
+            stats['invalid'] += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(f"{position}: {e}")
+            continue
+        if row['external_id'] in chunk:
+            stats['duplicates'] += 1
+        chunk[row['external_id']] = row
+        if len(chunk) >= chunk_size:
+            _write_chunk(list(chunk.values()), stats, dry_run)
+            chunk.clear()
+            if progress:
+                progress(dict(stats, seconds=time.perf_counter() - started))
+    if chunk:
+        _write_chunk(list(chunk.values()), stats, dry_run)
+
+    if not dry_run and (stats['inserted'] or stats['updated']):
+        _finish_import()
+    elapsed = time.perf_counter() - started
+    stats['seconds'] = round(elapsed, 2)
+    stats['rows_per_second'] = round(stats['read'] / elapsed) if elapsed > 0 else 0
+    stats['errors'] = errors
+    return stats
+
+
+def import_file(path, file_format=None, **kwargs):
+    """Import one CSV, GeoJSON or NDJSON file (optionally .gz); returns import stats"""
+    file_format = file_format or detect_format(path)
+    if file_format not in READERS:
+        raise ValueError(f"Can't tell the format of {path}; pass --format")
+    with open_source(path) as f:
+        return import_records(READERS[file_format](f), **kwargs)
+
+
+def _print_progress(stats):
+    rate = stats['read'] / stats['seconds'] if stats['seconds'] else 0
+    print(f"  {stats['read']:>10,} rows  {stats['inserted']:>10,} new  {stats['updated']:>10,} updated  "
+          f"{rate:>8,.0f} rows/s", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help="files to import ('-' reads stdin, needs --format)")
+    parser.add_argument('--format', choices=sorted(READERS), help='override detection from the file extension')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help='validate and count without writing')
+    parser.add_argument('--quiet', action='store_true', help='no per-chunk progress')
+    args = parser.parse_args(argv)
+
+    from app import create_app, init_db
+    app = create_app()
+    init_db(app)
+
+    failed = False
+    with app.app_context():
+        for path in args.paths:
+            print(f"Importing {path}{' (dry run)' if args.dry_run else ''}")
+            progress_every = max(1, 50000 // args.chunk_size)
+            chunks = [0]
+
+            def progress(stats):
+                chunks[0] += 1
+                if not args.quiet and chunks[0] % progress_every == 0:
+                    _print_progress(stats)
+
+            try:
+                stats = import_file(path, args.format, chunk_size=args.chunk_size,
+                                    dry_run=args.dry_run, progress=progress)
+            except (OSError, ValueError) as e:
+                db.session.rollback()
+                print(f"  failed: {e}")
+                failed = True
+                continue
+            print(f"  {stats['read']:,} rows read: {stats['inserted']:,} new, {stats['updated']:,} updated, "
+                  f"{stats['duplicates']:,} duplicates, {stats['invalid']:,} invalid "
+                  f"in {stats['seconds']:.1f}s ({stats['rows_per_second']:,} rows/s)")
+            for error in stats['errors']:
+                print(f"    {error}")
+            if stats['invalid'] > len(stats['errors']):
+                print(f"    ... and {stats['invalid'] - len(stats['errors']):,} more invalid rows")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""Indexed nearby-facility queries backed by the spatial grid in spatial.py"""
+import json
+from sqlalchemy import exists, or_, select, text
+from extensions import db
+from models import MedicalFacility, Service, facility_service
+from spatial import (GRID_ROWS, bbox_cell_ranges, bounding_box, calculate_distance,
+                     cell_ranges, grid_cell_for, ring_band_ranges, ring_coverage_km)
+
+# Above this many key ranges the OR chain gets long enough to slow the planner
+# (and SQLite caps expression depth). Radius and box searches then fall back to
+# one covering range, bounded by their lat/lng filters; k-nearest rings are
+# split into several queries instead (_range_chunks).
+MAX_RANGE_TERMS = 64
+
+KNN_MAX_RADIUS_KM = 250.0
+KNN_MAX = 100
+
+
+def _grid_filter(ranges):
+    """Build an indexed filter on MedicalFacility.grid_cell for key ranges"""
+    if len(ranges) > MAX_RANGE_TERMS:
+        ranges = [(min(lo for lo, _ in ranges), max(hi for _, hi in ranges))]
+    terms = []
+    for lo, hi in ranges:
+        if lo == hi:
+            terms.append(MedicalFacility.grid_cell == lo)
+        else:
+            terms.append(MedicalFacility.grid_cell.between(lo, hi))
+    return or_(*terms)
+
+
+def _range_chunks(ranges):
+    """Merge touching key ranges and split them into groups of at most MAX_RANGE_TERMS"""
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return [merged[i:i + MAX_RANGE_TERMS] for i in range(0, len(merged), MAX_RANGE_TERMS)]
+
+
+def _base_query(facility_type, emergency_only=False, insurance_only=False, services=()):
+    query = MedicalFacility.query
+    if facility_type and facility_type != 'all':
+        query = query.filter(MedicalFacility.facility_type == facility_type)
+    if emergency_only:
+        query = query.filter(MedicalFacility.emergency_services.is_(True))
+    if insurance_only:
+        query = query.filter(MedicalFacility.accepts_insurance.is_(True))
+    for slug in services:
+        # Correlated so the grid index still drives the scan; each candidate
+        # is one probe of the facility_service primary key
+        service_id = select(Service.id).where(Service.slug == slug).scalar_subquery()
+        query = query.filter(exists().where(
+            facility_service.c.facility_id == MedicalFacility.id,
+            facility_service.c.service_id == service_id,
+        ))
+    return query
+
+
+def facility_record(facility):
+    """Serialize a facility for search results, without the distance"""
+    return {
+        'id': facility.id,
+        'name': facility.name,
+        'type': facility.facility_type,
+        'address': facility.address,
+        'lat': facility.latitude,
+        'lng': facility.longitude,
+        'phone': facility.phone,
+        'website': facility.website,
+        'services': json.loads(facility.services) if facility.services else [],
+        'emergency_services': facility.emergency_services,
+        'accepts_insurance': facility.accepts_insurance,
+    }
+
+
+def facilities_within(lat, lng, radius_km, facility_type='all', **filters):
+    """Return [(facility, distance_km)] within radius_km, nearest first"""
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    query = _base_query(facility_type, **filters).filter(
+        _grid_filter(cell_ranges(lat, lng, radius_km)),
+        MedicalFacility.latitude.between(min_lat, max_lat),
+    )
+    if min_lng >= -180 and max_lng <= 180:
+        query = query.filter(MedicalFacility.longitude.between(min_lng, max_lng))
+
+    results = []
+    for facility in query.all():
+        distance = calculate_distance(lat, lng, facility.latitude, facility.longitude)
+        if distance <= radius_km:
+            results.append((facility, distance))
+    results.sort(key=lambda item: item[1])
+    return results
+
+
+def facilities_in_bbox(south, west, north, east, facility_type='all', limit=None, **filters):
+    """Return facilities inside a box, at most limit; west > east crosses the antimeridian"""
+    unwrapped_east = east + 360 if west > east else east
+    query = _base_query(facility_type, **filters).filter(
+        _grid_filter(bbox_cell_ranges(south, north, west, unwrapped_east)),
+        MedicalFacility.latitude.between(south, north),
+    )
+    if west <= east:
+        query = query.filter(MedicalFacility.longitude.between(west, east))
+    else:
+        query = query.filter(or_(MedicalFacility.longitude >= west, MedicalFacility.longitude <= east))
+    if limit:
+        query = query.limit(limit)
+    return query.all()
+
+
+def nearest_facilities(lat, lng, k, facility_type='all', max_radius_km=KNN_MAX_RADIUS_KM, **filters):
+    """Return the k nearest [(facility, distance_km)] within max_radius_km
+
+    Scans outward in square rings of grid cells, doubling the ring width each
+    round, and stops once k candidates are closer than the distance the
+    scanned rings are guaranteed to cover.
+    """
+    k = max(1, min(int(k), KNN_MAX))
+    candidates = {}
+    inner, outer = -1, 1
+    while True:
+        # A ring has no lat/lng bound, so a collapsed range would scan a band around the globe
+        for ranges in _range_chunks(ring_band_ranges(lat, lng, inner, outer)):
+            query = _base_query(facility_type, **filters).filter(_grid_filter(ranges))
+            for facility in query.all():
+                if facility.id not in candidates:
+                    distance = calculate_distance(lat, lng, facility.latitude, facility.longitude)
+                    if distance <= max_radius_km:
+                        candidates[facility.id] = (facility, distance)
+
+        covered = ring_coverage_km(lat, outer)
+        within = sorted((item for item in candidates.values() if item[1] <= covered),
+                        key=lambda item: item[1])
+        if len(within) >= k or covered >= max_radius_km or outer >= GRID_ROWS:
+            break
+        inner, outer = outer, outer * 2
+
+    return sorted(candidates.values(), key=lambda item: item[1])[:k]
+
+
+def rebuild_grid_cells(only_missing=False):
+    """Recompute MedicalFacility.grid_cell for stored rows, returns rows updated"""
+    query = db.session.query(MedicalFacility.id, MedicalFacility.latitude, MedicalFacility.longitude)
+    if only_missing:
+        query = query.filter(MedicalFacility.grid_cell.is_(None))
+    updates = [{'id': row.id, 'grid_cell': grid_cell_for(row.latitude, row.longitude)}
+               for row in query.all()]
+    if updates:
+        db.session.execute(
+            text("UPDATE medical_facility SET grid_cell = :grid_cell WHERE id = :id"), updates
+        )
+        db.session.commit()
+    return len(updates)
+
@@ -0,0 +1,177 @@
+"""Optional in-memory columnar snapshot of medical facilities.
+
+When enabled (FACILITY_SNAPSHOT=1) and NumPy is installed, nearby-facility
+searches are answered from NumPy arrays held in each worker process instead
+of the database: haversine distances, filters and top-k selection run over
+the whole table in a few vectorized operations, and result dicts are built
+once at load time.
+
+The snapshot is tagged with the ``facilities`` row of ``DataVersion``. Any
+code path that changes facilities calls ``bump_facility_version()`` in the
+same transaction, and every worker reloads once it notices the new version.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import text
+from extensions import db
+from facility_search import KNN_MAX, facility_record
+from models import DataVersion, MedicalFacility, service_slug
+from spatial import EARTH_RADIUS_KM
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+FACILITY_VERSION_KEY = 'facilities'
+
+# How often a worker re-reads the version stamp; bounds how stale a snapshot
+# can be after another process imports facilities.
+VERSION_CHECK_INTERVAL = 2.0
+
+
+def bump_facility_version():
+    """Mark facility data as changed; commit with the caller's transaction"""
+    result = db.session.execute(
+        text("UPDATE data_version SET version = version + 1, updated_at = :now WHERE name = :name"),
+        {'name': FACILITY_VERSION_KEY, 'now': datetime.utcnow()}
+    )
+    if result.rowcount == 0:
+        db.session.add(DataVersion(name=FACILITY_VERSION_KEY, version=1))
+    snapshot_engine.invalidate()
+    from facility_cache import result_cache
+    from facility_clusters import cluster_engine
+    result_cache.invalidate()
+    cluster_engine.invalidate()
+
+
+def current_facility_version():
+    """Return the stored facility data version (0 if never bumped)"""
+    row = db.session.get(DataVersion, FACILITY_VERSION_KEY)
+    return row.version if row else 0
+
+
+class FacilitySnapshot:
+    """Columnar, read-only copy of the facility table"""
+
+    def __init__(self, version, records):
+        self.version = version
+        self.records = records
+        self.loaded_at = time.time()
+        self.type_codes = {}
+        types = []
+        service_rows = {}
+        for row, record in enumerate(records):
+            types.append(self.type_codes.setdefault(record['type'], len(self.type_codes)))
+            for name in record['services']:
+                service_rows.setdefault(service_slug(name), []).append(row)
+        # service slug -> indexes of the facilities offering it
+        self.service_rows = {slug: np.array(rows, dtype=np.int64) for slug, rows in service_rows.items()}
+
+        lat = np.array([record['lat'] for record in records], dtype=np.float64)
+        lng = np.array([record['lng'] for record in records], dtype=np.float64)
+        self.lat_rad = np.radians(lat)
+        self.lng_rad = np.radians(lng)
+        self.cos_lat = np.cos(self.lat_rad)
+        self.type_code = np.array(types, dtype=np.int32)
+        self.emergency = np.array([bool(record['emergency_services']) for record in records], dtype=bool)
+        self.insurance = np.array([bool(record['accepts_insurance']) for record in records], dtype=bool)
+
+    @classmethod
+    def load(cls, version):
+        """Read every facility into a new snapshot"""
+        facilities = MedicalFacility.query.order_by(MedicalFacility.id).all()
+        return cls(version, [facility_record(facility) for facility in facilities])
+
+    def __len__(self):
+        return len(self.records)
+
+    def distances(self, lat, lng):
+        """Haversine distance in km from a point to every facility"""
+        lat_rad = np.radians(lat)
+        half_dlat = (self.lat_rad - lat_rad) / 2
+        half_dlng = (self.lng_rad - np.radians(lng)) / 2
+        a = np.sin(half_dlat) ** 2 + np.cos(lat_rad) * self.cos_lat * np.sin(half_dlng) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    def search(self, lat, lng, radius_km, facility_type='all', k=None,
+               emergency_only=False, insurance_only=False, services=()):
+        """Return result dicts within radius_km, nearest first, at most k of them"""
+        if not self.records:
+            return []
+        distance = self.distances(lat, lng)
+        mask = distance <= radius_km
+        if facility_type and facility_type != 'all':
+            code = self.type_codes.get(facility_type)
+            if code is None:
+                return []
+            mask &= self.type_code == code
+        if emergency_only:
+            mask &= self.emergency
+        if insurance_only:
+            mask &= self.insurance
+        for slug in services:
+            rows = self.service_rows.get(slug)
+            if rows is None:
+                return []
+            offering = np.zeros(len(self.records), dtype=bool)
+            offering[rows] = True
+            mask &= offering
+
+        idx = np.flatnonzero(mask)
+        if k:
+            # Same bounds as nearest_facilities, so both engines return the same rows
+            k = max(1, min(int(k), KNN_MAX))
+        if k and len(idx) > k:
+            idx = idx[np.argpartition(distance[idx], k - 1)[:k]]
+        idx = idx[np.argsort(distance[idx], kind='stable')]
+        return [dict(self.records[i], distance=round(float(distance[i]), 2)) for i in idx]
+
+
+class FacilitySnapshotEngine:
+    """Holds the current snapshot for this process and reloads it on version change"""
+
+    def __init__(self, check_interval=VERSION_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return np is not None
+
+    def invalidate(self):
+        """Force a version check on the next search"""
+        self._checked_at = 0.0
+
+    def get(self):
+        """Return an up-to-date snapshot, loading or reloading it if needed"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._checked_at < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return snapshot
+            version = current_facility_version()
+            if snapshot is None or snapshot.version != version:
+                started = time.perf_counter()
+                snapshot = FacilitySnapshot.load(version)
+                logging.info(
+                    f"Loaded facility snapshot v{version}: {len(snapshot)} facilities "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+                )
+                self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    def search(self, lat, lng, radius_km, facility_type='all', k=None, **filters):
+        return self.get().search(lat, lng, radius_km, facility_type, k=k, **filters)
+
+
+snapshot_engine = FacilitySnapshotEngine()
@@ -1,10 +1,21 @@
+import asyncio
+import hashlib
 import json
 import logging
 import os
-from google import genai
-from google.genai import types
-from pydantic import BaseModel
+import queue
+import random
+import threading
+import time
+from pydantic import BaseModel, PrivateAttr
 from dotenv import load_dotenv
+import llm_runtime
+import metrics
+from admission import admission, AdmissionRejected
+from circuit_breaker import breakers, CircuitOpenError
+from single_flight import SingleFlight
+from symptom_cache import SymptomCache, cache_key
+from triage import triage, emergency_analysis
 load_dotenv()
 
 # IMPORTANT: KEEP THIS COMMENT
@@ -14,8 +25,70 @@ load_dotenv()
 # - Sometimes the google genai SDK has occasional type errors. You might need to run to validate, at time.  
 # The SDK was recently renamed from google-generativeai to google-genai. This file reflects the new name and the new APIs.
 
-# This API key is from Gemini Developer API Key, not vertex AI API Key
-client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
+# The SDK is imported and the client built on first use in each process, so
+# importing this module is cheap and forking (gunicorn --preload) never
+# shares the client's connection pool between processes.
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Return this process's Gemini client, creating it on first use"""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                # This API key is from Gemini Developer API Key, not vertex AI API Key
+                api_key = os.environ.get("GEMINI_API_KEY")
+                if not api_key:
+                    raise RuntimeError("GEMINI_API_KEY is not set")
+                from google import genai
+                from google.genai import types
+
+                # GEMINI_BASE_URL points the client at another endpoint, e.g. benchmarks/fake_gemini.py
+                base_url = os.environ.get("GEMINI_BASE_URL")
+                _client = genai.Client(
+                    api_key=api_key,
+                    http_options=types.HttpOptions(base_url=base_url) if base_url else None,
+                )
+                _client_pid = os.getpid()
+    return _client
+
+def warm_up():
+    """Import the SDK and build the client ahead of the first request (e.g. in a gunicorn worker)"""
+    try:
+        get_client()
+    except Exception as e:
+        logging.warning(f"Gemini client warm-up failed: {e}")
+
+# Total time allowed for one model call, retries included
+MODEL_DEADLINES = {
+    "gemini-2.5-flash": float(os.environ.get("GEMINI_FLASH_DEADLINE", 20)),
+    "gemini-2.5-pro": float(os.environ.get("GEMINI_PRO_DEADLINE", 60)),
+}
+DEFAULT_DEADLINE = 30.0
+# Retries of transient failures (timeouts, 429, 5xx, connection errors)
+GEMINI_RETRIES = int(os.environ.get("GEMINI_RETRIES", 2))
+RETRY_BASE_DELAY = 0.25
+RETRY_MAX_DELAY = 2.0
+
+# Cache of analyze_symptoms results keyed on normalized symptoms and age band.
+# Set SYMPTOM_CACHE_TTL=0 to disable.
+symptom_cache = SymptomCache(
+    path=os.environ.get("SYMPTOM_CACHE_PATH", os.path.join("instance", "symptom_cache.db")),
+    ttl_seconds=int(os.environ.get("SYMPTOM_CACHE_TTL", 24 * 3600)),
+    max_entries=int(os.environ.get("SYMPTOM_CACHE_MAX_ENTRIES", 5000)),
+)
+
+# Concurrent identical symptom analyses and goal requests share one model call,
+# within this process and across workers on the host. SINGLE_FLIGHT=0 disables.
+single_flight = SingleFlight(
+    path=os.environ.get("SINGLE_FLIGHT_PATH", os.path.join("instance", "single_flight.db")),
+    shared=os.environ.get("SINGLE_FLIGHT_SHARED", "1") == "1",
+    lease_seconds=float(os.environ.get("SINGLE_FLIGHT_LEASE", 90)),
+    enabled=os.environ.get("SINGLE_FLIGHT", "1") == "1",
+    reraise=(AdmissionRejected, CircuitOpenError),
+)
 
 class ChatResponse(BaseModel):
     message: str
@@ -27,6 +100,17 @@ class SymptomAnalysis(BaseModel):
     confidence: float
     recommendations: list
     urgency_level: str
+    # How this analysis was produced: model, cache, rule or fallback. Private,
+    # so it stays out of the model's response schema and model_dump()
+    _source: str = PrivateAttr(default="model")
+
+    @property
+    def source(self) -> str:
+        return self._source
+
+    def from_source(self, source: str) -> "SymptomAnalysis":
+        self._source = source
+        return self
 
 class HealthGoalSuggestion(BaseModel):
     goal_type: str
@@ -36,149 +120,426 @@ class HealthGoalSuggestion(BaseModel):
     unit: str
     timeline_days: int
 
-def generate_chat_response(message: str, persona_type: str, user_context: dict = None) -> str:
-    """Generate AI chat response based on persona type and user context"""
+SYMPTOM_FALLBACK_PREDICTION = "Unable to analyze symptoms. Please consult a healthcare professional."
+CHAT_FALLBACK_RESPONSE = "I'm experiencing technical difficulties. Please try again later."
+
+def build_chat_prompt(message: str, persona_type: str, user_context: dict = None, history: str = None) -> str:
+    """Build the persona-specific chat prompt for a user message and prior conversation"""
+    # Define system prompts for different personas
+    system_prompts = {
+        "senior": (
+            "You are a helpful, patient healthcare assistant designed for senior patients. "
+            "Use simple, clear language. Speak slowly and reassuringly. "
+            "Always ask if they need clarification. Be respectful and understanding. "
+            "Focus on easy-to-understand health information and gentle guidance."
+        ),
+        "pediatric": (
+            "You are a friendly, cheerful healthcare assistant for children. "
+            "Use age-appropriate language, be encouraging and positive. "
+            "Make health topics fun and easy to understand. "
+            "Use friendly analogies and be patient with questions. "
+            "Always maintain a caring, nurturing tone."
+        ),
+        "empathetic": (
+            "You are an empathetic healthcare assistant for anxious or vulnerable patients. "
+            "Be understanding, compassionate, and supportive. "
+            "Listen carefully to concerns and provide reassuring guidance. "
+            "Acknowledge emotions and provide comfort while giving helpful health information. "
+            "Be gentle and non-judgmental."
+        ),
+        "caregiver": (
+            "You are a healthcare assistant designed to support caregivers. "
+            "Understand the stress and challenges of caring for others. "
+            "Provide practical advice, emotional support, and resources. "
+            "Be efficient but compassionate, acknowledging their important role."
+        ),
+        "general": (
+            "You are a professional healthcare assistant. "
+            "Provide accurate, helpful health information and guidance. "
+            "Be clear, informative, and supportive while maintaining medical accuracy."
+        )
+    }
+
+    system_prompt = system_prompts.get(persona_type, system_prompts["general"])
+
+    # Add user context if available
+    context_info = ""
+    if user_context:
+        age = user_context.get('age', '')
+        user_type = user_context.get('user_type', '')
+        if age:
+            context_info += f" The user is {age} years old."
+        if user_type:
+            context_info += f" User type: {user_type}."
+
+    history_info = f"\n\nConversation so far:\n{history}" if history else ""
+
+    full_prompt = f"{system_prompt}{context_info}{history_info}\n\nUser message: {message}"
+    return full_prompt
+
+def _is_transient(error) -> bool:
+    """Failures worth retrying and counting against the model's circuit breaker"""
+    import httpx
+    from google.genai import errors
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    return isinstance(error, errors.APIError) and (error.code == 429 or (error.code or 0) >= 500)
+
+def _retry_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+def _outcome(error) -> str:
+    """Outcome label for metrics"""
+    if error is None:
+        return "ok"
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, AdmissionRejected):
+        return "rejected"
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    return "error"
+
+async def _generate_content(function: str, **kwargs):
+    """Call the model on the shared Gemini loop, recording its time under ``function``"""
+    started = time.perf_counter()
+    error = None
     try:
-        # Define system prompts for different personas
-        system_prompts = {
-            "senior": (
-                "You are a helpful, patient healthcare assistant designed for senior patients. "
-                "Use simple, clear language. Speak slowly and reassuringly. "
-                "Always ask if they need clarification. Be respectful and understanding. "
-                "Focus on easy-to-understand health information and gentle guidance."
-            ),
-            "pediatric": (
-                "You are a friendly, cheerful healthcare assistant for children. "
-                "Use age-appropriate language, be encouraging and positive. "
-                "Make health topics fun and easy to understand. "
-                "Use friendly analogies and be patient with questions. "
-                "Always maintain a caring, nurturing tone."
-            ),
-            "empathetic": (
-                "You are an empathetic healthcare assistant for anxious or vulnerable patients. "
-                "Be understanding, compassionate, and supportive. "
-                "Listen carefully to concerns and provide reassuring guidance. "
-                "Acknowledge emotions and provide comfort while giving helpful health information. "
-                "Be gentle and non-judgmental."
-            ),
-            "caregiver": (
-                "You are a healthcare assistant designed to support caregivers. "
-                "Understand the stress and challenges of caring for others. "
-                "Provide practical advice, emotional support, and resources. "
-                "Be efficient but compassionate, acknowledging their important role."
-            ),
-            "general": (
-                "You are a professional healthcare assistant. "
-                "Provide accurate, helpful health information and guidance. "
-                "Be clear, informative, and supportive while maintaining medical accuracy."
-            )
-        }
-
-        system_prompt = system_prompts.get(persona_type, system_prompts["general"])
-        
-        # Add user context if available
-        context_info = ""
-        if user_context:
-            age = user_context.get('age', '')
-            user_type = user_context.get('user_type', '')
-            if age:
-                context_info += f" The user is {age} years old."
-            if user_type:
-                context_info += f" User type: {user_type}."
-
-        full_prompt = f"{system_prompt}{context_info}\n\nUser message: {message}"
-
-        response = client.models.generate_content(
+        response = await _call_model(**kwargs)
+        metrics.observe_llm_tokens(function, kwargs["model"], getattr(response, "usage_metadata", None))
+        return response
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        metrics.observe_llm_call(function, kwargs["model"], time.perf_counter() - started, _outcome(error))
+
+async def _call_model(**kwargs):
+    """Fails fast with CircuitOpenError while the model's breaker is open, then
+    goes through admission control and GEMINI_MAX_CONCURRENCY. Transient
+    failures are retried with jittered backoff within the model's deadline.
+    """
+    model = kwargs["model"]
+    breaker = breakers.for_model(model)
+    probe = breaker.acquire()
+    try:
+        await admission.admit(model)
+        deadline = time.monotonic() + MODEL_DEADLINES.get(model, DEFAULT_DEADLINE)
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"{model} deadline exceeded")
+                async with llm_runtime.model_slot():
+                    response = await asyncio.wait_for(get_client().aio.models.generate_content(**kwargs), remaining)
+            except Exception as e:
+                if not _is_transient(e):
+                    # The model answered (e.g. a 400), so it is up as far as the breaker is concerned
+                    breaker.record_success(probe)
+                    raise
+                delay = _retry_delay(attempt)
+                if attempt >= GEMINI_RETRIES or time.monotonic() + delay >= deadline:
+                    breaker.record_failure(probe)
+                    raise
+                logging.warning(f"Transient {model} error, retrying in {delay:.2f}s: {e!r}")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_success(probe)
+            return response
+    except BaseException:
+        if probe:
+            breaker.release_probe()
+        raise
+
+async def _chat_response(message: str, persona_type: str, user_context: dict = None, history: str = None) -> str:
+    try:
+        full_prompt = build_chat_prompt(message, persona_type, user_context, history)
+
+        response = await _generate_content(
+            "chat",
             model="gemini-2.5-flash",
             contents=full_prompt
         )
 
         return response.text or "I'm sorry, I couldn't process your message. Please try again."
 
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logging.error(f"Error generating chat response: {e}")
-        return "I'm experiencing technical difficulties. Please try again later."
+        return CHAT_FALLBACK_RESPONSE
 
-def analyze_symptoms(symptoms: list, user_age: str = None) -> SymptomAnalysis:
-    """Analyze symptoms and provide health predictions"""
-    try:
-        symptoms_text = ", ".join(symptoms)
-        age_context = f" for a {user_age}-year-old patient" if user_age else ""
-        
-        system_prompt = (
-            "You are a medical AI assistant. Analyze the provided symptoms and provide "
-            "a preliminary assessment. IMPORTANT: Always remind users to consult healthcare "
-            "professionals for proper diagnosis. Provide general guidance only. "
-            "Rate urgency as: low, medium, high, or emergency. "
-            "Respond with JSON in this format: "
-            "{'prediction': 'description', 'confidence': number, 'recommendations': ['rec1', 'rec2'], 'urgency_level': 'level'}"
-        )
+def generate_chat_response(message: str, persona_type: str, user_context: dict = None, history: str = None) -> str:
+    """Generate AI chat response based on persona type and user context"""
+    return llm_runtime.run(_chat_response(message, persona_type, user_context, history))
+
+async def generate_chat_response_async(message: str, persona_type: str, user_context: dict = None,
+                                       history: str = None) -> str:
+    """Async variant of generate_chat_response"""
+    return await llm_runtime.run_async(_chat_response(message, persona_type, user_context, history))
+
+def admit_chat_stream():
+    """Admit one streamed chat call; raises AdmissionRejected. Call before stream_chat_response"""
+    if breakers.for_model("gemini-2.5-flash").state == "open":
+        # The stream will fall back at once without calling the model
+        return
+    llm_runtime.run(admission.admit("gemini-2.5-flash"))
+
+# Marks the end of a stream in stream_chat_response's chunk queue
+_STREAM_END = object()
 
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=[
-                types.Content(role="user", parts=[types.Part(text=f"Symptoms: {symptoms_text}{age_context}")])
-            ],
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-                response_mime_type="application/json",
-                response_schema=SymptomAnalysis,
-            ),
+async def _stream_chat_chunks(full_prompt: str, emit):
+    """Stream chat text chunks to ``emit`` from the Gemini loop, holding one model slot throughout"""
+    from google.genai import types
+
+    # The HTTP timeout bounds the wait for the first and each later chunk
+    timeout_ms = int(MODEL_DEADLINES["gemini-2.5-flash"] * 1000)
+    async with llm_runtime.model_slot():
+        stream = await get_client().aio.models.generate_content_stream(
+            model="gemini-2.5-flash",
+            contents=full_prompt,
+            config=types.GenerateContentConfig(http_options=types.HttpOptions(timeout=timeout_ms)),
         )
+        async for chunk in stream:
+            if chunk.text:
+                emit(chunk.text)
+
+def stream_chat_response(message: str, persona_type: str, user_context: dict = None, history: str = None):
+    """Yield the AI chat response in text chunks as the model generates them
+
+    The model call runs on the shared Gemini loop and counts against
+    GEMINI_MAX_CONCURRENCY like every other call; chunks are handed back to
+    the request thread through a queue.
+    """
+    produced = False
+    breaker = breakers.for_model("gemini-2.5-flash")
+    probe = False
+    started = time.perf_counter()
+    error = None
+    future = None
+    try:
+        probe = breaker.acquire()
+        full_prompt = build_chat_prompt(message, persona_type, user_context, history)
+
+        chunks = queue.Queue()
+        future = llm_runtime.submit(_stream_chat_chunks(full_prompt, chunks.put))
+        future.add_done_callback(lambda _: chunks.put(_STREAM_END))
+        while True:
+            chunk = chunks.get()
+            if chunk is _STREAM_END:
+                # Raises the stream's error, if any
+                future.result()
+                break
+            produced = True
+            yield chunk
+
+        breaker.record_success(probe)
+        probe = False
+        if not produced:
+            yield "I'm sorry, I couldn't process your message. Please try again."
 
-        raw_json = response.text
-        if raw_json:
-            data = json.loads(raw_json)
-            return SymptomAnalysis(**data)
+    except CircuitOpenError as e:
+        error = e
+        yield CHAT_FALLBACK_RESPONSE
+    except Exception as e:
+        error = e
+        logging.error(f"Error streaming chat response: {e}")
+        if _is_transient(e):
+            breaker.record_failure(probe)
         else:
-            raise ValueError("Empty response from model")
+            breaker.record_success(probe)
+        probe = False
+        if not produced:
+            yield CHAT_FALLBACK_RESPONSE
+    finally:
+        if future is not None and not future.done():
+            # The client went away mid-stream; stop the call and free its slot
+            future.cancel()
+        if probe:
+            breaker.release_probe()
+        metrics.observe_llm_call("stream_chat", "gemini-2.5-flash", time.perf_counter() - started, _outcome(error))
+
+async def _conversation_summary(previous_summary: str, transcript: str, max_words: int) -> str:
+    summary_prompt = (
+        "You maintain a running summary of a conversation between a user and a healthcare assistant. "
+        f"Update the summary with the new messages below in at most {max_words} words. "
+        "Keep health details the user shared (symptoms, conditions, medications, age, goals) "
+        "and any advice already given. Reply with the summary only.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+    )
+
+    response = await _generate_content(
+        "summarize_conversation",
+        model="gemini-2.5-flash",
+        contents=summary_prompt
+    )
+
+    if not response.text:
+        raise ValueError("Empty response from model")
+    return response.text.strip()
+
+def summarize_conversation(previous_summary: str, transcript: str, max_words: int = 200) -> str:
+    """Fold new conversation messages into a rolling summary; raises on failure"""
+    return llm_runtime.run(_conversation_summary(previous_summary, transcript, max_words))
+
+async def summarize_conversation_async(previous_summary: str, transcript: str, max_words: int = 200) -> str:
+    """Async variant of summarize_conversation"""
+    return await llm_runtime.run_async(_conversation_summary(previous_summary, transcript, max_words))
+
+async def _symptom_analysis(symptoms: list, user_age: str = None, decision=None) -> SymptomAnalysis:
+    started = time.perf_counter()
+    decision = decision or triage(symptoms, user_age)
+    source = "model"
+    try:
+        cached = await asyncio.to_thread(symptom_cache.get, symptoms, user_age)
+        if cached:
+            source = "cache"
+            return SymptomAnalysis(**cached).from_source(source)
+
+        async def from_model():
+            started = time.perf_counter()
+            analysis = await _analyze_symptoms_with_model(symptoms, user_age, decision.model)
+            await asyncio.to_thread(symptom_cache.put, symptoms, user_age, analysis.model_dump(),
+                                    (time.perf_counter() - started) * 1000)
+            return analysis.model_dump()
+
+        # Same key as the cache, so callers that would share an entry share the call
+        payload = await single_flight.do('symptoms', cache_key(symptoms, user_age), from_model)
+        return SymptomAnalysis(**payload)
 
+    except AdmissionRejected:
+        source = "rejected"
+        raise
     except Exception as e:
+        source = "fallback"
         logging.error(f"Error analyzing symptoms: {e}")
         return SymptomAnalysis(
-            prediction="Unable to analyze symptoms. Please consult a healthcare professional.",
+            prediction=SYMPTOM_FALLBACK_PREDICTION,
             confidence=0.0,
             recommendations=["Consult with a doctor", "Monitor symptoms"],
             urgency_level="medium"
-        )
+        ).from_source(source)
+    finally:
+        metrics.observe_symptom_analysis(decision, source, time.perf_counter() - started)
 
-def generate_health_goals(user_profile: dict) -> list[HealthGoalSuggestion]:
-    """Generate personalized health goals based on user profile"""
+def _emergency_analysis(decision) -> SymptomAnalysis:
+    """Answer a triage rule match locally, without the model or the Gemini loop"""
+    started = time.perf_counter()
+    analysis = SymptomAnalysis(**emergency_analysis(decision)).from_source("rule")
+    metrics.observe_symptom_analysis(decision, "rule", time.perf_counter() - started)
+    return analysis
+
+def analyze_symptoms(symptoms: list, user_age: str = None, decision=None) -> SymptomAnalysis:
+    """Analyze symptoms and provide health predictions; ``decision`` is the caller's triage.triage() result"""
+    decision = decision or triage(symptoms, user_age)
+    if decision.tier == "emergency":
+        return _emergency_analysis(decision)
+    return llm_runtime.run(_symptom_analysis(symptoms, user_age, decision))
+
+async def analyze_symptoms_async(symptoms: list, user_age: str = None, decision=None) -> SymptomAnalysis:
+    """Async variant of analyze_symptoms"""
+    decision = decision or triage(symptoms, user_age)
+    if decision.tier == "emergency":
+        return _emergency_analysis(decision)
+    return await llm_runtime.run_async(_symptom_analysis(symptoms, user_age, decision))
+
+async def _analyze_symptoms_with_model(symptoms: list, user_age: str = None,
+                                       model: str = "gemini-2.5-pro") -> SymptomAnalysis:
+    """Call the model for a symptom analysis; raises on failure so errors are never cached"""
+    from google.genai import types
+    symptoms_text = ", ".join(symptoms)
+    age_context = f" for a {user_age}-year-old patient" if user_age else ""
+    
+    system_prompt = (
+        "You are a medical AI assistant. Analyze the provided symptoms and provide "
+        "a preliminary assessment. IMPORTANT: Always remind users to consult healthcare "
+        "professionals for proper diagnosis. Provide general guidance only. "
+        "Rate urgency as: low, medium, high, or emergency. "
+        "Respond with JSON in this format: "
+        "{'prediction': 'description', 'confidence': number, 'recommendations': ['rec1', 'rec2'], 'urgency_level': 'level'}"
+    )
+
+    response = await _generate_content(
+        "analyze_symptoms",
+        model=model,
+        contents=[
+            types.Content(role="user", parts=[types.Part(text=f"Symptoms: {symptoms_text}{age_context}")])
+        ],
+        config=types.GenerateContentConfig(
+            system_instruction=system_prompt,
+            response_mime_type="application/json",
+            response_schema=SymptomAnalysis,
+        ),
+    )
+
+    raw_json = response.text
+    if raw_json:
+        data = json.loads(raw_json)
+        return SymptomAnalysis(**data)
+    else:
+        raise ValueError("Empty response from model")
+
+async def _health_goals(user_profile: dict) -> list[HealthGoalSuggestion]:
     try:
-        profile_text = json.dumps(user_profile)
-        
-        system_prompt = (
-            "You are a health coaching AI. Based on the user profile, suggest 3-5 "
-            "realistic health goals. Consider their age, health status, and preferences. "
-            "Provide specific, measurable goals with appropriate timelines. "
-            "Respond with JSON array of goals in this format: "
-            "[{'goal_type': 'type', 'title': 'title', 'description': 'desc', 'target_value': number, 'unit': 'unit', 'timeline_days': number}]"
-        )
+        profile_key = hashlib.sha256(json.dumps(user_profile, sort_keys=True, default=str).encode('utf-8')).hexdigest()
 
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=[
-                types.Content(role="user", parts=[types.Part(text=f"User profile: {profile_text}")])
-            ],
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-                response_mime_type="application/json",
-            ),
-        )
+        async def from_model():
+            goals = await _health_goals_with_model(user_profile)
+            return [goal.model_dump() for goal in goals]
 
-        raw_json = response.text
-        if raw_json:
-            data = json.loads(raw_json)
-            return [HealthGoalSuggestion(**goal) for goal in data]
-        else:
-            raise ValueError("Empty response from model")
+        payload = await single_flight.do('health_goals', profile_key, from_model)
+        return [HealthGoalSuggestion(**goal) for goal in payload]
 
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logging.error(f"Error generating health goals: {e}")
         return []
 
-def generate_health_advice(goal_type: str, current_progress: dict) -> str:
-    """Generate personalized health advice based on goal progress"""
+async def _health_goals_with_model(user_profile: dict) -> list[HealthGoalSuggestion]:
+    """Call the model for goal suggestions; raises on failure"""
+    from google.genai import types
+    profile_text = json.dumps(user_profile)
+    
+    system_prompt = (
+        "You are a health coaching AI. Based on the user profile, suggest 3-5 "
+        "realistic health goals. Consider their age, health status, and preferences. "
+        "Provide specific, measurable goals with appropriate timelines. "
+        "Respond with JSON array of goals in this format: "
+        "[{'goal_type': 'type', 'title': 'title', 'description': 'desc', 'target_value': number, 'unit': 'unit', 'timeline_days': number}]"
+    )
+
+    response = await _generate_content(
+        "health_goals",
+        model="gemini-2.5-pro",
+        contents=[
+            types.Content(role="user", parts=[types.Part(text=f"User profile: {profile_text}")])
+        ],
+        config=types.GenerateContentConfig(
+            system_instruction=system_prompt,
+            response_mime_type="application/json",
+        ),
+    )
+
+    raw_json = response.text
+    if raw_json:
+        data = json.loads(raw_json)
+        return [HealthGoalSuggestion(**goal) for goal in data]
+    else:
+        raise ValueError("Empty response from model")
+
+def generate_health_goals(user_profile: dict) -> list[HealthGoalSuggestion]:
+    """Generate personalized health goals based on user profile"""
+    return llm_runtime.run(_health_goals(user_profile))
+
+async def generate_health_goals_async(user_profile: dict) -> list[HealthGoalSuggestion]:
+    """Async variant of generate_health_goals"""
+    return await llm_runtime.run_async(_health_goals(user_profile))
+
+async def _health_advice(goal_type: str, current_progress: dict) -> str:
     try:
         progress_text = json.dumps(current_progress)
         
@@ -188,13 +549,24 @@ def generate_health_advice(goal_type: str, current_progress: dict) -> str:
             "Give specific, actionable recommendations to help achieve the goal."
         )
 
-        response = client.models.generate_content(
+        response = await _generate_content(
+            "health_advice",
             model="gemini-2.5-flash",
             contents=prompt
         )
 
         return response.text or "Keep up the great work on your health journey!"
 
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logging.error(f"Error generating health advice: {e}")
         return "Continue working towards your health goals. Consistency is key!"
+
+def generate_health_advice(goal_type: str, current_progress: dict) -> str:
+    """Generate personalized health advice based on goal progress"""
+    return llm_runtime.run(_health_advice(goal_type, current_progress))
+
+async def generate_health_advice_async(goal_type: str, current_progress: dict) -> str:
+    """Async variant of generate_health_advice"""
+    return await llm_runtime.run_async(_health_advice(goal_type, current_progress))
@@ -0,0 +1,47 @@
+# Gunicorn configuration for IntelliMed
+#
+#   gunicorn main:app
+#
+# The LLM-bound routes (/api/chat, /api/predict-disease,
+# /api/generate-health-goals) are async views whose model calls all run on one
+# shared event loop per process (llm_runtime.py). A request waiting on Gemini
+# only parks a cheap gthread thread, so each worker process can hold hundreds
+# of concurrent LLM requests; GEMINI_MAX_CONCURRENCY caps how many of them are
+# actually in flight against the API at once.
+#
+# The app is built by app.create_app(). The schema is set up once in the
+# master (on_starting), and each worker warms up its own Gemini client.
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 256))
+
+# Slow model calls are bounded by the Gemini client, not the worker timeout
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Loading the app in the master is safe: create_app() opens no connections,
+# pooled DB connections are dropped in each child after fork, and the Gemini
+# client is created per process on first use
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+
+def on_starting(server):
+    # Create tables and apply migrations once, before any worker starts. With
+    # preload_app the served app is already built; reuse it rather than
+    # building a second one in the master.
+    if os.environ.get("AUTO_MIGRATE", "1") == "1":
+        import sys
+        from app import create_app, init_db
+        main = sys.modules.get("main")
+        init_db(main.app if main is not None else create_app())
+
+
+def post_worker_init(worker):
+    # Build this worker's Gemini client before it takes traffic
+    import gemini
+    gemini.warm_up()
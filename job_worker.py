@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Worker process pool for the AI job queue (jobs.py).
+
+    python job_worker.py --processes 2 --threads 16
+
+Each process runs --threads worker threads that claim and run jobs. A job
+spends nearly all its time waiting on Gemini, so one process can keep many
+jobs in flight. The parent restarts processes that die and passes SIGTERM
+and SIGINT on to them. On SIGTERM a process finishes the jobs it holds, then
+exits.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+
+def _worker_thread(app, worker_id, stop, poll_interval):
+    from extensions import db
+    from jobs import claim_job, run_job
+
+    while not stop.is_set():
+        job, status = None, None
+        try:
+            with app.app_context():
+                job = claim_job(worker_id)
+                if job is not None:
+                    started = time.perf_counter()
+                    status = run_job(job)
+                    logging.info(f"Job {job.id} ({job.kind}) {status} in {time.perf_counter() - started:.2f}s")
+                db.session.remove()
+        except Exception as e:
+            logging.error(f"Job worker {worker_id} error: {e}")
+        # Back off when idle or when admission control deferred the job
+        if job is None or status == 'deferred':
+            stop.wait(poll_interval)
+
+
+def start_threads(app, threads, poll_interval, stop, daemon=False):
+    """Start job threads in this process that run until ``stop`` is set; returns the threads"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    workers = [
+        threading.Thread(target=_worker_thread, args=(app, f"{worker_id}:{i}", stop, poll_interval),
+                         name=f"job-worker-{i}", daemon=daemon)
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    logging.info(f"Job worker {worker_id} started with {threads} threads")
+    return workers
+
+
+def run_process(threads, poll_interval, app=None):
+    """Run job threads in this process until SIGTERM or SIGINT"""
+    if app is None:
+        from app import create_app
+        app = create_app()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    workers = start_threads(app, threads, poll_interval, stop)
+    while any(worker.is_alive() for worker in workers):
+        for worker in workers:
+            worker.join(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=int(os.environ.get("JOB_WORKER_PROCESSES", 2)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get("JOB_WORKER_THREADS", 16)))
+    parser.add_argument('--poll-interval', type=float, default=float(os.environ.get("JOB_WORKER_POLL_INTERVAL", 0.5)))
+    args = parser.parse_args()
+
+    app = None
+    if os.environ.get("AUTO_MIGRATE", "1") == "1":
+        from app import create_app, init_db
+        app = create_app()
+        init_db(app)
+
+    if args.processes <= 1:
+        # Run in this process on the app already built for the migration
+        run_process(args.threads, args.poll_interval, app)
+        return 0
+
+    stopping = False
+
+    def start():
+        process = multiprocessing.Process(target=run_process, args=(args.threads, args.poll_interval))
+        process.start()
+        return process
+
+    def stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    processes = [start() for _ in range(args.processes)]
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while processes:
+        for i, process in enumerate(processes):
+            process.join(0.5)
+            if process.is_alive():
+                continue
+            if stopping:
+                processes[i] = None
+            else:
+                logging.warning(f"Job worker process {process.pid} exited with {process.exitcode}; restarting")
+                processes[i] = start()
+        processes = [process for process in processes if process is not None]
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
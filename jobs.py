@@ -0,0 +1,221 @@
+"""Persistent job queue for slow AI requests.
+
+With AI_JOBS=1, /api/predict-disease and /api/generate-health-goals enqueue a
+Job row and return its id straight away instead of holding the request open
+for the gemini-2.5-pro round trip. job_worker.py processes claim queued jobs
+and run them. Clients poll or long-poll /api/jobs/<id>, or pass a
+callback_url (its host must be listed in JOB_CALLBACK_HOSTS) to have the
+finished job POSTed to them.
+
+The queue is the Job table in the application database. A claim is one
+conditional UPDATE, so any number of workers can share the queue safely. A
+claimed job holds a lease. If its worker dies, another worker picks the job
+up once the lease expires, for up to JOB_MAX_ATTEMPTS attempts.
+"""
+import json
+import logging
+import os
+import urllib.request
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+from sqlalchemy import and_, or_
+from admission import AdmissionRejected
+from extensions import db
+from models import DiseasePrediction, Job
+from symptom_analytics import record_predictions
+from symptom_cache import age_band
+from triage import TriageDecision, triage
+
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", 300))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+JOB_CALLBACK_HOSTS = {host.strip() for host in os.environ.get("JOB_CALLBACK_HOSTS", "").split(",") if host.strip()}
+JOB_CALLBACK_TIMEOUT = 5
+
+FINISHED_STATUSES = ('succeeded', 'failed')
+
+
+def record_prediction(user_id, symptoms, analysis, user_age=None, decision=None):
+    """Save a DiseasePrediction for a SymptomAnalysis and count it in the symptom rollups; the caller commits
+
+    ``decision`` is the triage.TriageDecision the analysis was made under.
+    """
+    prediction = DiseasePrediction()
+    prediction.user_id = user_id
+    prediction.symptoms = json.dumps(symptoms)
+    prediction.prediction_result = analysis.prediction
+    prediction.confidence_score = analysis.confidence
+    prediction.recommendations = json.dumps(analysis.recommendations)
+    prediction.urgency_level = analysis.urgency_level
+    prediction.analysis_source = analysis.source
+    prediction.age_band = age_band(user_age)
+    prediction.triage_tier = decision.tier if decision else None
+    db.session.add(prediction)
+    db.session.flush()
+    record_predictions([prediction])
+    return prediction
+
+
+def run_predict_disease(payload, user_id):
+    from gemini import analyze_symptoms
+    symptoms = payload.get('symptoms', [])
+    # Jobs queued by the route carry its triage decision
+    decision = TriageDecision(**payload['triage']) if payload.get('triage') else triage(symptoms, payload.get('age'))
+    analysis = analyze_symptoms(symptoms, payload.get('age'), decision)
+    prediction = record_prediction(user_id, symptoms, analysis, payload.get('age'), decision)
+    db.session.commit()
+    return {
+        'prediction': analysis.prediction,
+        'confidence': analysis.confidence,
+        'recommendations': analysis.recommendations,
+        'urgency_level': analysis.urgency_level,
+        'prediction_id': prediction.id,
+    }
+
+
+def run_health_goals(payload, user_id):
+    from gemini import generate_health_goals
+    suggestions = generate_health_goals(payload)
+    return {'suggestions': [suggestion.model_dump() for suggestion in suggestions]}
+
+
+# kind -> handler(payload, user_id) returning the JSON result
+JOB_HANDLERS = {
+    'predict_disease': run_predict_disease,
+    'health_goals': run_health_goals,
+}
+
+
+def callback_allowed(url):
+    parsed = urlparse(url or '')
+    return parsed.scheme in ('http', 'https') and parsed.hostname in JOB_CALLBACK_HOSTS
+
+
+def enqueue_job(kind, payload, user_id=None, callback_url=None):
+    """Add a job to the queue and commit; returns the Job"""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = Job()
+    job.id = uuid.uuid4().hex
+    job.kind = kind
+    job.status = 'queued'
+    job.user_id = user_id
+    job.payload = json.dumps(payload)
+    job.callback_url = callback_url
+    job.created_at = datetime.utcnow()
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'attempts': job.attempts,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def claim_job(worker_id):
+    """Atomically claim the oldest runnable job for this worker; returns the Job or None"""
+    now = datetime.utcnow()
+    expired = and_(Job.status == 'running', Job.lease_expires_at < now)
+
+    # Jobs whose workers died too many times are given up on
+    db.session.query(Job).filter(expired, Job.attempts >= JOB_MAX_ATTEMPTS).update({
+        'status': 'failed',
+        'error': 'Worker lease expired too many times',
+        'finished_at': now,
+    }, synchronize_session=False)
+
+    claimable = or_(Job.status == 'queued', expired)
+    candidate = db.session.query(Job.id).filter(claimable).order_by(Job.created_at).limit(1).scalar_subquery()
+    token = f"{worker_id}:{uuid.uuid4().hex[:8]}"
+    claimed = db.session.query(Job).filter(Job.id == candidate, claimable).update({
+        'status': 'running',
+        'claimed_by': token,
+        'lease_expires_at': now + timedelta(seconds=JOB_LEASE_SECONDS),
+        'started_at': now,
+        'attempts': Job.attempts + 1,
+    }, synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        return None
+    return db.session.query(Job).filter(Job.claimed_by == token, Job.status == 'running').first()
+
+
+def _finish(job, status, result=None, error=None):
+    """Record the outcome unless another worker has taken over the job"""
+    updated = db.session.query(Job).filter(Job.id == job.id, Job.claimed_by == job.claimed_by).update({
+        'status': status,
+        'result': json.dumps(result) if result is not None else None,
+        'error': error,
+        'finished_at': datetime.utcnow() if status in FINISHED_STATUSES else None,
+        'lease_expires_at': None,
+    }, synchronize_session=False)
+    db.session.commit()
+    return updated == 1
+
+
+def run_job(job):
+    """Run a claimed job and store its result; retried later on failure while attempts remain"""
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+        result = handler(json.loads(job.payload), job.user_id)
+    except AdmissionRejected as e:
+        # Model budget exhausted: put the job back without using up an attempt
+        db.session.rollback()
+        db.session.query(Job).filter(Job.id == job.id, Job.claimed_by == job.claimed_by).update({
+            'status': 'queued',
+            'attempts': Job.attempts - 1,
+            'lease_expires_at': None,
+        }, synchronize_session=False)
+        db.session.commit()
+        return 'deferred'
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Job {job.id} ({job.kind}) attempt {job.attempts} failed: {e}")
+        status = 'failed' if handler is None or job.attempts >= JOB_MAX_ATTEMPTS else 'queued'
+        _finish(job, status, error=str(e))
+        if status == 'failed':
+            send_callback(job.id)
+        return status
+
+    if _finish(job, 'succeeded', result=result):
+        send_callback(job.id)
+    return 'succeeded'
+
+
+def send_callback(job_id):
+    """POST the finished job to its callback_url, best effort"""
+    job = db.session.get(Job, job_id)
+    if job is None or not job.callback_url or not callback_allowed(job.callback_url):
+        return
+    body = json.dumps({'job': job_to_dict(job)}).encode('utf-8')
+    request = urllib.request.Request(job.callback_url, data=body, method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=JOB_CALLBACK_TIMEOUT):
+            pass
+    except Exception as e:
+        logging.warning(f"Callback for job {job.id} to {job.callback_url} failed: {e}")
+
+
+def queue_stats():
+    counts = dict(db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status).all())
+    oldest = db.session.query(db.func.min(Job.created_at)).filter(Job.status == 'queued').scalar()
+    return {
+        'queued': counts.get('queued', 0),
+        'running': counts.get('running', 0),
+        'succeeded': counts.get('succeeded', 0),
+        'failed': counts.get('failed', 0),
+        'oldest_queued_seconds': round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0,
+    }
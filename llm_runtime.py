@@ -0,0 +1,96 @@
+"""Shared asyncio event loop for Gemini calls.
+
+Every model call in gemini.py runs as a coroutine on one background event
+loop per process. Sync callers block on the result with ``run()``; async Flask
+views ``await run_async()``. Because all in-flight calls share one loop, the
+async Gemini client keeps a single connection pool and a single semaphore
+bounds how many model requests the process has open at once, no matter how
+many request threads are waiting on them.
+
+The loop thread is started lazily and restarted after a fork, so it is safe
+to import this module in a gunicorn master started with ``--preload``.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", 64))
+
+_lock = threading.Lock()
+_loop = None
+_loop_pid = None
+_semaphore = None
+_in_flight = 0
+
+
+def _start_loop():
+    global _loop, _loop_pid, _semaphore, _in_flight
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, name="gemini-event-loop", daemon=True)
+    thread.start()
+    ready.wait()
+    _loop, _loop_pid = loop, os.getpid()
+    _semaphore, _in_flight = None, 0
+    logging.debug(f"Started Gemini event loop in process {_loop_pid}")
+
+
+def get_loop():
+    """Return this process's Gemini event loop, starting it if needed"""
+    if _loop is None or _loop_pid != os.getpid():
+        with _lock:
+            if _loop is None or _loop_pid != os.getpid():
+                _start_loop()
+    return _loop
+
+
+@contextlib.asynccontextmanager
+async def model_slot():
+    """Hold one of the GEMINI_MAX_CONCURRENCY model call slots; only use on the Gemini loop"""
+    global _semaphore, _in_flight
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+    async with _semaphore:
+        _in_flight += 1
+        try:
+            yield
+        finally:
+            _in_flight -= 1
+
+
+def in_flight():
+    """Number of model calls currently holding a concurrency slot"""
+    return _in_flight
+
+
+def submit(coro):
+    """Schedule a coroutine on the Gemini loop, returns a concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro, timeout=None):
+    """Run a coroutine on the Gemini loop and block the calling thread for its result"""
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("llm_runtime.run() called from the Gemini loop; await the coroutine instead")
+    return submit(coro).result(timeout)
+
+
+async def run_async(coro):
+    """Await a coroutine on the Gemini loop from any event loop"""
+    loop = get_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(submit(coro))
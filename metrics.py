@@ -0,0 +1,384 @@
+"""Request, database and Gemini instrumentation exported in Prometheus text format.
+
+``init_app`` adds Flask hooks that time every request by route and count the
+SQL statements and SQL time it used (through SQLAlchemy engine events).
+gemini.py records every model call with ``observe_llm_call`` and its token
+use with ``observe_llm_tokens``. ``/metrics``
+serves everything in the Prometheus text exposition format.
+
+Recording is a dict lookup and a few additions under a lock, cheap enough to
+leave on. Metrics are per process. With several gunicorn workers, set
+METRICS_DIR to a directory shared by the workers: each process then writes a
+snapshot there every METRICS_FLUSH_INTERVAL seconds, and a scrape of any
+worker returns the sum over all of them.
+"""
+import bisect
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from flask import g, request
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+PREFIX = "intellimed_"
+
+_request_db = contextvars.ContextVar('metrics_request_db', default=None)
+
+
+class _Metric:
+    def __init__(self, name, help_text, labels):
+        self.name = PREFIX + name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): value if not isinstance(value, list) else list(value)
+                    for key, value in self._values.items()}
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Gauge read from a callback at scrape time; the callback returns {label tuple: value}"""
+
+    def __init__(self, name, help_text, labels, callback, shared=False, kind='gauge'):
+        super().__init__(name, help_text, labels)
+        self.callback = callback
+        self.kind = kind  # 'counter' for monotonic totals kept elsewhere
+        # Shared gauges read state common to all processes (e.g. the database),
+        # so only the scraped process reports them
+        self.shared = shared
+
+    def snapshot(self):
+        try:
+            values = self.callback()
+        except Exception as e:
+            logging.debug(f"Gauge {self.name} unavailable: {e}")
+            return {}
+        return {json.dumps([str(part) for part in key]): value for key, value in values.items()}
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels, buckets):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # one count per bucket, then +Inf, then sum
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.directory = None
+        self.flush_interval = 10.0
+        self._flusher_pid = None
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels, callback, shared=False, kind='gauge'):
+        return self._add(Gauge(name, help_text, labels, callback, shared, kind))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self, include_shared=True):
+        return {metric.name: metric.snapshot() for metric in self.metrics
+                if include_shared or not getattr(metric, 'shared', False)}
+
+    # Multi-process aggregation
+
+    def _snapshot_path(self, pid=None):
+        return os.path.join(self.directory, f"metrics-{pid or os.getpid()}.json")
+
+    def write_snapshot(self):
+        path = self._snapshot_path()
+        temp = f"{path}.tmp"
+        with open(temp, 'w') as f:
+            json.dump({'written_at': time.time(), 'metrics': self.snapshot(include_shared=False)}, f)
+        os.replace(temp, path)
+
+    def ensure_flusher(self):
+        """Start this process's snapshot writer (again after a fork)"""
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.write_snapshot()
+                except OSError as e:
+                    logging.warning(f"Metrics snapshot write failed: {e}")
+
+        threading.Thread(target=run, name="metrics-flush", daemon=True).start()
+
+    def _collect(self):
+        """Merge this process's live metrics with the other processes' snapshots"""
+        merged = self.snapshot()
+        if not self.directory:
+            return merged
+        stale_before = time.time() - max(60.0, self.flush_interval * 6)
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+            if path == self._snapshot_path():
+                continue
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if data.get('written_at', 0) < stale_before:
+                # Its process has stopped flushing; drop it
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            for name, series in data.get('metrics', {}).items():
+                target = merged.setdefault(name, {})
+                for key, value in series.items():
+                    if isinstance(value, list):
+                        current = target.get(key) or [0] * len(value)
+                        target[key] = [a + b for a, b in zip(current, value)]
+                    else:
+                        target[key] = target.get(key, 0) + value
+        return merged
+
+    def render(self):
+        """All metrics in Prometheus text exposition format"""
+        merged = self._collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for key, value in sorted(merged.get(metric.name, {}).items()):
+                label_values = json.loads(key)
+                pairs = [f'{label}="{_escape(val)}"' for label, val in zip(metric.labels, label_values)]
+                if metric.kind != 'histogram':
+                    lines.append(f"{metric.name}{_labels(pairs)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value):
+                    cumulative += count
+                    lines.append(f"{metric.name}_bucket{_labels(pairs + [_le(bound)])} {cumulative}")
+                cumulative += value[-2]
+                lines.append(f"{metric.name}_bucket{_labels(pairs + [_le('+Inf')])} {cumulative}")
+                lines.append(f"{metric.name}_sum{_labels(pairs)} {_number(value[-1])}")
+                lines.append(f"{metric.name}_count{_labels(pairs)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _le(bound):
+    return f'le="{bound}"'
+
+
+def _labels(pairs):
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status"))
+http_duration = registry.histogram(
+    "http_request_duration_seconds", "Time to produce the response (first byte for streams)", ("route", "method"))
+request_db_queries = registry.histogram(
+    "http_request_db_queries", "SQL statements executed per request", ("route",), QUERY_COUNT_BUCKETS)
+request_db_time = registry.histogram(
+    "http_request_db_seconds", "SQL time per request", ("route",))
+db_queries = registry.counter(
+    "db_queries_total", "SQL statements executed")
+db_query_duration = registry.histogram(
+    "db_query_duration_seconds", "SQL statement execution time", (),
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+llm_calls = registry.counter(
+    "gemini_calls_total", "Gemini calls by function, model and outcome", ("function", "model", "outcome"))
+llm_duration = registry.histogram(
+    "gemini_call_duration_seconds", "Gemini call time including retries", ("function", "model"), LLM_BUCKETS)
+llm_tokens = registry.counter(
+    "gemini_tokens_total", "Gemini tokens by function, model and kind (prompt, output, thinking)",
+    ("function", "model", "kind"))
+symptom_triage = registry.counter(
+    "symptom_triage_total", "Symptom analyses by triage tier and the rule or reason behind it", ("tier", "reason"))
+symptom_analysis_duration = registry.histogram(
+    "symptom_analysis_duration_seconds", "analyze_symptoms time by triage tier and how it was answered",
+    ("tier", "source"), (0.0001, 0.001, 0.01) + LLM_BUCKETS)
+
+
+def observe_llm_call(function, model, seconds, outcome='ok'):
+    llm_calls.inc(function=function, model=model, outcome=outcome)
+    llm_duration.observe(seconds, function=function, model=model)
+
+
+def observe_llm_tokens(function, model, usage):
+    """Count the tokens in a response's usage_metadata"""
+    if usage is None:
+        return
+    for kind, attribute in (('prompt', 'prompt_token_count'), ('output', 'candidates_token_count'),
+                            ('thinking', 'thoughts_token_count')):
+        count = getattr(usage, attribute, None)
+        if count:
+            llm_tokens.inc(count, function=function, model=model, kind=kind)
+
+
+def observe_symptom_analysis(decision, source, seconds):
+    """Record a triage.TriageDecision and how long the analysis took; source is rule, cache, model or fallback"""
+    symptom_triage.inc(tier=decision.tier, reason=decision.reason)
+    symptom_analysis_duration.observe(seconds, tier=decision.tier, source=source)
+
+
+_service_gauges_registered = False
+
+
+def register_service_gauges():
+    """Expose the in-process state of the Gemini runtime, caches, queues and jobs (once per process)"""
+    global _service_gauges_registered
+    if _service_gauges_registered:
+        return
+    _service_gauges_registered = True
+    import llm_runtime
+    from admission import admission
+    from chat_writer import chat_writer
+    from circuit_breaker import breakers
+    from facility_cache import result_cache
+    from gemini import single_flight, symptom_cache
+
+    registry.gauge("gemini_in_flight", "Gemini calls holding a concurrency slot", (),
+                   lambda: {(): llm_runtime.in_flight()})
+    registry.gauge("admission_queue_depth", "Gemini calls waiting for an admission token", ("model",),
+                   lambda: {(model,): depth for model, depth in admission.stats()['queue_depth'].items()})
+    registry.gauge("admission_rejections_total", "Gemini calls refused by admission control", ("reason",),
+                   lambda: {(reason,): count for reason, count in admission.stats()['rejected'].items()},
+                   kind='counter')
+    registry.gauge("gemini_breaker_open", "1 while the model's circuit breaker is not closed", ("model",),
+                   lambda: {(model,): int(stats['state'] != 'closed') for model, stats in breakers.stats().items()})
+    registry.gauge("gemini_breaker_short_circuited_total", "Calls failed fast by an open circuit breaker",
+                   ("model",),
+                   lambda: {(model,): stats['short_circuited'] for model, stats in breakers.stats().items()},
+                   kind='counter')
+    registry.gauge("symptom_cache_lookups_total", "Symptom cache lookups by result", ("result",),
+                   lambda: {('hit',): symptom_cache.hits, ('miss',): symptom_cache.misses}, kind='counter')
+    registry.gauge("facility_cache_lookups_total", "Nearby-facility result cache lookups by result", ("result",),
+                   lambda: {('hit',): result_cache.hits, ('miss',): result_cache.misses,
+                            ('bypass',): result_cache.bypassed}, kind='counter')
+    registry.gauge("facility_cache_records", "Facility records held by the nearby-search result cache", (),
+                   lambda: {(): result_cache.stats()['records']})
+    registry.gauge("single_flight_coalesced_total", "Model calls served by an identical in-flight call",
+                   ("scope",),
+                   lambda: {('process',): single_flight.coalesced_local,
+                            ('host',): single_flight.coalesced_shared}, kind='counter')
+    registry.gauge("chat_write_queue_turns", "Chat turns waiting for the write-behind writer", (),
+                   lambda: {(): chat_writer.stats()['queued_turns']})
+    registry.gauge("chat_write_dropped_messages_total", "Chat messages the write-behind writer gave up on", (),
+                   lambda: {(): chat_writer.failed}, kind='counter')
+
+    def job_counts():
+        from jobs import queue_stats
+        stats = queue_stats()
+        return {(status,): stats[status] for status in ('queued', 'running', 'succeeded', 'failed')}
+
+    registry.gauge("jobs", "Background jobs by status", ("status",), job_counts, shared=True)
+
+
+def _route_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def init_app(app, db):
+    """Install request timing hooks and SQL counting on the app's engine (once per app)"""
+    from sqlalchemy import event
+
+    if 'metrics' in app.extensions:
+        return
+    app.extensions['metrics'] = registry
+
+    registry.directory = app.config.get("METRICS_DIR") or None
+    registry.flush_interval = app.config.get("METRICS_FLUSH_INTERVAL", 10.0)
+    if registry.directory:
+        os.makedirs(registry.directory, exist_ok=True)
+    register_service_gauges()
+
+    engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_started
+        db_queries.inc()
+        db_query_duration.observe(elapsed)
+        stats = _request_db.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+    @app.before_request
+    def start_request_timer():
+        registry.ensure_flusher()
+        g.metrics_started = time.perf_counter()
+        g.metrics_db = [0, 0.0]
+        _request_db.set(g.metrics_db)
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        route = _route_label()
+        http_requests.inc(route=route, method=request.method, status=response.status_code)
+        http_duration.observe(time.perf_counter() - started, route=route, method=request.method)
+        queries, seconds = g.pop('metrics_db', (0, 0.0))
+        request_db_queries.observe(queries, route=route)
+        request_db_time.observe(seconds, route=route)
+        return response
+
+
+def request_db_stats():
+    """(queries, seconds) used so far by the current request, or None outside one"""
+    stats = _request_db.get()
+    return tuple(stats) if stats is not None else None
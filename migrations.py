@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""Versioned schema migrations for the IntelliMed database.
+
+``db.create_all()`` only creates missing tables; it never alters existing
+ones. app.init_db() runs both. Each migration below brings an existing
+database (such as instance/intellimed.db) up to what the models declare. Applied versions are
+recorded in ``schema_version``. Every step is idempotent, so two workers
+starting at once or a database created fresh by ``create_all()`` are both
+safe.
+
+    python migrations.py status     # list applied and pending migrations
+    python migrations.py upgrade    # apply pending, with before/after query plans
+    python migrations.py plan       # show query plans for the hot lookups
+"""
+import hashlib
+import logging
+import sys
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from spatial import grid_cell_for
+
+
+def _columns(conn, table):
+    return {column['name'] for column in inspect(conn).get_columns(table)}
+
+
+def _create_index(conn, name, table, columns, unique=False):
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    conn.execute(text(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+def migrate_spatial_grid(conn):
+    """Add MedicalFacility.grid_cell with its index and backfill it"""
+    if 'grid_cell' not in _columns(conn, 'medical_facility'):
+        conn.execute(text("ALTER TABLE medical_facility ADD COLUMN grid_cell INTEGER"))
+    _create_index(conn, 'ix_medical_facility_grid_cell', 'medical_facility', ['grid_cell'])
+    rows = conn.execute(text(
+        "SELECT id, latitude, longitude FROM medical_facility WHERE grid_cell IS NULL"
+    )).fetchall()
+    if rows:
+        conn.execute(
+            text("UPDATE medical_facility SET grid_cell = :grid_cell WHERE id = :id"),
+            [{'id': row.id, 'grid_cell': grid_cell_for(row.latitude, row.longitude)} for row in rows]
+        )
+
+
+def migrate_hot_path_indexes(conn):
+    """Index ChatSession.session_id (unique) and the foreign keys used by lookups"""
+    # Older databases may hold duplicate session ids; fold them into the
+    # oldest row before the unique index goes on.
+    duplicates = conn.execute(text(
+        "SELECT session_id, MIN(id) AS keep_id FROM chat_session GROUP BY session_id HAVING COUNT(*) > 1"
+    )).fetchall()
+    for row in duplicates:
+        params = {'session_id': row.session_id, 'keep_id': row.keep_id}
+        conn.execute(text(
+            "UPDATE chat_message SET session_id = :keep_id WHERE session_id IN "
+            "(SELECT id FROM chat_session WHERE session_id = :session_id AND id != :keep_id)"
+        ), params)
+        conn.execute(text("DELETE FROM chat_session WHERE session_id = :session_id AND id != :keep_id"), params)
+    if duplicates:
+        logging.warning(f"Merged {len(duplicates)} duplicated chat sessions before adding unique index")
+
+    _create_index(conn, 'ix_chat_session_session_id', 'chat_session', ['session_id'], unique=True)
+    _create_index(conn, 'ix_chat_session_user_id', 'chat_session', ['user_id'])
+    _create_index(conn, 'ix_chat_message_session_id_timestamp', 'chat_message', ['session_id', 'timestamp'])
+    _create_index(conn, 'ix_health_goal_user_id', 'health_goal', ['user_id'])
+    _create_index(conn, 'ix_appointment_user_id', 'appointment', ['user_id'])
+    _create_index(conn, 'ix_appointment_facility_id', 'appointment', ['facility_id'])
+    _create_index(conn, 'ix_disease_prediction_user_id', 'disease_prediction', ['user_id'])
+
+
+def migrate_chat_summary(conn):
+    """Add the rolling conversation summary columns to ChatSession"""
+    columns = _columns(conn, 'chat_session')
+    for name, kind in [('summary', 'TEXT'), ('summary_through_id', 'INTEGER'), ('summary_updated_at', 'TIMESTAMP')]:
+        if name not in columns:
+            conn.execute(text(f"ALTER TABLE chat_session ADD COLUMN {name} {kind}"))
+
+
+def migrate_facility_external_id(conn):
+    """Add MedicalFacility.external_id (the bulk import upsert key) and backfill natural keys"""
+    from models import facility_natural_key
+
+    if 'external_id' not in _columns(conn, 'medical_facility'):
+        conn.execute(text("ALTER TABLE medical_facility ADD COLUMN external_id VARCHAR(120)"))
+    rows = conn.execute(text(
+        "SELECT id, name, address FROM medical_facility WHERE external_id IS NULL ORDER BY id"
+    )).fetchall()
+    taken = {row.external_id for row in conn.execute(text(
+        "SELECT external_id FROM medical_facility WHERE external_id IS NOT NULL"
+    ))}
+    updates = []
+    for row in rows:
+        key = facility_natural_key(row.name, row.address)
+        # Facilities entered twice keep their rows; later copies get a suffixed key
+        if key in taken:
+            key = f"{key}:{row.id}"
+        taken.add(key)
+        updates.append({'id': row.id, 'external_id': key})
+    if updates:
+        conn.execute(text("UPDATE medical_facility SET external_id = :external_id WHERE id = :id"), updates)
+    _create_index(conn, 'ix_medical_facility_external_id', 'medical_facility', ['external_id'], unique=True)
+
+
+def migrate_facility_services(conn):
+    """Fill the service and facility_service tables from MedicalFacility.services"""
+    from models import link_facility_services
+
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, services FROM medical_facility WHERE id > :last_id ORDER BY id LIMIT 1000"
+        ), {'last_id': last_id}).fetchall()
+        if not rows:
+            break
+        link_facility_services(conn, {row.id: row.services for row in rows})
+        last_id = rows[-1].id
+
+
+def migrate_appointment_slots(conn):
+    """Index appointments by (facility, time) and count existing bookings into appointment_slot"""
+    _create_index(conn, 'ix_appointment_facility_id_appointment_date', 'appointment',
+                  ['facility_id', 'appointment_date'])
+    # Telemedicine bookings without a facility share pool 0 (availability.TELEMEDICINE_POOL)
+    conn.execute(text(
+        "INSERT INTO appointment_slot (facility_id, slot_start, booked) "
+        "SELECT COALESCE(facility_id, 0), appointment_date, COUNT(*) FROM appointment "
+        "WHERE status IS NULL OR status != 'cancelled' "
+        "GROUP BY COALESCE(facility_id, 0), appointment_date "
+        "ON CONFLICT (facility_id, slot_start) DO NOTHING"
+    ))
+
+
+def migrate_chat_history_index(conn):
+    """Index chat messages by (session_id, id) for keyset-paginated history reads"""
+    _create_index(conn, 'ix_chat_message_session_id_id', 'chat_message', ['session_id', 'id'])
+
+
+def migrate_symptom_analytics(conn):
+    """Add the analytics columns to DiseasePrediction; symptom_analytics.py backfill counts old rows"""
+    columns = _columns(conn, 'disease_prediction')
+    for name, kind in [('urgency_level', 'VARCHAR(20)'), ('age_band', 'VARCHAR(10)'),
+                       ('analytics_recorded', 'BOOLEAN')]:
+        if name not in columns:
+            conn.execute(text(f"ALTER TABLE disease_prediction ADD COLUMN {name} {kind}"))
+
+
+def migrate_triage_tier(conn):
+    """Add DiseasePrediction.triage_tier, the routing decision of triage.py"""
+    if 'triage_tier' not in _columns(conn, 'disease_prediction'):
+        conn.execute(text("ALTER TABLE disease_prediction ADD COLUMN triage_tier VARCHAR(10)"))
+
+
+# gemini.SYMPTOM_FALLBACK_PREDICTION, copied so migrations don't import gemini
+_SYMPTOM_FALLBACK_PREDICTION = "Unable to analyze symptoms. Please consult a healthcare professional."
+
+
+def migrate_prediction_source(conn):
+    """Add DiseasePrediction.analysis_source and flag fallback answers saved before it"""
+    if 'analysis_source' not in _columns(conn, 'disease_prediction'):
+        conn.execute(text("ALTER TABLE disease_prediction ADD COLUMN analysis_source VARCHAR(10)"))
+    conn.execute(text(
+        "UPDATE disease_prediction SET analysis_source = 'fallback' "
+        "WHERE analysis_source IS NULL AND prediction_result = :fallback"
+    ), {'fallback': _SYMPTOM_FALLBACK_PREDICTION})
+
+
+# (version, name, function) in the order they must run; never renumber
+MIGRATIONS = [
+    (1, 'spatial_grid_cell', migrate_spatial_grid),
+    (2, 'hot_path_indexes', migrate_hot_path_indexes),
+    (3, 'chat_session_summary', migrate_chat_summary),
+    (4, 'facility_external_id', migrate_facility_external_id),
+    (5, 'facility_services', migrate_facility_services),
+    (6, 'appointment_slots', migrate_appointment_slots),
+    (7, 'chat_history_index', migrate_chat_history_index),
+    (8, 'symptom_analytics', migrate_symptom_analytics),
+    (9, 'triage_tier', migrate_triage_tier),
+    (10, 'prediction_source', migrate_prediction_source),
+]
+
+# Hot lookups whose plans `upgrade` and `plan` print
+PLAN_QUERIES = [
+    ('chat session by session_id', "SELECT * FROM chat_session WHERE session_id = 'x'"),
+    ('chat history for a session', "SELECT * FROM chat_message WHERE session_id = 1 ORDER BY timestamp"),
+    ('chat history page', "SELECT * FROM chat_message WHERE session_id = 1 AND id < 1000 ORDER BY id DESC LIMIT 51"),
+    ('recent messages of a session', "SELECT 1 FROM chat_message WHERE session_id = 1 AND timestamp >= '2025-01-01'"),
+    ('health goals for a user', "SELECT * FROM health_goal WHERE user_id = 1"),
+    ('appointments for a user', "SELECT * FROM appointment WHERE user_id = 1"),
+    ('appointments for a facility', "SELECT * FROM appointment WHERE facility_id = 1"),
+    ('facility appointments in a day', "SELECT * FROM appointment WHERE facility_id = 1 "
+                                       "AND appointment_date BETWEEN '2025-01-01' AND '2025-01-02'"),
+    ('booked slots in a day', "SELECT slot_start, booked FROM appointment_slot WHERE facility_id = 1 "
+                              "AND slot_start >= '2025-01-01' AND slot_start < '2025-01-02'"),
+    ('predictions for a user', "SELECT * FROM disease_prediction WHERE user_id = 1"),
+    ('symptom rollups in a window', "SELECT symptom, SUM(count) FROM symptom_rollup WHERE granularity = 'day' "
+                                    "AND bucket_start >= '2025-01-01' AND bucket_start < '2025-01-08' "
+                                    "GROUP BY symptom"),
+    ('facilities in grid cells', "SELECT * FROM medical_facility WHERE grid_cell BETWEEN 1000 AND 1010"),
+    ('facility by external id', "SELECT id FROM medical_facility WHERE external_id = 'x'"),
+    ('facilities offering a service', "SELECT facility_id FROM facility_service WHERE service_id = 1"),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        " version INTEGER PRIMARY KEY,"
+        " name VARCHAR(100) NOT NULL,"
+        " applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return {row.version for row in conn.execute(text("SELECT version FROM schema_version"))}
+
+
+def database_identity(engine):
+    """Short token that changes when the database is switched or recreated
+
+    Built from the URL and when the first migration was recorded, so a
+    database reset to an empty schema gets a new token.
+    """
+    try:
+        with engine.connect() as conn:
+            created = conn.execute(text("SELECT MIN(applied_at) FROM schema_version")).scalar()
+    except SQLAlchemyError:
+        created = None
+    basis = f"{engine.url.render_as_string(hide_password=True)}|{created}"
+    return hashlib.sha1(basis.encode('utf-8')).hexdigest()[:12]
+
+
+def pending_migrations(engine):
+    applied = applied_versions(engine)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def apply_migrations(engine):
+    """Apply every pending migration, each in its own transaction; returns versions applied"""
+    applied = []
+    for version, name, migrate in pending_migrations(engine):
+        logging.info(f"Applying migration {version}: {name}")
+        try:
+            with engine.begin() as conn:
+                migrate(conn)
+                conn.execute(
+                    text("INSERT INTO schema_version (version, name, applied_at) VALUES (:version, :name, :now)"),
+                    {'version': version, 'name': name, 'now': datetime.utcnow()}
+                )
+        except IntegrityError:
+            # Another process recorded this version first; its work is already committed
+            logging.info(f"Migration {version} was applied concurrently")
+            continue
+        applied.append(version)
+    return applied
+
+
+def query_plans(engine):
+    """Return {label: plan text} for PLAN_QUERIES on this database"""
+    explain = "EXPLAIN QUERY PLAN" if engine.dialect.name == 'sqlite' else "EXPLAIN"
+    plans = {}
+    with engine.connect() as conn:
+        for label, sql in PLAN_QUERIES:
+            try:
+                rows = conn.execute(text(f"{explain} {sql}")).fetchall()
+                plans[label] = '; '.join(str(row[-1]) for row in rows)
+            except Exception as e:
+                plans[label] = f"unavailable ({e.__class__.__name__})"
+    return plans
+
+
+def _print_plans(title, plans):
+    print(title)
+    for label, plan in plans.items():
+        print(f"  {label:30} {plan}")
+
+
+def main(argv):
+    from app import create_app
+    from extensions import db
+
+    app = create_app()
+
+    command = argv[1] if len(argv) > 1 else 'status'
+    with app.app_context():
+        engine = db.engine
+        if command == 'status':
+            applied = applied_versions(engine)
+            for version, name, _ in MIGRATIONS:
+                print(f"{version:4}  {name:30} {'applied' if version in applied else 'pending'}")
+        elif command == 'plan':
+            _print_plans("Query plans:", query_plans(engine))
+        elif command == 'upgrade':
+            before = query_plans(engine)
+            db.create_all()
+            applied = apply_migrations(engine)
+            after = query_plans(engine)
+            print(f"Applied migrations: {applied or 'none pending'}")
+            _print_plans("Before:", before)
+            _print_plans("After:", after)
+        else:
+            print(__doc__)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,6 +1,11 @@
+import hashlib
+import json
+import re
 from datetime import datetime
 from flask_login import UserMixin
+from sqlalchemy import event, inspect, select, text
 from extensions import db   # ✅ change here
+from spatial import grid_cell_for
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -17,7 +22,7 @@ class User(UserMixin, db.Model):
 
 class HealthGoal(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     goal_type = db.Column(db.String(50), nullable=False)  # fitness, nutrition, weight, wellness
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
@@ -30,21 +35,44 @@ class HealthGoal(db.Model):
 
 class ChatSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
-    session_id = db.Column(db.String(100), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    session_id = db.Column(db.String(100), nullable=False, unique=True, index=True)
     persona_type = db.Column(db.String(50), nullable=False)  # senior, pediatric, empathetic, general
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Rolling summary of older turns (chat_memory.py)
+    summary = db.Column(db.Text)
+    summary_through_id = db.Column(db.Integer)  # last ChatMessage.id folded into the summary
+    summary_updated_at = db.Column(db.DateTime)
+    
     # Relationship
     messages = db.relationship('ChatMessage', backref='session', lazy=True)
 
 class ChatMessage(db.Model):
+    __table_args__ = (
+        # History reads: a session's messages in order
+        db.Index('ix_chat_message_session_id_timestamp', 'session_id', 'timestamp'),
+        # Keyset pages of a session's history (chat_history.py)
+        db.Index('ix_chat_message_session_id_id', 'session_id', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.Integer, db.ForeignKey('chat_session.id'), nullable=False)
     message = db.Column(db.Text, nullable=False)
     is_user = db.Column(db.Boolean, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+class ChatArchive(db.Model):
+    """Compressed messages of an inactive ChatSession, moved out of chat_message; see chat_archive.py"""
+    session_id = db.Column(db.Integer, db.ForeignKey('chat_session.id', ondelete='CASCADE'), primary_key=True)
+    codec = db.Column(db.String(10), nullable=False)  # gzip or zstd
+    payload = db.Column(db.LargeBinary, nullable=False)  # compressed JSON list of messages
+    message_count = db.Column(db.Integer, nullable=False)
+    first_message_at = db.Column(db.DateTime)
+    last_message_at = db.Column(db.DateTime)
+    raw_bytes = db.Column(db.Integer, nullable=False)  # JSON size before compression
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class MedicalFacility(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
@@ -57,22 +85,179 @@ class MedicalFacility(db.Model):
     services = db.Column(db.Text)  # JSON string of services offered
     emergency_services = db.Column(db.Boolean, default=False)
     accepts_insurance = db.Column(db.Boolean, default=True)
+    grid_cell = db.Column(db.Integer, index=True)  # spatial.grid_cell_for(latitude, longitude)
+    external_id = db.Column(db.String(120), unique=True, index=True)  # registry id or facility_natural_key()
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+def facility_natural_key(name, address):
+    """Stable key for a facility without a registry id: hash of its normalized name and address"""
+    normalized = '|'.join(_NON_ALNUM.sub(' ', (part or '').lower()).strip() for part in (name, address))
+    return 'na:' + hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+@event.listens_for(MedicalFacility, 'before_insert')
+@event.listens_for(MedicalFacility, 'before_update')
+def _sync_facility_grid_cell(mapper, connection, target):
+    """Keep the spatial grid cell in step with the facility coordinates"""
+    target.grid_cell = grid_cell_for(target.latitude, target.longitude)
+
+@event.listens_for(MedicalFacility, 'before_insert')
+def _set_facility_external_id(mapper, connection, target):
+    if not target.external_id:
+        target.external_id = facility_natural_key(target.name, target.address)
+
+# Normalized services: MedicalFacility.services keeps the JSON list for
+# display, searches filter through these links
+facility_service = db.Table(
+    'facility_service',
+    db.Column('facility_id', db.Integer, db.ForeignKey('medical_facility.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('service_id', db.Integer, db.ForeignKey('service.id', ondelete='CASCADE'), primary_key=True),
+    # Facilities offering a service
+    db.Index('ix_facility_service_service_id', 'service_id', 'facility_id'),
+)
+
+class Service(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(120), nullable=False, unique=True, index=True)  # service_slug(name)
+    name = db.Column(db.String(120), nullable=False)  # display name as first seen
+
+def service_slug(name):
+    """Case- and whitespace-insensitive key for a service name"""
+    return ' '.join(str(name).lower().split())[:120]
+
+def link_facility_services(connection, services_by_facility):
+    """Replace the service links of {facility_id: services JSON string or list}"""
+    if not services_by_facility:
+        return
+    wanted = {}
+    for facility_id, services in services_by_facility.items():
+        try:
+            names = json.loads(services) if isinstance(services, str) else (services or [])
+        except ValueError:
+            names = []
+        wanted[facility_id] = {service_slug(name): str(name).strip()[:120] for name in names if service_slug(name)}
+
+    names_by_slug = {slug: name for names in wanted.values() for slug, name in names.items()}
+    ids = {}
+    if names_by_slug:
+        lookup = select(Service.slug, Service.id)
+        ids = dict(connection.execute(lookup.where(Service.slug.in_(list(names_by_slug)))).all())
+        missing = [{'slug': slug, 'name': name} for slug, name in names_by_slug.items() if slug not in ids]
+        if missing:
+            # Another process may add the same service at the same time
+            connection.execute(text(
+                "INSERT INTO service (slug, name) VALUES (:slug, :name) ON CONFLICT (slug) DO NOTHING"
+            ), missing)
+            ids.update(connection.execute(lookup.where(Service.slug.in_([row['slug'] for row in missing]))).all())
+
+    connection.execute(facility_service.delete().where(facility_service.c.facility_id.in_(list(wanted))))
+    links = [{'facility_id': facility_id, 'service_id': ids[slug]}
+             for facility_id, names in wanted.items() for slug in names]
+    if links:
+        connection.execute(facility_service.insert(), links)
+
+@event.listens_for(MedicalFacility, 'after_insert')
+def _link_new_facility_services(mapper, connection, target):
+    link_facility_services(connection, {target.id: target.services})
+
+@event.listens_for(MedicalFacility, 'after_update')
+def _relink_facility_services(mapper, connection, target):
+    if inspect(target).attrs.services.history.has_changes():
+        link_facility_services(connection, {target.id: target.services})
+
+@event.listens_for(MedicalFacility, 'before_delete')
+def _unlink_facility_services(mapper, connection, target):
+    connection.execute(facility_service.delete().where(facility_service.c.facility_id == target.id))
 
 class Appointment(db.Model):
+    __table_args__ = (
+        # A facility's bookings by time
+        db.Index('ix_appointment_facility_id_appointment_date', 'facility_id', 'appointment_date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    facility_id = db.Column(db.Integer, db.ForeignKey('medical_facility.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    facility_id = db.Column(db.Integer, db.ForeignKey('medical_facility.id'), nullable=True, index=True)
     appointment_type = db.Column(db.String(50), nullable=False)  # telemedicine, in_person
     appointment_date = db.Column(db.DateTime, nullable=False)
     status = db.Column(db.String(20), default='scheduled')  # scheduled, completed, cancelled
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class FacilitySchedule(db.Model):
+    """Opening hours and slot capacity of a facility on one weekday; see availability.py"""
+    facility_id = db.Column(db.Integer, db.ForeignKey('medical_facility.id', ondelete='CASCADE'), primary_key=True)
+    weekday = db.Column(db.Integer, primary_key=True)  # 0 = Monday
+    opens_minute = db.Column(db.Integer, nullable=False)  # minutes after midnight
+    closes_minute = db.Column(db.Integer, nullable=False)
+    slot_minutes = db.Column(db.Integer, nullable=False, default=30)
+    capacity = db.Column(db.Integer, nullable=False, default=1)  # appointments per slot
+
+class AppointmentSlot(db.Model):
+    """Booked count of one slot, reserved atomically before an Appointment is written"""
+    facility_id = db.Column(db.Integer, primary_key=True)  # 0 = telemedicine pool, no facility
+    slot_start = db.Column(db.DateTime, primary_key=True)
+    booked = db.Column(db.Integer, nullable=False, default=0)
+
 class DiseasePrediction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
     symptoms = db.Column(db.Text, nullable=False)  # JSON string of symptoms
     prediction_result = db.Column(db.Text)  # AI-generated prediction
     confidence_score = db.Column(db.Float)
     recommendations = db.Column(db.Text)
+    urgency_level = db.Column(db.String(20))  # low, medium, high, emergency
+    age_band = db.Column(db.String(10))  # symptom_cache.age_band()
+    analytics_recorded = db.Column(db.Boolean, default=False)  # counted in symptom_analytics.py rollups
+    triage_tier = db.Column(db.String(10))  # emergency, flash or pro (triage.py)
+    analysis_source = db.Column(db.String(10))  # model, cache, rule or fallback (gemini.SymptomAnalysis.source)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SymptomFact(db.Model):
+    """One normalized symptom of a DiseasePrediction"""
+    __table_args__ = (
+        db.Index('ix_symptom_fact_symptom_created_at', 'symptom', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    prediction_id = db.Column(db.Integer, db.ForeignKey('disease_prediction.id', ondelete='CASCADE'),
+                              nullable=False, index=True)
+    symptom = db.Column(db.String(120), nullable=False)  # symptom_cache.normalize_symptom()
+    urgency_level = db.Column(db.String(20), nullable=False)
+    age_band = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+class SymptomRollup(db.Model):
+    """Prediction counts per time bucket, symptom, urgency and age band; symptom '*' counts predictions"""
+    granularity = db.Column(db.String(5), primary_key=True)  # hour or day
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    symptom = db.Column(db.String(120), primary_key=True)
+    urgency_level = db.Column(db.String(20), primary_key=True)
+    age_band = db.Column(db.String(10), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class DataVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)  # e.g. facilities
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Job(db.Model):
+    """Queued AI request run by job_worker.py; see jobs.py"""
+    __table_args__ = (
+        db.Index('ix_job_status_created_at', 'status', 'created_at'),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    kind = db.Column(db.String(50), nullable=False)  # predict_disease, health_goals
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON request data
+    result = db.Column(db.Text)  # JSON response data
+    error = db.Column(db.Text)
+    callback_url = db.Column(db.String(500))
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    claimed_by = db.Column(db.String(64))
+    lease_expires_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
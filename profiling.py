@@ -0,0 +1,157 @@
+"""Opt-in profiling hooks for development and load testing (PROFILING=1).
+
+* Slow-query log: SQL statements slower than PROFILE_SLOW_QUERY_MS are
+  logged with their EXPLAIN plan (SELECTs only, each plan once per process).
+* N+1 detector: a statement that runs PROFILE_N_PLUS_ONE or more times
+  within one request is logged as a likely N+1 pattern, for example a
+  lazy relationship loaded in a loop.
+* Slow-request profiles: a request slower than PROFILE_LATENCY_BUDGET_MS
+  writes two files to PROFILE_DIR. One is a JSON report of its queries and
+  N+1 suspects. The other is a cProfile dump, readable with
+  ``python -m pstats <file>.prof``. cProfile only sees the request thread,
+  so the coroutine part of async views is not in the dump, but its SQL is
+  in the report.
+
+Everything here costs time on every request; leave PROFILING off in production.
+"""
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from flask import g, request
+from sqlalchemy import event
+
+_request_queries = contextvars.ContextVar('profiling_request_queries', default=None)
+_explaining = threading.local()
+_explained = set()
+_explained_lock = threading.Lock()
+_SAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def _explain(engine, statement, parameters):
+    """EXPLAIN a SELECT on a separate connection; returns the plan text"""
+    explain = "EXPLAIN QUERY PLAN" if engine.dialect.name == 'sqlite' else "EXPLAIN"
+    _explaining.active = True
+    try:
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql(f"{explain} {statement}", parameters or ()).fetchall()
+        return '; '.join(str(row[-1]) for row in rows)
+    except Exception as e:
+        return f"unavailable ({e.__class__.__name__}: {e})"
+    finally:
+        _explaining.active = False
+
+
+def _shorten(statement, limit=500):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + '...'
+
+
+def init_app(app, db):
+    """Install the profiling hooks when app.config['PROFILING'] is set (once per app)"""
+    if not app.config.get("PROFILING") or 'profiling' in app.extensions:
+        return
+    app.extensions['profiling'] = True
+
+    slow_query_seconds = app.config.get("PROFILE_SLOW_QUERY_MS", 100) / 1000
+    n_plus_one = app.config.get("PROFILE_N_PLUS_ONE", 5)
+    latency_budget = app.config.get("PROFILE_LATENCY_BUDGET_MS", 500) / 1000
+    profile_dir = app.config.get("PROFILE_DIR") or os.path.join(app.instance_path, "profiles")
+    os.makedirs(profile_dir, exist_ok=True)
+    engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._profiling_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if getattr(_explaining, 'active', False):
+            return
+        elapsed = time.perf_counter() - context._profiling_started
+        queries = _request_queries.get()
+        if queries is not None:
+            queries.append((statement, elapsed))
+        if elapsed < slow_query_seconds:
+            return
+
+        plan = None
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            with _explained_lock:
+                first_time = statement not in _explained
+                _explained.add(statement)
+            if first_time:
+                plan = _explain(engine, statement, parameters)
+        logging.warning(
+            f"Slow query ({elapsed * 1000:.1f} ms): {_shorten(statement)}"
+            + (f"\n  plan: {plan}" if plan else "")
+        )
+
+    @app.before_request
+    def start_profile():
+        g.profiling_started = time.perf_counter()
+        g.profiling_queries = []
+        _request_queries.set(g.profiling_queries)
+        g.profiler = cProfile.Profile()
+        try:
+            g.profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            g.profiler = None
+
+    @app.after_request
+    def finish_profile(response):
+        started = g.pop('profiling_started', None)
+        if started is None:
+            return response
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+        elapsed = time.perf_counter() - started
+        queries = g.pop('profiling_queries', [])
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+
+        counts = {}
+        for statement, _ in queries:
+            counts[statement] = counts.get(statement, 0) + 1
+        suspects = [(statement, count) for statement, count in counts.items() if count >= n_plus_one]
+        for statement, count in suspects:
+            logging.warning(f"Possible N+1 in {request.method} {route}: {count}x {_shorten(statement, 200)}")
+
+        if elapsed >= latency_budget:
+            _write_profile(profile_dir, route, response.status_code, elapsed, queries, suspects, profiler)
+        return response
+
+
+def _write_profile(profile_dir, route, status, elapsed, queries, suspects, profiler):
+    """Write <stamp>_<route>.json (queries, N+1 suspects) and .prof (cProfile) for a slow request"""
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S_%f')
+    base = os.path.join(profile_dir, f"{stamp}_{request.method}_{_SAFE_NAME.sub('_', route).strip('_') or 'root'}")
+    slowest = sorted(queries, key=lambda query: query[1], reverse=True)[:20]
+    report = {
+        'method': request.method,
+        'path': request.full_path,
+        'route': route,
+        'status': status,
+        'duration_ms': round(elapsed * 1000, 2),
+        'query_count': len(queries),
+        'query_ms': round(sum(seconds for _, seconds in queries) * 1000, 2),
+        'slowest_queries': [{'ms': round(seconds * 1000, 2), 'statement': _shorten(statement)}
+                            for statement, seconds in slowest],
+        'n_plus_one_suspects': [{'count': count, 'statement': _shorten(statement)} for statement, count in suspects],
+        'cprofile': f"{base}.prof" if profiler is not None else None,
+    }
+    try:
+        with open(f"{base}.json", 'w') as f:
+            json.dump(report, f, indent=2)
+        if profiler is not None:
+            profiler.dump_stats(f"{base}.prof")
+    except OSError as e:
+        logging.warning(f"Could not write request profile: {e}")
+        return
+    logging.warning(f"Slow request {request.method} {route} took {elapsed * 1000:.0f} ms; profile at {base}.json")
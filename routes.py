@@ -1,103 +1,170 @@
-from flask import render_template, request, jsonify, session
-from app import app
+from flask import Blueprint, Response, current_app, render_template, request, jsonify, session, stream_with_context
 from extensions import db
-from models import User, HealthGoal, ChatSession, ChatMessage, MedicalFacility, Appointment, DiseasePrediction
-from gemini import generate_chat_response, analyze_symptoms, generate_health_goals, generate_health_advice
+from models import User, HealthGoal, ChatSession, ChatMessage, MedicalFacility, Job, service_slug
+from gemini import (generate_chat_response_async, stream_chat_response, admit_chat_stream, analyze_symptoms_async,
+                    generate_health_goals_async, symptom_cache, single_flight)
+from admission import admission, AdmissionRejected
+from circuit_breaker import breakers
+from facility_search import facilities_within, facilities_in_bbox, nearest_facilities, facility_record, KNN_MAX, KNN_MAX_RADIUS_KM
+from facility_snapshot import snapshot_engine, bump_facility_version
+from facility_cache import result_cache
+from facility_clusters import cluster_engine, CLUSTER_MAX_ZOOM
+from availability import availability, book_appointment, InvalidSlot, SlotFull
+from chat_writer import chat_writer
+from chat_memory import conversation_memory
+from chat_history import history_page, export_ndjson
+from symptom_analytics import symptom_summary, MAX_DAYS
+from triage import triage
+from migrations import database_identity
+from jobs import (enqueue_job, job_to_dict, record_prediction, callback_allowed, queue_stats,
+                  FINISHED_STATUSES)
+import asyncio
+import hashlib
 import json
 import logging
+import math
+import metrics
+import time
 import uuid
 from datetime import datetime, timedelta
-import math
 
-@app.route('/')
+bp = Blueprint('main', __name__)
+
+@bp.route('/')
 def index():
     """Homepage with futuristic design and animations"""
     return render_template('index.html')
 
-@app.route('/main')
+@bp.route('/main')
 def main_app():
     """Main application dashboard"""
     return render_template('main_app.html')
 
-@app.route('/chat')
+@bp.route('/chat')
 def chat():
     """AI Chat interface with persona selection"""
     persona = request.args.get('persona', 'general')
     return render_template('chat.html', persona=persona)
 
-@app.route('/facility-finder')
+@bp.route('/facility-finder')
 def facility_finder():
     """Medical facility finder with interactive map"""
     return render_template('facility_finder.html')
 
-@app.route('/health-coach')
+@bp.route('/health-coach')
 def health_coach():
     """Personalized health coaching dashboard"""
     return render_template('health_coach.html')
 
-@app.route('/disease-prediction')
+@bp.route('/disease-prediction')
 def disease_prediction():
     """Disease prediction questionnaire"""
     return render_template('disease_prediction.html')
 
-@app.route('/appointments')
+@bp.route('/appointments')
 def appointments():
     """Telemedicine appointment booking"""
     return render_template('appointments.html')
 
-@app.route('/api/chat', methods=['POST'])
-def api_chat():
+def database_token():
+    """Identity of the database this app writes to, read once per process"""
+    token = current_app.extensions.get('database_identity')
+    if token is None:
+        token = current_app.extensions['database_identity'] = database_identity(db.engine)
+    return token
+
+def cached_chat_session_pk():
+    """ChatSession primary key remembered in the session cookie, if it belongs to this database"""
+    if session.get('chat_session_db') != database_token():
+        # The database was reset or DATABASE_URL changed; the pk may be gone or someone else's
+        return None
+    return session.get('chat_session_pk')
+
+def get_or_create_chat_session_pk(persona_type):
+    """Return the ChatSession primary key for this browser session, creating it if needed"""
+    session_id = session.get('chat_session_id')
+    if session_id and cached_chat_session_pk():
+        # Remembered in the signed session cookie, so no lookup query per message
+        return session['chat_session_pk']
+    
+    chat_session = None
+    if not session_id:
+        session_id = str(uuid.uuid4())
+        session['chat_session_id'] = session_id
+    else:
+        # Get existing session
+        chat_session = ChatSession.query.filter_by(session_id=session_id).first()
+    
+    if not chat_session:
+        # Create new chat session in database
+        chat_session = ChatSession()
+        chat_session.session_id = session_id
+        chat_session.persona_type = persona_type
+        db.session.add(chat_session)
+        db.session.commit()
+    session['chat_session_pk'] = chat_session.id
+    session['chat_session_db'] = database_token()
+    return chat_session.id
+
+def chat_user_context():
+    """User context passed to the chat model"""
+    return {
+        'age': session.get('user_age'),
+        'user_type': session.get('user_type', 'adult')
+    }
+
+def admission_key():
+    """Key for the per-client admission bucket: the user, else a per-browser id"""
+    if session.get('user_id'):
+        return f"user:{session['user_id']}"
+    if 'client_id' not in session:
+        session['client_id'] = uuid.uuid4().hex
+    return f"client:{session['client_id']}"
+
+def admission_rejected_response(e):
+    """429 with Retry-After for a call refused by admission control"""
+    logging.info(f"Rejected AI request from {admission_key()}: {e}")
+    response = jsonify({
+        'success': False,
+        'error': 'The AI service is busy. Please try again shortly.',
+        'retry_after': int(e.retry_after_header)
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = e.retry_after_header
+    return response
+
+def sse_event(event, payload):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def save_chat_turn(chat_session_pk, user_message, ai_response):
+    """Persist a user message and the AI reply (batched when CHAT_WRITE_BEHIND is on)"""
+    rows = [{'session_id': chat_session_pk, 'message': user_message, 'is_user': True}]
+    if ai_response:
+        rows.append({'session_id': chat_session_pk, 'message': ai_response, 'is_user': False})
+    chat_writer.save(rows)
+
+@bp.route('/api/chat', methods=['POST'])
+async def api_chat():
     """Handle AI chat requests"""
     try:
         data = request.get_json()
         message = data.get('message', '')
         persona_type = data.get('persona', 'general')
+        admission.admit_session(admission_key())
         
-        # Get or create session
-        session_id = session.get('chat_session_id')
-        if not session_id:
-            session_id = str(uuid.uuid4())
-            session['chat_session_id'] = session_id
-            
-            # Create new chat session in database
-            chat_session = ChatSession()
-            chat_session.session_id = session_id
-            chat_session.persona_type = persona_type
-            db.session.add(chat_session)
-            db.session.commit()
-        else:
-            # Get existing session
-            chat_session = ChatSession.query.filter_by(session_id=session_id).first()
-            if not chat_session:
-                # Create new session if not found
-                chat_session = ChatSession()
-                chat_session.session_id = session_id
-                chat_session.persona_type = persona_type
-                db.session.add(chat_session)
-                db.session.commit()
-        
-        # Save user message
-        user_msg = ChatMessage()
-        user_msg.session_id = chat_session.id
-        user_msg.message = message
-        user_msg.is_user = True
-        db.session.add(user_msg)
+        chat_session_pk = get_or_create_chat_session_pk(persona_type)
+        history = conversation_memory.context_for(chat_session_pk)
+        # Return the DB connection to the pool while waiting on the model
+        db.session.close()
         
         # Generate AI response
-        user_context = {
-            'age': session.get('user_age'),
-            'user_type': session.get('user_type', 'adult')
-        }
+        user_context = chat_user_context()
+        ai_response = await generate_chat_response_async(message, persona_type, user_context, history)
         
-        ai_response = generate_chat_response(message, persona_type, user_context)
-        
-        # Save AI response
-        ai_msg = ChatMessage()
-        ai_msg.session_id = chat_session.id
-        ai_msg.message = ai_response
-        ai_msg.is_user = False
-        db.session.add(ai_msg)
-        db.session.commit()
+        # Save user message and AI response
+        save_chat_turn(chat_session_pk, message, ai_response)
+        conversation_memory.schedule_refresh(chat_session_pk)
         
         return jsonify({
             'success': True,
@@ -105,6 +172,8 @@ def api_chat():
             'persona': persona_type
         })
         
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
     except Exception as e:
         logging.error(f"Chat API error: {e}")
         return jsonify({
@@ -112,7 +181,118 @@ def api_chat():
             'error': 'Failed to process chat message'
         }), 500
 
-@app.route('/api/nearby-facilities')
+@bp.route('/api/chat/stream', methods=['POST'])
+def api_chat_stream():
+    """Stream an AI chat response as Server-Sent Events"""
+    try:
+        data = request.get_json()
+        message = data.get('message', '')
+        persona_type = data.get('persona', 'general')
+        admission.admit_session(admission_key())
+        chat_session_pk = get_or_create_chat_session_pk(persona_type)
+        history = conversation_memory.context_for(chat_session_pk)
+        db.session.close()
+        user_context = chat_user_context()
+        admit_chat_stream()
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except Exception as e:
+        logging.error(f"Chat stream API error: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to process chat message'
+        }), 500
+    
+    def generate():
+        chunks = []
+        completed = False
+        try:
+            for chunk in stream_chat_response(message, persona_type, user_context, history):
+                chunks.append(chunk)
+                yield sse_event('token', {'text': chunk})
+            completed = True
+            yield sse_event('done', {'response': ''.join(chunks), 'persona': persona_type})
+        finally:
+            # Runs on normal completion and when the client disconnects mid-stream
+            try:
+                save_chat_turn(chat_session_pk, message, ''.join(chunks))
+                conversation_memory.schedule_refresh(chat_session_pk)
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Chat stream persistence error: {e}")
+            if not completed:
+                logging.info(f"Chat stream for session {chat_session_pk} ended early after {len(chunks)} chunks")
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def readable_chat_session_pk(session_id=None):
+    """ChatSession primary key this browser may read: its own session, or one of the logged-in user's"""
+    if not session_id:
+        return cached_chat_session_pk()
+    chat_session = ChatSession.query.filter_by(session_id=session_id).first()
+    if chat_session is None:
+        return None
+    if chat_session.id == cached_chat_session_pk():
+        return chat_session.id
+    if session.get('user_id') and chat_session.user_id == session['user_id']:
+        return chat_session.id
+    return None
+
+@bp.route('/api/chat/history')
+def api_chat_history():
+    """One page of chat history, oldest first; ?before=<id> for older messages, ?after=<id> for newer"""
+    try:
+        chat_session_pk = readable_chat_session_pk(request.args.get('session_id'))
+        if chat_session_pk is None:
+            if request.args.get('session_id'):
+                return jsonify({'success': False, 'error': 'Chat session not found'}), 404
+            return jsonify({'success': True, 'messages': [], 'has_more': False})
+
+        messages, has_more = history_page(
+            chat_session_pk,
+            before=request.args.get('before', type=int),
+            after=request.args.get('after', type=int),
+            limit=request.args.get('limit', 50, type=int)
+        )
+        return jsonify({
+            'success': True,
+            'messages': messages,
+            'has_more': has_more,
+            # Cursors for the next page in either direction
+            'oldest_id': messages[0]['id'] if messages else None,
+            'newest_id': messages[-1]['id'] if messages else None
+        })
+
+    except Exception as e:
+        logging.error(f"Chat history error: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to load chat history'
+        }), 500
+
+@bp.route('/api/chat/history/export')
+def api_chat_history_export():
+    """Stream chat history as NDJSON; ?scope=user exports every session of the logged-in user"""
+    if request.args.get('scope') == 'user':
+        if not session.get('user_id'):
+            return jsonify({'success': False, 'error': 'Log in to export all your chat sessions'}), 401
+        chat_session_pks = [row.id for row in db.session.query(ChatSession.id).filter(
+            ChatSession.user_id == session['user_id'])]
+    else:
+        chat_session_pk = readable_chat_session_pk(request.args.get('session_id'))
+        if chat_session_pk is None:
+            return jsonify({'success': False, 'error': 'Chat session not found'}), 404
+        chat_session_pks = [chat_session_pk]
+
+    response = Response(stream_with_context(export_ndjson(chat_session_pks)), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = 'attachment; filename="chat-history.ndjson"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/api/nearby-facilities')
 def api_nearby_facilities():
     """Get nearby medical facilities based on location and filters"""
     try:
@@ -127,50 +307,43 @@ def api_nearby_facilities():
         lng = float(lng_str)
         radius = float(radius_str)  # km
         facility_type = request.args.get('type', 'all')
+        k = request.args.get('k', type=int)
+        if k is not None and k < 1:
+            return jsonify({'success': False, 'error': 'k must be at least 1'}), 400
+        if k:
+            # Every engine (database, snapshot, result cache) must see the same k
+            k = min(k, KNN_MAX)
+        filters = {
+            'emergency_only': request.args.get('emergency') in ('1', 'true'),
+            'insurance_only': request.args.get('insurance') in ('1', 'true'),
+            # Repeat service= to require several services
+            'services': tuple(dict.fromkeys(
+                service_slug(name) for name in request.args.getlist('service') if service_slug(name)
+            ))
+        }
+        # k-nearest mode is bounded by radius only when the caller supplied one
+        max_radius = radius if not k or 'radius' in request.args else KNN_MAX_RADIUS_KM
         
-        # Calculate bounding box for database query optimization
-        lat_range = radius / 111.0  # Approximate km per degree latitude
-        lng_range = radius / (111.0 * math.cos(math.radians(lat)))
-        
-        # Query facilities within bounding box
-        query = MedicalFacility.query.filter(
-            MedicalFacility.latitude.between(lat - lat_range, lat + lat_range),
-            MedicalFacility.longitude.between(lng - lng_range, lng + lng_range)
-        )
-        
-        if facility_type != 'all':
-            query = query.filter(MedicalFacility.facility_type == facility_type)
-        
-        facilities = query.all()
-        
-        # Calculate actual distances and filter by radius
-        results = []
-        for facility in facilities:
-            distance = calculate_distance(lat, lng, facility.latitude, facility.longitude)
-            if distance <= radius:
-                results.append({
-                    'id': facility.id,
-                    'name': facility.name,
-                    'type': facility.facility_type,
-                    'address': facility.address,
-                    'lat': facility.latitude,
-                    'lng': facility.longitude,
-                    'phone': facility.phone,
-                    'website': facility.website,
-                    'services': json.loads(facility.services) if facility.services else [],
-                    'emergency_services': facility.emergency_services,
-                    'accepts_insurance': facility.accepts_insurance,
-                    'distance': round(distance, 2)
-                })
-        
-        # Sort by distance
-        results.sort(key=lambda x: x['distance'])
-        
-        return jsonify({
-            'success': True,
-            'facilities': results,
-            'count': len(results)
-        })
+        # Results only change with the facility data, so repeat searches can be revalidated cheaply
+        etag = f"fac-{result_cache.version()}-{hashlib.sha1(request.query_string).hexdigest()[:16]}"
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            def search(search_lat, search_lng, search_radius, search_k):
+                return search_facilities(search_lat, search_lng, search_radius, facility_type, search_k, filters)
+            
+            if current_app.config.get('FACILITY_CACHE'):
+                results = result_cache.search(lat, lng, max_radius, facility_type, k, filters, search)
+            else:
+                results = search(lat, lng, max_radius, k)
+            response = jsonify({
+                'success': True,
+                'facilities': results,
+                'count': len(results)
+            })
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = f"public, max-age={current_app.config['FACILITY_CACHE_MAX_AGE']}"
+        return response
         
     except Exception as e:
         logging.error(f"Facility search error: {e}")
@@ -179,7 +352,75 @@ def api_nearby_facilities():
             'error': 'Failed to search facilities'
         }), 500
 
-@app.route('/api/health-goals', methods=['GET', 'POST'])
+def search_facilities(lat, lng, radius, facility_type, k, filters):
+    """Run a nearby search on the facility snapshot or the database; returns result dicts"""
+    if current_app.config.get('FACILITY_SNAPSHOT') and snapshot_engine.available:
+        return snapshot_engine.search(lat, lng, radius, facility_type, k=k, **filters)
+    if k:
+        # Grow search rings until k facilities are found
+        matches = nearest_facilities(lat, lng, k, facility_type, radius, **filters)
+    else:
+        matches = facilities_within(lat, lng, radius, facility_type, **filters)
+    return [facility_to_dict(facility, distance) for facility, distance in matches]
+
+@bp.route('/api/facility-clusters')
+def api_facility_clusters():
+    """Facility clusters for a map viewport; individual facilities at high zoom"""
+    try:
+        bbox = request.args.get('bbox', '')
+        zoom = request.args.get('zoom', type=int)
+        try:
+            # Leaflet's toBBoxString() order
+            west, south, east, north = (float(value) for value in bbox.split(','))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'bbox must be west,south,east,north'}), 400
+        if zoom is None or not -90 <= south <= north <= 90:
+            return jsonify({'success': False, 'error': 'Missing zoom or invalid bbox'}), 400
+        if not cluster_engine.available:
+            return jsonify({'success': False, 'error': 'Facility clustering is unavailable'}), 503
+        if east - west >= 360:
+            west, east = -180.0, 180.0
+        else:
+            # Leaflet reports longitudes past ±180 when the map is panned around the world
+            west, east = (value - 360 * math.floor((value + 180) / 360) for value in (west, east))
+        facility_type = request.args.get('type', 'all')
+
+        etag = f"fac-{result_cache.version()}-{hashlib.sha1(request.query_string).hexdigest()[:16]}"
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            payload = None
+            if zoom > CLUSTER_MAX_ZOOM:
+                max_points = current_app.config['FACILITY_CLUSTER_MAX_POINTS']
+                facilities = facilities_in_bbox(south, west, north, east, facility_type, limit=max_points + 1)
+                if len(facilities) <= max_points:
+                    records = [facility_record(facility) for facility in facilities]
+                    payload = {'mode': 'facilities', 'facilities': records, 'count': len(records)}
+            if payload is None:
+                clusters = cluster_engine.get().clusters(south, west, north, east, zoom, facility_type)
+                payload = {'mode': 'clusters', 'clusters': clusters,
+                           'count': sum(cluster['count'] for cluster in clusters)}
+            response = jsonify(dict(success=True, zoom=zoom, **payload))
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = f"public, max-age={current_app.config['FACILITY_CACHE_MAX_AGE']}"
+        return response
+
+    except Exception as e:
+        logging.error(f"Facility cluster error: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to load facility clusters'
+        }), 500
+
+@bp.route('/api/facility-cache/stats')
+def api_facility_cache_stats():
+    """Hit/miss counters and size of the nearby-facility result cache"""
+    return jsonify({
+        'success': True,
+        'cache': result_cache.stats()
+    })
+
+@bp.route('/api/health-goals', methods=['GET', 'POST'])
 def api_health_goals():
     """Handle health goals CRUD operations"""
     if request.method == 'GET':
@@ -228,7 +469,7 @@ def api_health_goals():
                 'error': 'Failed to create goal'
             }), 500
 
-@app.route('/api/health-goals/<int:goal_id>/progress', methods=['POST'])
+@bp.route('/api/health-goals/<int:goal_id>/progress', methods=['POST'])
 def api_update_goal_progress(goal_id):
     """Update progress for a health goal"""
     try:
@@ -253,11 +494,33 @@ def api_update_goal_progress(goal_id):
             'error': 'Failed to update progress'
         }), 500
 
-@app.route('/api/generate-health-goals', methods=['POST'])
-def api_generate_health_goals():
+def wants_job(data):
+    """Queue the request as a job when AI_JOBS is on or the client asks with "async": true"""
+    return current_app.config['AI_JOBS'] or bool(data.get('async'))
+
+def job_accepted_response(kind, payload, data):
+    """Enqueue a job and return 202 with its id, or 400 for a disallowed callback_url"""
+    callback_url = data.get('callback_url')
+    if callback_url and not callback_allowed(callback_url):
+        return jsonify({
+            'success': False,
+            'error': 'callback_url host is not allowed'
+        }), 400
+
+    job = enqueue_job(kind, payload, session.get('user_id'), callback_url)
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f"/api/jobs/{job.id}"
+    }), 202
+
+@bp.route('/api/generate-health-goals', methods=['POST'])
+async def api_generate_health_goals():
     """Generate AI-powered health goal suggestions"""
     try:
         data = request.get_json()
+        admission.admit_session(admission_key())
         user_profile = {
             'age': data.get('age', 30),
             'health_status': data.get('health_status', 'good'),
@@ -266,13 +529,18 @@ def api_generate_health_goals():
             'preferences': data.get('preferences', [])
         }
         
-        suggestions = generate_health_goals(user_profile)
+        if wants_job(data):
+            return job_accepted_response('health_goals', user_profile, data)
+
+        suggestions = await generate_health_goals_async(user_profile)
         
         return jsonify({
             'success': True,
             'suggestions': [suggestion.dict() for suggestion in suggestions]
         })
         
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
     except Exception as e:
         logging.error(f"Goal generation error: {e}")
         return jsonify({
@@ -280,25 +548,29 @@ def api_generate_health_goals():
             'error': 'Failed to generate goal suggestions'
         }), 500
 
-@app.route('/api/predict-disease', methods=['POST'])
-def api_predict_disease():
+@bp.route('/api/predict-disease', methods=['POST'])
+async def api_predict_disease():
     """Analyze symptoms and predict potential conditions"""
     try:
         data = request.get_json()
         symptoms = data.get('symptoms', [])
         user_age = data.get('age')
+
+        # Triaged once; emergencies are answered locally, so they skip admission and the job queue
+        decision = triage(symptoms, user_age)
+        emergency = decision.tier == 'emergency'
+        if not emergency:
+            admission.admit_session(admission_key())
+        if wants_job(data) and (not emergency or data.get('callback_url')):
+            return job_accepted_response('predict_disease', {
+                'symptoms': symptoms, 'age': user_age, 'triage': decision._asdict()
+            }, data)
         
         # Analyze symptoms using AI
-        analysis = analyze_symptoms(symptoms, user_age)
+        analysis = await analyze_symptoms_async(symptoms, user_age, decision)
         
         # Save prediction to database
-        prediction = DiseasePrediction()
-        prediction.user_id = session.get('user_id')
-        prediction.symptoms = json.dumps(symptoms)
-        prediction.prediction_result = analysis.prediction
-        prediction.confidence_score = analysis.confidence
-        prediction.recommendations = json.dumps(analysis.recommendations)
-        db.session.add(prediction)
+        record_prediction(session.get('user_id'), symptoms, analysis, user_age, decision)
         db.session.commit()
         
         return jsonify({
@@ -309,6 +581,8 @@ def api_predict_disease():
             'urgency_level': analysis.urgency_level
         })
         
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
     except Exception as e:
         logging.error(f"Disease prediction error: {e}")
         return jsonify({
@@ -316,26 +590,135 @@ def api_predict_disease():
             'error': 'Failed to analyze symptoms'
         }), 500
 
-@app.route('/api/book-appointment', methods=['POST'])
+@bp.route('/api/analytics/symptoms')
+def api_symptom_analytics():
+    """Symptom trends from the prediction rollups; ?hours=N or ?days=N, optional age_band and urgency"""
+    try:
+        hours = request.args.get('hours', type=int)
+        days = request.args.get('days', type=int)
+        if (hours is not None and not 1 <= hours <= MAX_DAYS * 24) or (days is not None and not 1 <= days <= MAX_DAYS):
+            return jsonify({
+                'success': False,
+                'error': f"hours and days must cover between 1 hour and {MAX_DAYS} days"
+            }), 400
+
+        summary = symptom_summary(
+            hours=hours,
+            days=days,
+            age_band=request.args.get('age_band'),
+            urgency=request.args.get('urgency'),
+            limit=min(max(request.args.get('limit', 10, type=int), 1), 100)
+        )
+        return jsonify({
+            'success': True,
+            **summary
+        })
+
+    except Exception as e:
+        logging.error(f"Symptom analytics error: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to load symptom analytics'
+        }), 500
+
+@bp.route('/api/jobs/<job_id>')
+async def api_job_status(job_id):
+    """Job status and result; ?wait=N long-polls up to N seconds for it to finish"""
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), current_app.config['JOB_MAX_WAIT'])
+        deadline = time.monotonic() + wait
+        while True:
+            job = db.session.get(Job, job_id)
+            if job is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Job not found'
+                }), 404
+            if job.status in FINISHED_STATUSES or time.monotonic() >= deadline:
+                break
+            # Release the connection and drop the cached row between polls
+            db.session.close()
+            await asyncio.sleep(current_app.config['JOB_POLL_INTERVAL'])
+
+        return jsonify({
+            'success': True,
+            'job': job_to_dict(job)
+        })
+
+    except Exception as e:
+        logging.error(f"Job status error: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to load job'
+        }), 500
+
+@bp.route('/api/jobs/stats')
+def api_job_stats():
+    """Job counts by status and the age of the oldest queued job"""
+    return jsonify({
+        'success': True,
+        'jobs': queue_stats()
+    })
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    """Request, database and Gemini metrics in Prometheus text format"""
+    return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@bp.route('/api/admission/stats')
+def api_admission_stats():
+    """Admission queue depth and admitted/queued/rejected counts for this process"""
+    return jsonify({
+        'success': True,
+        'admission': admission.stats()
+    })
+
+@bp.route('/api/circuit-breakers/stats')
+def api_circuit_breaker_stats():
+    """State of each model's circuit breaker in this process"""
+    return jsonify({
+        'success': True,
+        'breakers': breakers.stats()
+    })
+
+@bp.route('/api/symptom-cache/stats')
+def api_symptom_cache_stats():
+    """Hit/miss counters for the analyze_symptoms response cache"""
+    return jsonify({
+        'success': True,
+        'cache': symptom_cache.stats()
+    })
+
+@bp.route('/api/single-flight/stats')
+def api_single_flight_stats():
+    """How many model calls were coalesced onto identical in-flight calls"""
+    return jsonify({
+        'success': True,
+        'single_flight': single_flight.stats()
+    })
+
+@bp.route('/api/book-appointment', methods=['POST'])
 def api_book_appointment():
     """Book a telemedicine appointment"""
     try:
         data = request.get_json()
-        
-        appointment = Appointment()
-        appointment.user_id = session.get('user_id', 1)
-        appointment.facility_id = data.get('facility_id')
-        appointment.appointment_type = data.get('appointment_type', 'telemedicine')
-        appointment.appointment_date = datetime.strptime(data['appointment_date'], '%Y-%m-%d %H:%M')
-        appointment.notes = data.get('notes', '')
-        db.session.add(appointment)
-        db.session.commit()
+        appointment = book_appointment(
+            session.get('user_id', 1),
+            data.get('facility_id'),
+            data.get('appointment_type', 'telemedicine'),
+            datetime.strptime(data['appointment_date'], '%Y-%m-%d %H:%M'),
+            data.get('notes', ''),
+        )
         
         return jsonify({
             'success': True,
             'appointment_id': appointment.id
         })
         
+    except InvalidSlot as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except SlotFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
     except Exception as e:
         logging.error(f"Appointment booking error: {e}")
         return jsonify({
@@ -343,23 +726,38 @@ def api_book_appointment():
             'error': 'Failed to book appointment'
         }), 500
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two points using Haversine formula"""
-    R = 6371  # Earth's radius in kilometers
-    
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
-    
-    a = (math.sin(delta_lat / 2) ** 2 +
-         math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon / 2) ** 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    
-    return R * c
+@bp.route('/api/availability')
+def api_availability():
+    """Free places per appointment slot; ?facility_id= (omit for telemedicine), ?date=, ?days="""
+    try:
+        facility_id = request.args.get('facility_id', type=int)
+        day = request.args.get('date')
+        try:
+            start_day = datetime.strptime(day, '%Y-%m-%d').date() if day else datetime.now().date()
+        except ValueError:
+            return jsonify({'success': False, 'error': 'date must be YYYY-MM-DD'}), 400
+        if facility_id and db.session.get(MedicalFacility, facility_id) is None:
+            return jsonify({'success': False, 'error': 'Facility not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            'facility_id': facility_id,
+            'days': availability(facility_id, start_day, request.args.get('days', 1, type=int))
+        })
+        
+    except Exception as e:
+        logging.error(f"Availability error: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to load availability'
+        }), 500
+
+def facility_to_dict(facility, distance):
+    """Serialize a facility search result"""
+    return dict(facility_record(facility), distance=round(distance, 2))
 
 # Initialize sample data
-@app.route('/api/init-sample-data', methods=['POST'])
+@bp.route('/api/init-sample-data', methods=['POST'])
 def init_sample_data():
     """Initialize sample medical facilities data"""
     try:
@@ -419,6 +817,7 @@ def init_sample_data():
             facility = MedicalFacility(**facility_data)
             db.session.add(facility)
         
+        bump_facility_version()
         db.session.commit()
         
         return jsonify({
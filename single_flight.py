@@ -0,0 +1,230 @@
+"""Single-flight coalescing of identical concurrent model calls.
+
+When many requests ask for the same thing at once (a popular symptom set, the
+same goal profile), only the first one calls the model; the rest wait for
+that call and share its result or its error.
+
+Within a process, callers are coalesced on the Gemini event loop through a
+map of in-flight tasks. Across gunicorn workers on the same host, the first
+worker to claim a key in a small shared SQLite file becomes the leader. The
+other workers poll that row for the result. The claim is a lease: if the
+leader dies, a waiting worker takes over once the lease expires. Finished
+results stay readable for SINGLE_FLIGHT_GRACE seconds, so pollers that wake
+just after completion still find them. This is a rendezvous, not a cache: a
+failed call is only reported to callers that were already waiting, and the
+next caller claims the key afresh. Exception types listed in ``reraise``
+(admission rejections, open circuits) reach followers in other workers as
+themselves; any other failure arrives as SingleFlightError.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class SingleFlightError(Exception):
+    """Raised in followers when the shared leader call failed"""
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key, in process and across processes"""
+
+    def __init__(self, path, shared=True, lease_seconds=90.0, poll_interval=0.05, grace_seconds=5.0,
+                 enabled=True, reraise=()):
+        self.path = path
+        self.shared = shared
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.grace_seconds = grace_seconds
+        self.enabled = enabled
+        self._reraise = {cls.__name__: cls for cls in reraise}
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._in_flight = {}
+        self._pid = os.getpid()
+        self.calls = 0
+        self.leader_calls = 0
+        self.coalesced_local = 0
+        self.coalesced_shared = 0
+        self.takeovers = 0
+        self.shared_errors = 0
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS single_flight ("
+                " key TEXT PRIMARY KEY,"
+                " owner TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " payload TEXT,"
+                " error TEXT,"
+                " finished_at REAL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def _claim(self, key, owner):
+        """Take the lease on key unless a live leader holds it; returns True if taken"""
+        now = time.time()
+        conn = self._connect()
+        # A failed call is never reused; only callers already polling saw its error
+        conn.execute(
+            "DELETE FROM single_flight WHERE key = ? AND "
+            "((finished_at IS NULL AND expires_at < ?) OR error IS NOT NULL OR finished_at < ?)",
+            (key, now, now - self.grace_seconds)
+        )
+        return conn.execute(
+            "INSERT OR IGNORE INTO single_flight (key, owner, expires_at) VALUES (?, ?, ?)",
+            (key, owner, now + self.lease_seconds)
+        ).rowcount == 1
+
+    def _poll(self, key):
+        """Return (state, value) for key: 'done', 'error', 'running' or 'gone'"""
+        row = self._connect().execute(
+            "SELECT payload, error, finished_at, expires_at FROM single_flight WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return 'gone', None
+        payload, error, finished_at, expires_at = row
+        if finished_at is not None:
+            return ('error', error) if error is not None else ('done', json.loads(payload))
+        if expires_at < time.time():
+            return 'gone', None
+        return 'running', None
+
+    def _encode_error(self, error):
+        data = {'type': error.__class__.__name__, 'message': str(error)}
+        if data['type'] in self._reraise:
+            data['attrs'] = {name: value for name, value in vars(error).items()
+                             if isinstance(value, (str, int, float, bool, type(None)))}
+        return json.dumps(data)
+
+    def _decode_error(self, value):
+        """The exception a follower raises for a leader's stored error"""
+        try:
+            data = json.loads(value)
+        except (TypeError, ValueError):
+            data = None
+        if not isinstance(data, dict):
+            return SingleFlightError(value)
+        cls = self._reraise.get(data.get('type'))
+        if cls is None:
+            return SingleFlightError(f"{data.get('type')}: {data.get('message')}")
+        error = cls.__new__(cls)
+        Exception.__init__(error, data.get('message'))
+        error.__dict__.update(data.get('attrs') or {})
+        return error
+
+    def _finish(self, key, owner, payload=None, error=None):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "UPDATE single_flight SET payload = ?, error = ?, finished_at = ? WHERE key = ? AND owner = ?",
+            (json.dumps(payload) if error is None else None, error, now, key, owner)
+        )
+        conn.execute("DELETE FROM single_flight WHERE finished_at < ?", (now - self.grace_seconds,))
+
+    async def _lead(self, key, fn):
+        """Run fn once for key, taking or waiting on the shared lease when enabled"""
+        if not self.shared:
+            self._count(leader_calls=1)
+            return await fn()
+
+        owner = uuid.uuid4().hex
+        waited = False
+        while True:
+            try:
+                claimed = await asyncio.to_thread(self._claim, key, owner)
+            except sqlite3.Error as e:
+                logging.warning(f"Single-flight claim failed, calling directly: {e}")
+                self._count(leader_calls=1)
+                return await fn()
+
+            if claimed:
+                self._count(leader_calls=1, takeovers=1 if waited else 0)
+                try:
+                    payload = await fn()
+                except Exception as e:
+                    await asyncio.to_thread(self._finish_quietly, key, owner, None, self._encode_error(e))
+                    raise
+                await asyncio.to_thread(self._finish_quietly, key, owner, payload, None)
+                return payload
+
+            # Another worker is calling the model; wait for its result
+            waited = True
+            while True:
+                await asyncio.sleep(self.poll_interval)
+                try:
+                    state, value = await asyncio.to_thread(self._poll, key)
+                except sqlite3.Error:
+                    continue
+                if state == 'done':
+                    self._count(coalesced_shared=1)
+                    return value
+                if state == 'error':
+                    self._count(coalesced_shared=1, shared_errors=1)
+                    raise self._decode_error(value)
+                if state == 'gone':
+                    break
+
+    def _finish_quietly(self, key, owner, payload, error):
+        try:
+            self._finish(key, owner, payload, error)
+        except sqlite3.Error as e:
+            logging.warning(f"Single-flight result write failed: {e}")
+
+    async def do(self, namespace, key, fn):
+        """Return the JSON-serializable result of ``await fn()``, shared by concurrent callers with the same key
+
+        Must be awaited on the Gemini loop.
+        """
+        self._count(calls=1)
+        if not self.enabled:
+            self._count(leader_calls=1)
+            return await fn()
+
+        if self._pid != os.getpid():
+            self._in_flight, self._pid = {}, os.getpid()
+
+        flight_key = f"{namespace}:{key}"
+        task = self._in_flight.get(flight_key)
+        if task is not None:
+            self._count(coalesced_local=1)
+        else:
+            task = asyncio.ensure_future(self._lead(flight_key, fn))
+            self._in_flight[flight_key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(flight_key, None))
+        # Shield so a cancelled caller doesn't cancel the call others are waiting on
+        return await asyncio.shield(task)
+
+    def stats(self):
+        with self._stats_lock:
+            coalesced = self.coalesced_local + self.coalesced_shared
+            return {
+                'enabled': self.enabled,
+                'shared': self.shared,
+                'calls': self.calls,
+                'model_calls': self.leader_calls,
+                'coalesced': coalesced,
+                'coalesced_in_process': self.coalesced_local,
+                'coalesced_across_workers': self.coalesced_shared,
+                'coalesced_rate': round(coalesced / self.calls, 4) if self.calls else 0.0,
+                'lease_takeovers': self.takeovers,
+                'shared_errors': self.shared_errors,
+                'in_flight': len(self._in_flight),
+            }
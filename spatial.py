@@ -0,0 +1,132 @@
+"""Grid-cell spatial indexing helpers for medical facility lookups.
+
+The world is divided into fixed-size latitude/longitude cells. Every facility
+stores the integer key of the cell it falls in (``MedicalFacility.grid_cell``),
+which is indexed, so a radius search becomes a handful of indexed range scans
+instead of a full table scan.
+"""
+import math
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE_LAT = 111.0
+
+# Cell size in degrees. Changing this invalidates every stored grid_cell, so
+# run facility_search.rebuild_grid_cells() afterwards.
+GRID_CELL_DEG = 0.05
+GRID_ROWS = int(round(180 / GRID_CELL_DEG))
+GRID_COLS = int(round(360 / GRID_CELL_DEG))
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """Calculate distance between two points using Haversine formula"""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+
+    a = (math.sin(delta_lat / 2) ** 2 +
+         math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon / 2) ** 2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return EARTH_RADIUS_KM * c
+
+
+def _row_for(lat):
+    return min(max(int(math.floor((lat + 90) / GRID_CELL_DEG)), 0), GRID_ROWS - 1)
+
+
+def _col_for(lng):
+    return int(math.floor((lng + 180) / GRID_CELL_DEG)) % GRID_COLS
+
+
+def grid_cell_for(lat, lng):
+    """Return the grid cell key for a coordinate"""
+    if lat is None or lng is None:
+        return None
+    return _row_for(lat) * GRID_COLS + _col_for(lng)
+
+
+def _col_ranges(col_lo, col_hi):
+    """Split an unwrapped column span into ranges that respect the antimeridian"""
+    if col_hi - col_lo + 1 >= GRID_COLS:
+        return [(0, GRID_COLS - 1)]
+    lo = col_lo % GRID_COLS
+    hi = col_hi % GRID_COLS
+    if lo <= hi:
+        return [(lo, hi)]
+    return [(lo, GRID_COLS - 1), (0, hi)]
+
+
+def _lng_span_deg(lat, radius_km):
+    """Longitude half-width in degrees of a circle, widest at its polar edge"""
+    edge_lat = min(abs(lat) + radius_km / KM_PER_DEGREE_LAT, 89.9)
+    cos_lat = math.cos(math.radians(edge_lat))
+    return min(radius_km / (KM_PER_DEGREE_LAT * cos_lat), 180.0)
+
+
+def bounding_box(lat, lng, radius_km):
+    """Return (min_lat, max_lat, min_lng, max_lng) enclosing a search circle"""
+    lat_range = radius_km / KM_PER_DEGREE_LAT
+    lng_range = _lng_span_deg(lat, radius_km)
+    return lat - lat_range, lat + lat_range, lng - lng_range, lng + lng_range
+
+
+def cell_ranges(lat, lng, radius_km):
+    """Return inclusive (lo, hi) grid_cell key ranges covering a search circle
+
+    Cells in one grid row have consecutive keys, so the covering set collapses
+    to at most two ranges per row.
+    """
+    return bbox_cell_ranges(*bounding_box(lat, lng, radius_km))
+
+
+def bbox_cell_ranges(min_lat, max_lat, min_lng, max_lng):
+    """Return inclusive grid_cell key ranges covering a lat/lng box; longitudes past ±180 wrap"""
+    row_lo, row_hi = _row_for(min_lat), _row_for(max_lat)
+    col_lo = int(math.floor((min_lng + 180) / GRID_CELL_DEG))
+    col_hi = int(math.floor((max_lng + 180) / GRID_CELL_DEG))
+    cols = _col_ranges(col_lo, col_hi)
+
+    ranges = []
+    for row in range(row_lo, row_hi + 1):
+        base = row * GRID_COLS
+        ranges.extend((base + lo, base + hi) for lo, hi in cols)
+    return ranges
+
+
+def ring_band_ranges(lat, lng, inner, outer):
+    """Return grid_cell key ranges for the cells between two square rings
+
+    Covers every cell whose ring distance (Chebyshev distance in cells) from
+    the cell containing the point is greater than ``inner`` and at most
+    ``outer``. Pass ``inner=-1`` to include the centre cell.
+    """
+    row0 = _row_for(lat)
+    col0 = int(math.floor((lng + 180) / GRID_CELL_DEG))
+    full_width = _col_ranges(col0 - outer, col0 + outer)
+    if inner < 0:
+        sides = []
+    else:
+        sides = (_col_ranges(col0 - outer, col0 - inner - 1) +
+                 _col_ranges(col0 + inner + 1, col0 + outer))
+        if 2 * outer + 1 >= GRID_COLS:
+            sides = full_width
+
+    ranges = []
+    for row in range(max(row0 - outer, 0), min(row0 + outer, GRID_ROWS - 1) + 1):
+        base = row * GRID_COLS
+        in_band_row = inner < 0 or abs(row - row0) > inner
+        for lo, hi in (full_width if in_band_row else sides):
+            ranges.append((base + lo, base + hi))
+    return ranges
+
+
+def ring_coverage_km(lat, ring):
+    """Distance from a point that is guaranteed searched once rings 0..ring are scanned"""
+    if ring <= 0:
+        return 0.0
+    cell_h = GRID_CELL_DEG * KM_PER_DEGREE_LAT
+    edge_lat = min(abs(lat) + ring * GRID_CELL_DEG, 89.9)
+    cell_w = cell_h * math.cos(math.radians(edge_lat))
+    return ring * min(cell_h, cell_w)
+
@@ -4,15 +4,58 @@ let currentChatSession = null;
 let isTyping = false;
 let currentPersona = 'general';
 let voiceRecognition = null;
+let oldestHistoryId = null;
+
+// Messages fetched per history page
+const HISTORY_PAGE_SIZE = 20;
 
 // Initialize chat
 function initializeChat(persona = 'general') {
     currentPersona = persona;
     setupEventListeners();
     initializeVoiceRecognition();
+    loadChatHistory();
     console.log(`Chat initialized with persona: ${persona}`);
 }
 
+// Load a page of this browser's earlier messages, newest page first
+async function loadChatHistory() {
+    const messagesContainer = document.getElementById('chat-messages');
+    if (!messagesContainer) return;
+    
+    try {
+        const cursor = oldestHistoryId ? `&before=${oldestHistoryId}` : '';
+        const response = await IntelliMed.api.get(`/api/chat/history?limit=${HISTORY_PAGE_SIZE}${cursor}`);
+        if (!response.success || response.messages.length === 0) return;
+        
+        // Older pages go above what is shown, below the welcome message
+        const moreButton = messagesContainer.querySelector('.history-more');
+        const firstShown = moreButton ? moreButton.nextElementSibling : messagesContainer.children[1];
+        const fragment = document.createDocumentFragment();
+        response.messages.forEach(item => {
+            const messageDiv = addMessageToChat(item.message, item.is_user).parentElement;
+            fragment.appendChild(messageDiv);
+        });
+        moreButton?.remove();
+        if (response.has_more) {
+            fragment.prepend(createHistoryMoreButton());
+        }
+        messagesContainer.insertBefore(fragment, firstShown || null);
+        oldestHistoryId = response.oldest_id;
+    } catch (error) {
+        console.error('Chat history error:', error);
+    }
+}
+
+// Button that loads the next older history page
+function createHistoryMoreButton() {
+    const wrapper = document.createElement('div');
+    wrapper.className = 'history-more text-center my-2';
+    wrapper.innerHTML = '<button class="btn btn-sm btn-outline-secondary">Show earlier messages</button>';
+    wrapper.querySelector('button').addEventListener('click', loadChatHistory);
+    return wrapper;
+}
+
 // Setup event listeners
 function setupEventListeners() {
     const messageInput = document.getElementById('message-input');
@@ -131,25 +174,14 @@ async function sendMessage() {
     showTypingIndicator();
 
     try {
-        // Send message to API
-        const response = await IntelliMed.api.post('/api/chat', {
-            message: message,
-            persona: currentPersona
-        });
-
-        if (response.success) {
-            // Hide typing indicator
-            hideTypingIndicator();
-            
-            // Add AI response to chat
-            addMessageToChat(response.response, false);
-            
-            // Speak response for senior persona
-            if (currentPersona === 'senior') {
-                IntelliMed.voice.speak(response.response, { rate: 0.8 });
-            }
-        } else {
-            throw new Error(response.error || 'Failed to get response');
+        // Stream the response when the browser supports it, otherwise wait for the full reply
+        const aiResponse = supportsStreaming()
+            ? await streamChatResponse(message)
+            : await fetchChatResponse(message);
+
+        // Speak response for senior persona
+        if (currentPersona === 'senior') {
+            IntelliMed.voice.speak(aiResponse, { rate: 0.8 });
         }
     } catch (error) {
         console.error('Chat error:', error);
@@ -167,7 +199,101 @@ async function sendMessage() {
     }
 }
 
-// Add message to chat
+// Check for fetch body streaming support
+function supportsStreaming() {
+    return typeof ReadableStream !== 'undefined' && typeof TextDecoder !== 'undefined';
+}
+
+// Request a complete (non-streaming) AI response
+async function fetchChatResponse(message) {
+    const response = await IntelliMed.api.post('/api/chat', {
+        message: message,
+        persona: currentPersona
+    });
+
+    if (!response.success) {
+        throw new Error(response.error || 'Failed to get response');
+    }
+
+    hideTypingIndicator();
+    addMessageToChat(response.response, false);
+    return response.response;
+}
+
+// Parse one Server-Sent Event block into { event, data }
+function parseServerSentEvent(block) {
+    let event = 'message';
+    const dataLines = [];
+    block.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    });
+    return { event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : null };
+}
+
+// Stream the AI response over SSE, rendering tokens as they arrive
+async function streamChatResponse(message) {
+    const response = await fetch('/api/chat/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream'
+        },
+        body: JSON.stringify({
+            message: message,
+            persona: currentPersona
+        })
+    });
+
+    if (!response.ok || !response.body) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+    let contentElement = null;
+
+    const render = () => {
+        if (!contentElement) {
+            hideTypingIndicator();
+            contentElement = addMessageToChat('', false);
+        }
+        contentElement.innerHTML = formatBotMessage(text);
+        scrollToBottom();
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const { event, data } = parseServerSentEvent(buffer.slice(0, boundary));
+            buffer = buffer.slice(boundary + 2);
+
+            if (event === 'token') {
+                text += data.text;
+                render();
+            } else if (event === 'done') {
+                text = data.response;
+                render();
+            }
+        }
+    }
+
+    if (!contentElement) {
+        throw new Error('Empty response stream');
+    }
+    return text;
+}
+
+// Add message to chat, returns the message content element
 function addMessageToChat(message, isUser) {
     const messagesContainer = document.getElementById('chat-messages');
     if (!messagesContainer) return;
@@ -194,6 +320,7 @@ function addMessageToChat(message, isUser) {
 
     messagesContainer.appendChild(messageDiv);
     scrollToBottom();
+    return messageDiv.querySelector('.message-content');
 }
 
 // Get persona icon
@@ -208,7 +208,7 @@ async function analyzeSymptoms() {
     loadingModal.show();
 
     try {
-        const response = await IntelliMed.api.post('/api/predict-disease', symptomsData);
+        const response = await IntelliMed.api.postJob('/api/predict-disease', symptomsData);
         
         if (response.success) {
             currentAnalysis = response;
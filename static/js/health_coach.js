@@ -356,7 +356,7 @@ async function generateAISuggestions() {
             preferences: []
         };
         
-        const response = await IntelliMed.api.post('/api/generate-health-goals', userProfile);
+        const response = await IntelliMed.api.postJob('/api/generate-health-goals', userProfile);
         
         if (response.success && response.suggestions.length > 0) {
             displayAISuggestions(response.suggestions);
@@ -449,6 +449,28 @@ const api = {
         });
     },
 
+    // POST to an endpoint that may answer with a queued job (202 + job_id);
+    // long-polls /api/jobs/<id> and resolves with the job result
+    postJob: async function(url, data, maxWaitMs = 300000) {
+        const response = await this.post(url, data);
+        if (!response.job_id) {
+            return response;
+        }
+
+        const deadline = Date.now() + maxWaitMs;
+        while (Date.now() < deadline) {
+            const status = await this.get(`/api/jobs/${response.job_id}?wait=25`);
+            const job = status.job;
+            if (job.status === 'succeeded') {
+                return { success: true, ...job.result };
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error || 'Job failed');
+            }
+        }
+        throw new Error('Timed out waiting for job');
+    },
+
     // PUT request
     put: function(url, data) {
         return this.request(url, {
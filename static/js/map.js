@@ -6,6 +6,14 @@ let markers = [];
 let userMarker = null;
 let facilitiesData = [];
 
+// Searches at or above this radius show server-side clusters on the map and
+// list only the nearest CLUSTER_LIST_LIMIT facilities
+const CLUSTER_RADIUS_KM = 20;
+const CLUSTER_LIST_LIMIT = 50;
+let clusterMode = false;
+let clusterRequest = 0;
+let clusterTimer = null;
+
 // Initialize the map with Leaflet and OpenStreetMap
 function initMap() {
     console.log('Medical Facility Finder loaded');
@@ -19,6 +27,13 @@ function initMap() {
         maxZoom: 18,
     }).addTo(map);
     
+    // Reload clusters for the new viewport once panning/zooming settles
+    map.on('moveend', function() {
+        if (!clusterMode) return;
+        clearTimeout(clusterTimer);
+        clusterTimer = setTimeout(loadClusters, 250);
+    });
+    
     // Setup event listeners
     setupEventListeners();
     
@@ -322,6 +337,7 @@ async function searchNearbyFacilities() {
     }
     
     // Clear existing facility markers
+    clusterMode = false;
     clearFacilityMarkers();
     
     // Add user location marker back
@@ -330,14 +346,25 @@ async function searchNearbyFacilities() {
     }
     
     try {
-        // Fetch nearby facilities from API
+        // Fetch nearby facilities from API. Coordinates are rounded to ~10 m so
+        // repeat searches from the same spot reuse the browser's cached response.
+        const lat = Number(userLocation.lat).toFixed(4);
+        const lng = Number(userLocation.lng).toFixed(4);
+        const wideView = Number(radius) >= CLUSTER_RADIUS_KM;
+        const limit = wideView ? `&k=${CLUSTER_LIST_LIMIT}` : '';
         const response = await IntelliMed.api.get(
-            `/api/nearby-facilities?lat=${userLocation.lat}&lng=${userLocation.lng}&radius=${radius}&type=${facilityType}`
+            `/api/nearby-facilities?lat=${lat}&lng=${lng}&radius=${radius}&type=${facilityType}${limit}`
         );
         
         if (response.success) {
             facilitiesData = response.facilities;
-            displayFacilities(facilitiesData);
+            if (wideView) {
+                // Too many facilities to draw one by one: cluster the whole area on the map
+                displayFacilitiesList(facilitiesData);
+                enterClusterMode(Number(radius));
+            } else {
+                displayFacilities(facilitiesData);
+            }
             updateFacilityCount(facilitiesData.length);
             
             if (facilitiesData.length === 0) {
@@ -386,6 +413,81 @@ function displayFacilities(facilities) {
     }
 }
 
+// Show clusters for the search area and follow the viewport from then on
+function enterClusterMode(radius) {
+    clusterMode = true;
+    const bounds = L.latLng(userLocation.lat, userLocation.lng).toBounds(radius * 2000);
+    // fitBounds fires moveend, which loads the clusters; load directly if the view doesn't change
+    const center = map.getCenter();
+    const zoom = map.getZoom();
+    map.fitBounds(bounds);
+    if (map.getZoom() === zoom && map.getCenter().equals(center)) {
+        loadClusters();
+    }
+}
+
+// Fetch clusters (or, zoomed in far enough, individual facilities) for the current viewport
+async function loadClusters() {
+    const requestId = ++clusterRequest;
+    const bounds = map.getBounds();
+    // Rounded so small pans reuse the browser's cached response
+    const bbox = [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()]
+        .map(value => value.toFixed(3)).join(',');
+    const facilityType = document.getElementById('facility-type-select')?.value || 'all';
+    
+    try {
+        const response = await IntelliMed.api.get(
+            `/api/facility-clusters?bbox=${bbox}&zoom=${map.getZoom()}&type=${facilityType}`
+        );
+        // Ignore responses overtaken by a newer viewport or a new search
+        if (requestId !== clusterRequest || !clusterMode) return;
+        
+        clearFacilityMarkers();
+        if (response.mode === 'facilities') {
+            response.facilities.forEach(facility => addFacilityMarker(facility));
+        } else {
+            response.clusters.forEach(cluster => addClusterMarker(cluster));
+        }
+    } catch (error) {
+        // Clustering unavailable: fall back to markers for the listed facilities
+        console.error('Facility cluster error:', error);
+        if (requestId !== clusterRequest || !clusterMode) return;
+        clusterMode = false;
+        displayFacilities(facilitiesData);
+    }
+}
+
+// Add cluster marker to map, coloured by its most common facility type
+function addClusterMarker(cluster) {
+    const types = Object.entries(cluster.types).sort((a, b) => b[1] - a[1]);
+    const color = getFacilityColor(types.length ? types[0][0] : null);
+    const size = Math.round(30 + 8 * Math.log10(cluster.count));
+    
+    const marker = L.marker([cluster.lat, cluster.lng], {
+        icon: L.divIcon({
+            html: `<div style="background-color: ${color}; width: ${size}px; height: ${size}px; border-radius: 50%; border: 3px solid white; box-shadow: 0 2px 4px rgba(0,0,0,0.3); display: flex; align-items: center; justify-content: center; color: white; font-size: 13px; font-weight: 600;">
+                ${cluster.count}
+            </div>`,
+            iconSize: [size, size],
+            iconAnchor: [size / 2, size / 2],
+            className: 'facility-cluster-marker'
+        })
+    }).addTo(map);
+    
+    const breakdown = types
+        .map(([type, count]) => `${count} ${type.replace('_', ' ')}`)
+        .join('<br>');
+    marker.bindTooltip(`${breakdown}${cluster.emergency ? `<br>${cluster.emergency} with emergency services` : ''}`);
+    
+    // Zoom in to split the cluster
+    marker.on('click', function() {
+        map.setView([cluster.lat, cluster.lng], Math.min(map.getZoom() + 2, map.getMaxZoom()));
+    });
+    
+    markers.push(marker);
+    return marker;
+}
+
 // Add facility marker to map
 function addFacilityMarker(facility) {
     const color = getFacilityColor(facility.type);
@@ -449,7 +551,7 @@ function createFacilityPopup(facility) {
             <p class="mb-1 small text-muted">${facility.address}</p>
             <p class="mb-2 small">${services}</p>
             <div class="d-flex justify-content-between align-items-center">
-                <span class="badge bg-primary">${facility.distance}km away</span>
+                ${facility.distance != null ? `<span class="badge bg-primary">${facility.distance}km away</span>` : '<span></span>'}
                 ${facility.phone ? `<a href="tel:${facility.phone}" class="btn btn-sm btn-outline-primary">Call</a>` : ''}
             </div>
             ${facility.emergency_services ? '<div class="mt-2"><span class="badge bg-danger">Emergency Services</span></div>' : ''}
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""Symptom analytics: normalized facts and incrementally maintained rollups.
+
+Every saved DiseasePrediction is broken into SymptomFact rows, one per
+canonical symptom (symptom_cache.normalize_symptoms). Its counts are then
+added to SymptomRollup, in the same transaction, at two granularities:
+hourly buckets and daily buckets (UTC). Each rollup row is keyed by
+(granularity, bucket, symptom, urgency, age band) and is bumped with one
+upsert. The symptom '*' row counts predictions rather than symptom mentions,
+so urgency and age questions are not skewed by how many symptoms each
+prediction listed. Fallback answers saved while the model was unreachable
+(analysis_source 'fallback') are not counted, so outages do not show up as
+a surge of medium-urgency predictions.
+
+/api/analytics/symptoms reads only rollup rows. The cost of a query depends
+on the window and the number of distinct symptoms, not on how many
+predictions have been stored. Rows saved before this existed are folded in
+by the backfill command, which is safe to run next to live traffic:
+
+    python symptom_analytics.py backfill            # rows not yet counted
+    python symptom_analytics.py backfill --rebuild  # recount everything
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, func, insert, text
+from extensions import db
+from models import DiseasePrediction, SymptomFact, SymptomRollup
+from symptom_cache import normalize_symptoms
+
+ALL_SYMPTOMS = '*'
+UNKNOWN = 'unknown'
+FALLBACK = 'fallback'
+URGENCY_LEVELS = ('low', 'medium', 'high', 'emergency')
+# Windows up to this many hours are answered from hourly buckets
+MAX_HOURLY_WINDOW = 72
+MAX_DAYS = 366
+BACKFILL_BATCH = 500
+
+_BUMP = text(
+    "INSERT INTO symptom_rollup (granularity, bucket_start, symptom, urgency_level, age_band, count) "
+    "VALUES (:granularity, :bucket_start, :symptom, :urgency_level, :age_band, :count) "
+    "ON CONFLICT (granularity, bucket_start, symptom, urgency_level, age_band) "
+    "DO UPDATE SET count = symptom_rollup.count + excluded.count"
+).bindparams(bindparam('bucket_start', type_=db.DateTime))
+
+
+def bucket_start(moment, granularity):
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _urgency(level):
+    level = (level or '').strip().lower()
+    return level if level in URGENCY_LEVELS else UNKNOWN
+
+
+def _symptoms_of(prediction):
+    try:
+        symptoms = json.loads(prediction.symptoms) if prediction.symptoms else []
+    except ValueError:
+        symptoms = []
+    return [symptom[:120] for symptom in normalize_symptoms(symptoms if isinstance(symptoms, list) else [])]
+
+
+def record_predictions(predictions):
+    """Write facts and bump rollups for flushed DiseasePrediction rows; the caller commits"""
+    facts, bumps = [], {}
+    for prediction in predictions:
+        prediction.analytics_recorded = True
+        if prediction.analysis_source == FALLBACK:
+            continue
+        created_at = prediction.created_at or datetime.utcnow()
+        urgency = _urgency(prediction.urgency_level)
+        band = prediction.age_band or UNKNOWN
+        symptoms = _symptoms_of(prediction)
+        facts.extend({'prediction_id': prediction.id, 'symptom': symptom, 'urgency_level': urgency,
+                      'age_band': band, 'created_at': created_at} for symptom in symptoms)
+        for granularity in ('hour', 'day'):
+            start = bucket_start(created_at, granularity)
+            for symptom in [ALL_SYMPTOMS] + symptoms:
+                key = (granularity, start, symptom, urgency, band)
+                bumps[key] = bumps.get(key, 0) + 1
+
+    if facts:
+        db.session.execute(insert(SymptomFact), facts)
+    if bumps:
+        # Sorted so concurrent writers take row locks in the same order
+        db.session.execute(_BUMP, [
+            {'granularity': granularity, 'bucket_start': start, 'symptom': symptom,
+             'urgency_level': urgency, 'age_band': band, 'count': count}
+            for (granularity, start, symptom, urgency, band), count in sorted(bumps.items())
+        ])
+
+
+def backfill(rebuild=False, batch_size=BACKFILL_BATCH):
+    """Count every prediction not yet in the rollups, in batches; returns rows processed"""
+    if rebuild:
+        db.session.query(SymptomRollup).delete()
+        db.session.query(SymptomFact).delete()
+        db.session.query(DiseasePrediction).update({'analytics_recorded': False})
+        db.session.commit()
+    processed = 0
+    last_id = 0
+    while True:
+        # with_for_update is a no-op on SQLite; on PostgreSQL it keeps two backfills from double counting
+        batch = DiseasePrediction.query.filter(
+            DiseasePrediction.id > last_id,
+            db.or_(DiseasePrediction.analytics_recorded.is_(False), DiseasePrediction.analytics_recorded.is_(None))
+        ).order_by(DiseasePrediction.id).limit(batch_size).with_for_update(skip_locked=True).all()
+        if not batch:
+            break
+        record_predictions(batch)
+        db.session.commit()
+        processed += len(batch)
+        last_id = batch[-1].id
+    return processed
+
+
+def _window(hours=None, days=None, now=None):
+    """(granularity, first bucket, end) for the last ``hours`` or ``days``, including the current bucket"""
+    now = now or datetime.utcnow()
+    if hours and hours <= MAX_HOURLY_WINDOW:
+        granularity, step, count = 'hour', timedelta(hours=1), hours
+    else:
+        granularity, step = 'day', timedelta(days=1)
+        count = min(max(days or -(-(hours or 0) // 24) or 7, 1), MAX_DAYS)
+    current = bucket_start(now, granularity)
+    return granularity, current - step * (count - 1), current + step
+
+
+def symptom_summary(hours=None, days=None, age_band=None, urgency=None, limit=10, now=None):
+    """Top symptoms, urgency mix by age band and per-bucket totals, from SymptomRollup only"""
+    granularity, start, end = _window(hours, days, now)
+    in_window = [
+        SymptomRollup.granularity == granularity,
+        SymptomRollup.bucket_start >= start,
+        SymptomRollup.bucket_start < end,
+    ]
+    if age_band:
+        in_window.append(SymptomRollup.age_band == age_band)
+    if urgency:
+        in_window.append(SymptomRollup.urgency_level == urgency)
+    total = func.sum(SymptomRollup.count)
+
+    top = db.session.query(SymptomRollup.symptom, total).filter(
+        *in_window, SymptomRollup.symptom != ALL_SYMPTOMS
+    ).group_by(SymptomRollup.symptom).order_by(total.desc(), SymptomRollup.symptom).limit(limit).all()
+
+    predictions = [*in_window, SymptomRollup.symptom == ALL_SYMPTOMS]
+    by_band = {}
+    for band, level, count in db.session.query(
+        SymptomRollup.age_band, SymptomRollup.urgency_level, total
+    ).filter(*predictions).group_by(SymptomRollup.age_band, SymptomRollup.urgency_level):
+        by_band.setdefault(band, {})[level] = int(count)
+    urgency_totals = {}
+    for levels in by_band.values():
+        for level, count in levels.items():
+            urgency_totals[level] = urgency_totals.get(level, 0) + count
+
+    series = db.session.query(SymptomRollup.bucket_start, total).filter(*predictions).group_by(
+        SymptomRollup.bucket_start).order_by(SymptomRollup.bucket_start).all()
+
+    return {
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'total_predictions': sum(urgency_totals.values()),
+        'top_symptoms': [{'symptom': symptom, 'count': int(count)} for symptom, count in top],
+        'urgency': urgency_totals,
+        'urgency_by_age_band': by_band,
+        'series': [{'bucket': bucket.isoformat(), 'predictions': int(count)} for bucket, count in series],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('backfill', help='count predictions saved before the rollups existed')
+    run.add_argument('--rebuild', action='store_true', help='clear facts and rollups and recount every row')
+    run.add_argument('--batch', type=int, default=BACKFILL_BATCH)
+    summary = commands.add_parser('summary', help='print the analytics summary')
+    summary.add_argument('--days', type=int, default=7)
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    logging.getLogger().setLevel(logging.INFO)
+
+    with app.app_context():
+        if args.command == 'backfill':
+            started = time.perf_counter()
+            processed = backfill(args.rebuild, args.batch)
+            logging.info(f"Counted {processed} predictions in {time.perf_counter() - started:.1f}s")
+        else:
+            print(json.dumps(symptom_summary(days=args.days), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
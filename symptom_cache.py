@@ -0,0 +1,228 @@
+"""Persistent response cache for gemini.analyze_symptoms.
+
+Requests are keyed on a normalized form of the symptom list (lowercased,
+synonyms mapped, deduplicated and sorted) plus an age band, so "Fever, cough"
+from a 34-year-old and "cough, high temperature" from a 38-year-old share an
+entry. Entries live in a small local SQLite file with a TTL and LRU eviction,
+which every worker on the host shares.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Spelling and phrasing variants only. Clinically distinct complaints
+# (migraine, dry cough, runny nose, lethargy, lightheadedness) keep their own
+# names, since one cached analysis is served for everything that maps together.
+SYMPTOM_SYNONYMS = {
+    'high temperature': 'fever',
+    'temperature': 'fever',
+    'pyrexia': 'fever',
+    'feverish': 'fever',
+    'coughing': 'cough',
+    'head ache': 'headache',
+    'head pain': 'headache',
+    'tired': 'fatigue',
+    'tiredness': 'fatigue',
+    'exhaustion': 'fatigue',
+    'throwing up': 'vomiting',
+    'vomit': 'vomiting',
+    'being sick': 'vomiting',
+    'nauseous': 'nausea',
+    'feeling sick': 'nausea',
+    'stuffy nose': 'nasal congestion',
+    'blocked nose': 'nasal congestion',
+    'throat pain': 'sore throat',
+    'breathlessness': 'shortness of breath',
+    'difficulty breathing': 'shortness of breath',
+    'trouble breathing': 'shortness of breath',
+    'short of breath': 'shortness of breath',
+    'sob': 'shortness of breath',
+    'tummy ache': 'abdominal pain',
+    'stomach ache': 'abdominal pain',
+    'stomach pain': 'abdominal pain',
+    'belly pain': 'abdominal pain',
+    'loose stools': 'diarrhea',
+    'diarrhoea': 'diarrhea',
+    'dizzy': 'dizziness',
+    'shivering': 'chills',
+    'body aches': 'muscle aches',
+    'body ache': 'muscle aches',
+    'myalgia': 'muscle aches',
+    'rash': 'skin rash',
+}
+
+# Part of every cache key; bump it when normalization changes, so entries made
+# under the old mapping are not served
+KEY_VERSION = 2
+
+AGE_BANDS = [
+    (2, '0-1'),
+    (13, '2-12'),
+    (18, '13-17'),
+    (40, '18-39'),
+    (65, '40-64'),
+]
+
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_symptom(symptom):
+    """Lowercase, strip punctuation and map a symptom to its canonical name"""
+    text = _SPACES.sub(' ', _NON_WORD.sub(' ', str(symptom).lower())).strip()
+    return SYMPTOM_SYNONYMS.get(text, text)
+
+
+def normalize_symptoms(symptoms):
+    """Return the sorted, deduplicated canonical symptom list"""
+    return sorted({name for name in (normalize_symptom(s) for s in symptoms or []) if name})
+
+
+def age_band(user_age):
+    """Bucket an age into a coarse band; unknown ages share one band"""
+    try:
+        age = int(float(user_age))
+    except (TypeError, ValueError):
+        return 'unknown'
+    for upper, label in AGE_BANDS:
+        if age < upper:
+            return label
+    return '65+'
+
+
+def cache_key(symptoms, user_age=None):
+    """Stable key for a symptom list and age"""
+    basis = json.dumps([KEY_VERSION, normalize_symptoms(symptoms), age_band(user_age)])
+    return hashlib.sha256(basis.encode('utf-8')).hexdigest()
+
+
+class SymptomCache:
+    """SQLite-backed TTL/LRU cache of analysis payloads with hit/miss counters"""
+
+    def __init__(self, path, ttl_seconds=86400, max_entries=5000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.saved_model_ms = 0.0
+
+    @property
+    def enabled(self):
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS symptom_cache ("
+                " key TEXT PRIMARY KEY,"
+                " symptoms TEXT NOT NULL,"
+                " age_band TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " model_ms REAL NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " hit_count INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_symptom_cache_last_used ON symptom_cache (last_used)")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def get(self, symptoms, user_age=None):
+        """Return the cached payload dict, or None on a miss or expiry"""
+        if not self.enabled:
+            return None
+        key = cache_key(symptoms, user_age)
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT payload, model_ms, created_at FROM symptom_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[2] > self.ttl_seconds:
+                if row is not None:
+                    conn.execute("DELETE FROM symptom_cache WHERE key = ?", (key,))
+                self._count(misses=1)
+                return None
+            conn.execute(
+                "UPDATE symptom_cache SET last_used = ?, hit_count = hit_count + 1 WHERE key = ?",
+                (now, key)
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"Symptom cache read failed: {e}")
+            self._count(misses=1)
+            return None
+        self._count(hits=1, saved_model_ms=row[1])
+        return json.loads(row[0])
+
+    def put(self, symptoms, user_age, payload, model_ms=0.0):
+        """Store a payload dict and evict least recently used entries over the limit"""
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO symptom_cache "
+                "(key, symptoms, age_band, payload, model_ms, created_at, last_used, hit_count) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (cache_key(symptoms, user_age), json.dumps(normalize_symptoms(symptoms)),
+                 age_band(user_age), json.dumps(payload), model_ms, now, now)
+            )
+            evicted = conn.execute(
+                "DELETE FROM symptom_cache WHERE key IN ("
+                " SELECT key FROM symptom_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+        except sqlite3.Error as e:
+            logging.warning(f"Symptom cache write failed: {e}")
+            return
+        self._count(stores=1, evictions=max(evicted, 0))
+
+    def purge_expired(self):
+        """Delete expired entries, returns the number removed"""
+        conn = self._connect()
+        return conn.execute(
+            "DELETE FROM symptom_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+        ).rowcount
+
+    def stats(self):
+        """Counters for this process plus the current entry count"""
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'saved_model_seconds': round(self.saved_model_ms / 1000, 3),
+                'ttl_seconds': self.ttl_seconds,
+                'max_entries': self.max_entries,
+            }
+        try:
+            stats['entries'] = self._connect().execute("SELECT COUNT(*) FROM symptom_cache").fetchone()[0]
+        except sqlite3.Error:
+            stats['entries'] = None
+        return stats
@@ -0,0 +1,105 @@
+"""Local pre-triage and model routing for symptom analyses.
+
+Before analyze_symptoms calls a model, each submission is checked against
+EMERGENCY_RULES. This is a small table of red-flag symptom combinations,
+matched from word starts in the normalized symptom text
+(symptom_cache.normalize_symptom), so free-text complaints like "crushing
+chest pain" match too. A match is answered locally with emergency urgency,
+in microseconds, and no model call is made. Any other submission is routed
+by complexity:
+
+    flash  at most TRIAGE_FLASH_MAX_SYMPTOMS distinct symptoms and an age band
+           outside HIGH_RISK_AGE_BANDS
+    pro    everything else
+
+gemini.py records every decision in the symptom_triage_total and
+symptom_analysis_duration_seconds metrics. Token use per model is in
+gemini_tokens_total. Callers triage once and pass the decision on;
+DiseasePrediction keeps its tier in triage_tier next to analysis_source
+(rule, cache, model or fallback), so per-tier latency and cost can also be
+read from the database. SYMPTOM_TRIAGE=0 turns the stage off, so every submission
+goes to pro as before.
+"""
+import os
+from typing import NamedTuple
+from symptom_cache import age_band, normalize_symptom, normalize_symptoms
+
+FLASH_MODEL = "gemini-2.5-flash"
+PRO_MODEL = "gemini-2.5-pro"
+TRIAGE_ENABLED = os.environ.get("SYMPTOM_TRIAGE", "1") == "1"
+TRIAGE_FLASH_MAX_SYMPTOMS = int(os.environ.get("TRIAGE_FLASH_MAX_SYMPTOMS", 2))
+HIGH_RISK_AGE_BANDS = {'0-1', '65+'}
+
+# (rule name, description, terms). A rule fires when every term is found in
+# the submission; a term is a tuple of alternative phrases.
+EMERGENCY_RULES = [
+    ('cardiac', 'chest pain with shortness of breath',
+     (('chest pain', 'chest pressure', 'chest tightness'), ('shortness of breath', 'cant breathe', 'cannot breathe'))),
+    ('cardiac_radiating', 'chest pain spreading to the arm, jaw or back',
+     (('chest pain', 'chest pressure'), ('arm', 'jaw', 'back', 'shoulder'))),
+    ('cardiac_sweating', 'chest pain with sweating or fainting',
+     (('chest pain', 'chest pressure'), ('sweating', 'cold sweat', 'fainting', 'fainted', 'nausea'))),
+    ('stroke', 'signs of a stroke',
+     (('slurred speech', 'face drooping', 'facial droop', 'one sided weakness', 'sudden numbness',
+       'cannot speak', 'cant speak', 'sudden confusion'),)),
+    ('breathing', 'severe difficulty breathing',
+     (('cant breathe', 'cannot breathe', 'choking', 'gasping', 'blue lips', 'turning blue'),)),
+    ('anaphylaxis', 'throat or face swelling with breathing trouble',
+     (('swollen throat', 'throat swelling', 'tongue swelling', 'swollen tongue', 'face swelling', 'swollen face'),
+      ('shortness of breath', 'wheezing', 'hives', 'cant breathe', 'cannot breathe'))),
+    ('unresponsive', 'loss of consciousness or seizure',
+     (('unconscious', 'unresponsive', 'passed out', 'seizure', 'convulsion'),)),
+    ('bleeding', 'severe bleeding',
+     (('severe bleeding', 'heavy bleeding', 'uncontrolled bleeding', 'vomiting blood', 'coughing blood',
+       'coughing up blood', 'blood in vomit'),)),
+    ('meningitis', 'fever with a stiff neck or a rash that does not fade',
+     (('fever', 'temperature'), ('stiff neck', 'neck stiffness', 'non blanching rash', 'purple rash'))),
+    ('thunderclap', 'sudden severe headache',
+     (('worst headache', 'thunderclap headache', 'sudden severe headache'),)),
+    ('self_harm', 'thoughts of self-harm',
+     (('suicidal', 'suicide', 'self harm', 'kill myself', 'overdose'),)),
+]
+
+
+class TriageDecision(NamedTuple):
+    tier: str  # emergency, flash or pro
+    model: str  # None when answered locally
+    reason: str  # rule name for emergencies, otherwise why the model was chosen
+    description: str = None
+
+
+def _submission_text(symptoms):
+    """Normalized symptoms joined with spaces around each, so phrases match from a word start"""
+    normalized = [normalize_symptom(str(symptom).replace("'", '').replace('\u2019', '')) for symptom in symptoms or []]
+    return ' ' + ' | '.join(normalized) + ' '
+
+
+def triage(symptoms, user_age=None):
+    """Decide how a submission is answered; pure and cheap, no I/O"""
+    if not TRIAGE_ENABLED:
+        return TriageDecision('pro', PRO_MODEL, 'triage_disabled')
+    text = _submission_text(symptoms)
+    for name, description, terms in EMERGENCY_RULES:
+        if all(any(f" {phrase}" in text for phrase in term) for term in terms):
+            return TriageDecision('emergency', None, name, description)
+
+    if age_band(user_age) in HIGH_RISK_AGE_BANDS:
+        return TriageDecision('pro', PRO_MODEL, 'high_risk_age')
+    if len(normalize_symptoms(symptoms)) > TRIAGE_FLASH_MAX_SYMPTOMS:
+        return TriageDecision('pro', PRO_MODEL, 'complex')
+    return TriageDecision('flash', FLASH_MODEL, 'simple')
+
+
+def emergency_analysis(decision):
+    """The SymptomAnalysis fields returned for a rule match, without a model call"""
+    return {
+        'prediction': (f"Your symptoms may indicate a medical emergency ({decision.description}). "
+                       "This needs immediate in-person assessment, not an online check."),
+        'confidence': 0.9,
+        'recommendations': [
+            "Call emergency services (108) or go to the nearest emergency department now",
+            "Do not drive yourself; ask someone to take you or wait for an ambulance",
+            "Stay with someone until help arrives",
+        ],
+        'urgency_level': 'emergency',
+    }